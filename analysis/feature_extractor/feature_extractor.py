@@ -1,5 +1,13 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
 class FeatureExtractor():
 
+    # to be bumped whenever the computation of the features changes
+    EXTRACTOR_VERSION = 1
+
     def get_features_list(self, text):
         fdict = self.get_features(text)
         return [
@@ -9,3 +17,128 @@ class FeatureExtractor():
 
     def get_feature_names(self):
         return self.FEATURE_ORDERED_LIST
+
+    def normalize_text(self, text):
+        '''
+        Canonical form of a text: texts with the same canonical form must
+        have the same features. Subclasses override this with whatever
+        their features do not depend on (e.g. case). By default, the text itself.
+        '''
+        return text
+
+    def get_extractor_version(self):
+        '''
+        Identifies the features this extractor computes: it changes with the
+        code (EXTRACTOR_VERSION) and, in subclasses, with the artifacts used.
+        Stored features computed with another version are outdated.
+        '''
+        return f'{type(self).__name__}-{self.EXTRACTOR_VERSION}'
+
+
+class MemoizedFeatureExtractor(FeatureExtractor):
+    '''
+    Wraps a (deterministic) feature extractor, remembering the features of
+    the most recently seen texts (LRU, at most max_size entries), keyed by
+    their canonical form (see `normalize_text`): the same message sent to
+    many recipients, or re-sent with small variations the features do not
+    depend on, is processed only once.
+
+    Access is guarded by a lock, since extraction may run in several
+    threads at once. Feature lists are returned as copies.
+    '''
+
+    def __init__(self, feature_extractor, max_size=10000):
+        self.feature_extractor = feature_extractor
+        self.FEATURE_ORDERED_LIST = feature_extractor.FEATURE_ORDERED_LIST
+        self.max_size = max_size
+        self._entries = OrderedDict()  # canonical text -> feature list
+        self._lock = threading.Lock()
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def normalize_text(self, text):
+        return self.feature_extractor.normalize_text(text)
+
+    def get_extractor_version(self):
+        return self.feature_extractor.get_extractor_version()
+
+    def _lookup(self, key):
+        with self._lock:
+            features = self._entries.get(key)
+            if features is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return features
+
+    def _store(self, key, features):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = features
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_features(self, text):
+        return dict(zip(self.FEATURE_ORDERED_LIST, self.get_features_list(text)))
+
+    def get_features_list(self, text):
+        key = self.normalize_text(text)
+        features = self._lookup(key)
+        if features is None:
+            features = self.feature_extractor.get_features_list(text)
+            self._store(key, features)
+        return list(features)
+
+    def get_features_batch(self, texts):
+        '''
+        Features for a list of texts, as a (len(texts), num_features) matrix.
+        Texts not remembered are computed in a single call to the wrapped
+        extractor's `get_features_batch`, if it has one.
+        '''
+        keys = [self.normalize_text(text) for text in texts]
+        rows = [self._lookup(key) for key in keys]
+        # one computation per distinct canonical text
+        miss_indices = {}
+        for idx, (key, row) in enumerate(zip(keys, rows)):
+            if row is None:
+                miss_indices.setdefault(key, idx)
+        if miss_indices:
+            miss_texts = [texts[idx] for idx in miss_indices.values()]
+            if hasattr(self.feature_extractor, 'get_features_batch'):
+                computed = self.feature_extractor.get_features_batch(miss_texts).tolist()
+            else:
+                computed = [self.feature_extractor.get_features_list(text) for text in miss_texts]
+            computed_by_key = dict(zip(miss_indices.keys(), computed))
+            for key, features in computed_by_key.items():
+                self._store(key, features)
+            # repeated texts within the batch were computed once: not misses
+            repeated = sum(1 for row in rows if row is None) - len(miss_indices)
+            with self._lock:
+                self.misses -= repeated
+                self.hits += repeated
+            rows = [
+                row if row is not None else computed_by_key[key]
+                for key, row in zip(keys, rows)
+            ]
+        return np.array(rows).reshape(len(texts), len(self.FEATURE_ORDERED_LIST))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+        }
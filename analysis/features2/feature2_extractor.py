@@ -1,40 +1,80 @@
 import json
 import os
-from tensorflow.keras.preprocessing.sequence import pad_sequences
-from tensorflow.keras.preprocessing.text import tokenizer_from_json
+from functools import lru_cache
 
 from analysis.feature_extractor.feature_extractor import FeatureExtractor
+from analysis.features2.sequence_tokenizer import SequenceTokenizer
 
 base_dir = os.path.abspath(os.path.dirname(__file__))
 
 input_dir = os.path.join(base_dir, '..', '..',  'models', 'model2_2020', 'tokenizer')
 input_metadata_file = os.path.join(input_dir, 'settings.json')
 input_tokenizer_file = os.path.join(input_dir, 'tokenizer.json')
+input_vocabulary_file = os.path.join(input_dir, 'vocabulary.json')
+
+
+def load_sequence_tokenizer(tokenizer_dir=input_dir):
+    """
+    The compact vocabulary file is used if present (see
+    `scripts/convert_tokenizer_2.py`), otherwise the tokenizer
+    is compiled from the full Keras `tokenizer.json`.
+    """
+    vocabulary_file = os.path.join(tokenizer_dir, 'vocabulary.json')
+    if os.path.isfile(vocabulary_file):
+        return SequenceTokenizer.from_vocabulary_file(vocabulary_file)
+    tokenizer_metadata = json.load(open(os.path.join(tokenizer_dir, 'settings.json')))
+    return SequenceTokenizer.from_keras_json(
+        open(os.path.join(tokenizer_dir, 'tokenizer.json')).read(),
+        max_seq_length=tokenizer_metadata['MAX_SEQ_LENGTH'],
+    )
 
 
 class Feature2Extractor(FeatureExtractor):
 
     FEATURE_ORDERED_LIST = ...
 
-    def __init__(self):
-        self.tokenizer_metadata = json.load(open(input_metadata_file))
-        self.tokenizer = tokenizer_from_json(open(input_tokenizer_file).read())
+    def __init__(self, tokenizer_dir=input_dir):
+        self.tokenizer_dir = tokenizer_dir
+        self.tokenizer_metadata = json.load(open(os.path.join(tokenizer_dir, 'settings.json')))
+        self.tokenizer = load_sequence_tokenizer(tokenizer_dir)
         self.FEATURE_ORDERED_LIST = [
             f'f_{idx:02}'
             for idx in range(self.tokenizer_metadata['MAX_SEQ_LENGTH'])
         ]
 
     def get_features(self, text):
-        seqs = self.tokenizer.texts_to_sequences([text])
-        padded = pad_sequences(
-            seqs,
-            maxlen=self.tokenizer_metadata['MAX_SEQ_LENGTH'],
-        )[0]
+        padded = self.tokenizer.text_to_padded(text)
         return {
             f: val
             for f, val in zip(self.FEATURE_ORDERED_LIST, padded)
         }
 
+    def normalize_text(self, text):
+        '''
+        Features only depend on the words, as seen by the tokenizer
+        (lowercased, with the filter characters acting as separators).
+        '''
+        return self.tokenizer.split.join(self.tokenizer.text_to_words(text))
+
+    def get_extractor_version(self):
+        return f'{super().get_extractor_version()}-{self.tokenizer.get_fingerprint()}'
+
+    def get_features_batch(self, texts):
+        '''
+        Features for a list of texts, as a (len(texts), MAX_SEQ_LENGTH)
+        int32 matrix (columns in FEATURE_ORDERED_LIST order).
+        '''
+        return self.tokenizer.texts_to_padded(texts)
+
+
+@lru_cache()
+def get_feature2_extractor(tokenizer_dir=input_dir):
+    """
+    Extractors are stateless once built: all users of the same
+    tokenizer can share a single instance (built on first request).
+    """
+    return Feature2Extractor(os.path.abspath(tokenizer_dir))
+
 
 if __name__ == '__main__':
     import sys
@@ -48,3 +88,5 @@ if __name__ == '__main__':
     print(f2_extractor.get_feature_names())
     print('\nget_features_list:')
     print(f2_extractor.get_features_list(inp))
+    print('\nget_features_batch:')
+    print(f2_extractor.get_features_batch([inp]))
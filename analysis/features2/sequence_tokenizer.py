@@ -0,0 +1,138 @@
+"""
+A standalone (Tensorflow-free) replacement for the Keras text `Tokenizer`
+followed by `pad_sequences`, as used for the "v2" features.
+
+Only what `texts_to_sequences` actually uses is kept from the fitted Keras
+tokenizer: its filters/lowercasing/splitting rules and the word index
+trimmed to the first `num_words - 1` words (the others are dropped, or
+mapped to the OOV token if the tokenizer has one). This fits in a small
+"vocabulary" JSON file (see `scripts/convert_tokenizer_2.py`), which can
+also be compiled on the fly from the full Keras `tokenizer.json`.
+
+Sequences are padded/truncated as with the `pad_sequences` defaults,
+i.e. both 'pre': the last `max_seq_length` tokens are kept, left-padded
+with zeros.
+"""
+
+import json
+import hashlib
+import numpy as np
+
+VOCABULARY_FORMAT_VERSION = 1
+
+
+class SequenceTokenizer():
+
+    def __init__(self, word_index, max_seq_length, filters, lower=True, split=' ', oov_index=None):
+        # word_index: the trimmed {word: index}, all indices in [1, num_words)
+        self.word_index = word_index
+        self.max_seq_length = max_seq_length
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self.oov_index = oov_index
+        # filtered characters become separators
+        self._filter_table = str.maketrans({c: split for c in filters})
+
+    @classmethod
+    def from_keras_json(cls, tokenizer_json, max_seq_length):
+        """
+        Compile the tokenizer from the JSON of a fitted Keras `Tokenizer`
+        (as written by its `to_json`).
+        """
+        config = json.loads(tokenizer_json)['config']
+        if config.get('char_level'):
+            raise ValueError('Character-level tokenizers are not supported')
+        full_word_index = json.loads(config['word_index'])
+        num_words = config.get('num_words')
+        oov_token = config.get('oov_token')
+        oov_index = full_word_index.get(oov_token) if oov_token is not None else None
+        return cls(
+            word_index={
+                word: index
+                for word, index in full_word_index.items()
+                if not num_words or index < num_words
+            },
+            max_seq_length=max_seq_length,
+            filters=config['filters'],
+            lower=config['lower'],
+            split=config['split'],
+            oov_index=oov_index,
+        )
+
+    @classmethod
+    def from_vocabulary_file(cls, file_name):
+        with open(file_name) as vocabulary_file:
+            vocabulary = json.load(vocabulary_file)
+        if vocabulary.get('format_version') != VOCABULARY_FORMAT_VERSION:
+            raise ValueError(f'Unsupported vocabulary format in "{file_name}"')
+        return cls(
+            word_index=vocabulary['word_index'],
+            max_seq_length=vocabulary['max_seq_length'],
+            filters=vocabulary['filters'],
+            lower=vocabulary['lower'],
+            split=vocabulary['split'],
+            oov_index=vocabulary['oov_index'],
+        )
+
+    def _to_vocabulary(self):
+        return {
+            'format_version': VOCABULARY_FORMAT_VERSION,
+            'max_seq_length': self.max_seq_length,
+            'filters': self.filters,
+            'lower': self.lower,
+            'split': self.split,
+            'oov_index': self.oov_index,
+            'word_index': dict(sorted(self.word_index.items(), key=lambda wi: wi[1])),
+        }
+
+    def save_vocabulary(self, file_name):
+        with open(file_name, 'w') as vocabulary_file:
+            json.dump(self._to_vocabulary(), vocabulary_file, indent=2)
+
+    def get_fingerprint(self):
+        """
+        A short digest of everything the sequences depend on
+        (rules, vocabulary, sequence length).
+        """
+        vocabulary_json = json.dumps(self._to_vocabulary(), sort_keys=True)
+        return hashlib.blake2b(vocabulary_json.encode('utf-8'), digest_size=8).hexdigest()
+
+    def text_to_words(self, text):
+        """
+        The words of a text (lowercased, filtered and split), before lookup.
+        """
+        if self.lower:
+            text = text.lower()
+        return [
+            word
+            for word in text.translate(self._filter_table).split(self.split)
+            if word
+        ]
+
+    def text_to_sequence(self, text):
+        """
+        The (unpadded) list of token indices for a text.
+        """
+        word_index = self.word_index
+        oov_index = self.oov_index
+        sequence = []
+        for word in self.text_to_words(text):
+            index = word_index.get(word, oov_index)
+            if index is not None:
+                sequence.append(index)
+        return sequence
+
+    def texts_to_padded(self, texts):
+        """
+        A (len(texts), max_seq_length) int32 array, one padded sequence per text.
+        """
+        padded = np.zeros((len(texts), self.max_seq_length), dtype=np.int32)
+        for row, text in enumerate(texts):
+            sequence = self.text_to_sequence(text)[-self.max_seq_length:]
+            if sequence:
+                padded[row, self.max_seq_length - len(sequence):] = sequence
+        return padded
+
+    def text_to_padded(self, text):
+        return self.texts_to_padded([text])[0]
@@ -0,0 +1,60 @@
+"""
+Compact storage of fixed-length integer feature vectors (such as the "v2"
+token sequences) in Parquet: an Arrow fixed-size list of the narrowest
+integer type holding all values (e.g. uint8 for indices below 256), instead
+of a variable-length list of int64. There are no per-row offsets, and the
+values read back (through a memory map) form a single contiguous buffer,
+which `load_feature_matrix` exposes without copying as a NumPy
+(N, vector length) array.
+"""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def fixed_width_value_type(max_value):
+    """
+    The narrowest Arrow integer type for values in [0, max_value].
+    """
+    for value_type in (pa.uint8(), pa.int16(), pa.int32()):
+        if max_value <= np.iinfo(value_type.to_pandas_dtype()).max:
+            return value_type
+    return pa.int64()
+
+
+def to_fixed_size_list_array(feature_matrix, value_type):
+    """
+    A (N, width) integer matrix as a FixedSizeListArray of `value_type`.
+    """
+    num_rows, width = feature_matrix.shape
+    values = np.ascontiguousarray(feature_matrix, dtype=value_type.to_pandas_dtype()).reshape(num_rows * width)
+    return pa.FixedSizeListArray.from_arrays(pa.array(values, type=value_type), width)
+
+
+def load_feature_matrix(path, column='features'):
+    """
+    Read a Parquet file (or directory of files) with fixed-length feature
+    vectors into (sms_ids, (N, width) array). With the fixed-size list
+    layout the array is a view on the values as decoded by Arrow (gathered
+    into one buffer first if there are several row groups); the legacy
+    variable-length layout is accepted too (as long as all vectors have the
+    same length), at the cost of a copy.
+    """
+    table = pq.read_table(path, columns=['sms_id', column], memory_map=True)
+    sms_ids = table.column('sms_id').to_numpy()
+    chunks = table.column(column).chunks
+    if len(chunks) == 0:
+        return sms_ids, np.zeros((0, 0))
+    features = chunks[0] if len(chunks) == 1 else pa.concat_arrays(chunks)
+    if features.null_count > 0:
+        raise ValueError(f'Missing feature vectors in "{path}"')
+    if pa.types.is_fixed_size_list(features.type):
+        width = features.type.list_size
+    else:
+        lengths = np.diff(features.offsets.to_numpy())
+        if len(lengths) > 0 and (lengths != lengths[0]).any():
+            raise ValueError(f'Feature vectors of different lengths in "{path}"')
+        width = int(lengths[0]) if len(lengths) > 0 else 0
+    values = features.flatten().to_numpy(zero_copy_only=pa.types.is_fixed_size_list(features.type))
+    return sms_ids, values.reshape(len(features), width)
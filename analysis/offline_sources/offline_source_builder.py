@@ -0,0 +1,495 @@
+"""
+Streaming builder of the offline (Parquet) feature sources.
+
+The raw dataset is read in chunks and feature extraction for each chunk
+runs in a pool of worker processes (each building its own extractor
+once), while the parent writes the results, in input order, as one
+Parquet row group per chunk. Only a bounded number of chunks is in
+flight at any time, so memory does not grow with the dataset size.
+
+Each output is described by an `OfflineSource`: a function turning a
+chunk and its feature matrix (see `get_features_batch`) into the output
+columns, plus what these depend on (raw columns, and the extractor).
+The extractor class is built in the workers, hence it must be importable.
+
+In incremental mode, each output is a directory of Parquet files (same
+path; readers such as Feast's FileSource take a directory as well),
+rows being spread over a fixed number of partitions by a hash of their
+sms_id. A manifest next to it (`<output>.manifest.parquet`) records,
+for each sms_id, a hash of the raw columns the output depends on and
+the version of the extractor (see `get_extractor_version`) it was
+computed with. Only new or changed rows are computed, and only the
+partitions they (or removed rows) belong to are rewritten: a new
+extractor version thus invalidates the outputs depending on the
+features, and nothing else.
+
+An output that is also the batch source of a Feast push source (see
+`OfflineSource.push_batch_source`) is always kept as a single file, as
+Feast appends the pushed rows to it: in incremental mode its rows are
+merged back into that one file. Moreover, its rows not coming from the raw
+dataset (i.e. pushed ones) are carried over by every build, full or
+incremental. Without a manifest (first build), rows whose sms_id is no
+longer in the raw dataset cannot be told apart from pushed ones, and are
+kept as well.
+"""
+
+import os
+import time
+import zlib
+import shutil
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_NUM_PARTITIONS = 16
+# progress is printed at most this often
+REPORT_INTERVAL_SECONDS = 5.0
+
+MANIFEST_SUFFIX = '.manifest.parquet'
+STAGING_SUFFIX = '.staging'
+
+# the extractor of this worker process
+_worker_extractor = None
+
+
+class OfflineSource():
+
+    def __init__(self, file_name, build_columns, input_columns=('text', ), uses_features=True, push_batch_source=False):
+        self.file_name = file_name
+        # function(chunk_df, feature_matrix) -> DataFrame or pyarrow Table (with an sms_id column)
+        self.build_columns = build_columns
+        # what the output rows depend on, for incremental builds
+        self.input_columns = list(input_columns)
+        self.uses_features = uses_features
+        # single file, whose pushed rows survive rebuilds
+        self.push_batch_source = push_batch_source
+
+    @property
+    def manifest_file_name(self):
+        return self.file_name + MANIFEST_SUFFIX
+
+
+def _init_worker(extractor_class):
+    global _worker_extractor
+    _worker_extractor = extractor_class()
+
+
+def extract_features(feature_extractor, texts):
+    """
+    A (len(texts), num_features) matrix, vectorized if the extractor allows it.
+    """
+    if hasattr(feature_extractor, 'get_features_batch'):
+        return feature_extractor.get_features_batch(texts)
+    return np.array([
+        feature_extractor.get_features_list(text)
+        for text in texts
+    ]).reshape(len(texts), len(feature_extractor.FEATURE_ORDERED_LIST))
+
+
+def _extract_chunk(texts):
+    return extract_features(_worker_extractor, texts)
+
+
+class _InProcessExecutor():
+    # same interface as the pool, for num_workers=0
+
+    def __init__(self, extractor_class):
+        _init_worker(extractor_class)
+
+    def submit(self, function, *args):
+        return _DoneFuture(function(*args))
+
+    def shutdown(self):
+        pass
+
+
+class _DoneFuture():
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+def _remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _read_rows_except(file_name, excluded_ids, schema=None):
+    """
+    The rows of an output (file or directory of partitions) whose sms_id is
+    not in excluded_ids, as a Table (cast to `schema`, if given), or None.
+    """
+    if not os.path.exists(file_name):
+        return None
+    table = pq.read_table(file_name)
+    if excluded_ids:
+        value_set = pa.array(sorted(excluded_ids), type=table.schema.field('sms_id').type)
+        table = table.filter(pc.invert(pc.is_in(table.column('sms_id'), value_set=value_set)))
+    if table.num_rows == 0:
+        return None
+    if schema is not None:
+        table = table.select(schema.names)
+    return _as_table(table, schema)
+
+
+def _as_table(data, schema=None):
+    if isinstance(data, pa.Table):
+        return data.cast(schema) if schema is not None and data.schema != schema else data
+    return pa.Table.from_pandas(data, schema=schema, preserve_index=False)
+
+
+class ParquetStreamWriter():
+    """
+    Appends DataFrames (or pyarrow Tables) to a Parquet file, one row group
+    each. The schema is fixed by the first one. The file is written under a temporary
+    name and moved in place on `close` (replacing whatever was there, be
+    it a file or a directory), so readers never see a partial file.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.temp_file_name = file_name + '.tmp'
+        self.writer = None
+        self.schema = None
+        self.num_rows = 0
+
+    def write(self, data):
+        table = _as_table(data, self.schema)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = pq.ParquetWriter(self.temp_file_name, self.schema)
+        self.writer.write_table(table)
+        self.num_rows += table.num_rows
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            if os.path.isdir(self.file_name):
+                shutil.rmtree(self.file_name)
+            os.replace(self.temp_file_name, self.file_name)
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.temp_file_name)
+
+
+def _stream_features(raw_input_file, extractor_class, select_rows, num_workers, chunk_size):
+    """
+    Yield (chunk_df, selection, feature_rows, feature_matrix) for each chunk of
+    the raw dataset, in order. `select_rows(chunk_df)` returns (feature_rows,
+    selection): features are computed (in the pool) only for the rows at
+    positions feature_rows (sorted), selection is passed along as is.
+    """
+    if num_workers > 0:
+        executor = ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(extractor_class, ))
+    else:
+        executor = _InProcessExecutor(extractor_class)
+    max_in_flight = 2 * max(num_workers, 1)
+    in_flight = deque()
+
+    def _oldest():
+        chunk_df, selection, feature_rows, future = in_flight.popleft()
+        feature_matrix = future.result() if future is not None else None
+        return chunk_df, selection, feature_rows, feature_matrix
+
+    try:
+        for chunk_df in pd.read_csv(raw_input_file, chunksize=chunk_size):
+            chunk_df = chunk_df.reset_index(drop=True)
+            feature_rows, selection = select_rows(chunk_df)
+            future = None
+            if len(feature_rows) > 0:
+                future = executor.submit(_extract_chunk, chunk_df['text'].iloc[feature_rows].tolist())
+            in_flight.append((chunk_df, selection, feature_rows, future))
+            if len(in_flight) >= max_in_flight:
+                yield _oldest()
+        while in_flight:
+            yield _oldest()
+    finally:
+        executor.shutdown()
+
+
+class _ProgressReport():
+
+    def __init__(self, log_prefix):
+        self.log_prefix = log_prefix
+        self.t0 = time.perf_counter()
+        self.last_report = self.t0
+        self.num_rows = 0
+
+    def add(self, num_rows):
+        self.num_rows += num_rows
+        now = time.perf_counter()
+        if now - self.last_report >= REPORT_INTERVAL_SECONDS:
+            print(f'{self.log_prefix} {self.num_rows} rows ({self.num_rows / (now - self.t0):.0f} rows/s)')
+            self.last_report = now
+
+    def elapsed(self):
+        return time.perf_counter() - self.t0
+
+
+def build_offline_sources(raw_input_file, extractor_class, sources, num_workers=None, chunk_size=DEFAULT_CHUNK_SIZE, incremental=False, num_partitions=DEFAULT_NUM_PARTITIONS, log_prefix='[build_offline_sources]'):
+    """
+    Stream the raw dataset through the extractor into the outputs
+    (a list of OfflineSource). num_workers = size of the process pool
+    (default: one per CPU), 0 to extract in this process.
+    Return the number of rows read.
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    if incremental:
+        return _build_incremental(raw_input_file, extractor_class, sources, num_workers, chunk_size, num_partitions, log_prefix)
+    writers = [ParquetStreamWriter(source.file_name) for source in sources]
+    progress = _ProgressReport(log_prefix)
+    raw_ids = set()
+    try:
+        for chunk_df, _, _, feature_matrix in _stream_features(raw_input_file, extractor_class, lambda chunk_df: (np.arange(len(chunk_df)), None), num_workers, chunk_size):
+            for source, writer in zip(sources, writers):
+                writer.write(source.build_columns(chunk_df, feature_matrix))
+            raw_ids.update(chunk_df['sms_id'])
+            progress.add(len(chunk_df))
+        for source, writer in zip(sources, writers):
+            if source.push_batch_source:
+                # carry the pushed rows over (those known to come from the raw dataset are rebuilt)
+                pushed_rows = _read_rows_except(source.file_name, raw_ids | _manifest_ids(source), writer.schema)
+                if pushed_rows is not None:
+                    writer.write(pushed_rows)
+                    print(f'{log_prefix} {source.file_name}: {pushed_rows.num_rows} pushed rows kept')
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    for source, writer in zip(sources, writers):
+        writer.close()
+        # a full build replaces any incremental output
+        _remove_path(source.manifest_file_name)
+    elapsed = progress.elapsed()
+    print(f'{log_prefix} {progress.num_rows} rows in {elapsed:.2f} s ({progress.num_rows / elapsed:.0f} rows/s, {num_workers} workers)')
+    return progress.num_rows
+
+
+# incremental builds
+
+def _content_hashes(chunk_df, input_columns):
+    return [
+        hashlib.blake2b('\x00'.join(str(v) for v in values).encode('utf-8'), digest_size=8).hexdigest()
+        for values in zip(*(chunk_df[column] for column in input_columns))
+    ]
+
+
+def _partitions_of(sms_ids, num_partitions):
+    return np.array([
+        zlib.crc32(str(sms_id).encode('utf-8')) % num_partitions
+        for sms_id in sms_ids
+    ], dtype=np.int64)
+
+
+def _partition_file_name(source, partition):
+    if source.push_batch_source:
+        return source.file_name
+    return os.path.join(source.file_name, f'part-{partition:03}.parquet')
+
+
+def _manifest_ids(source):
+    if not os.path.isfile(source.manifest_file_name):
+        return set()
+    return set(pq.read_table(source.manifest_file_name, columns=['sms_id']).column('sms_id').to_pylist())
+
+
+def _read_manifest(source, num_partitions):
+    """
+    {sms_id: (content_hash, extractor_version)}, or None if there is no usable
+    manifest (missing, or with another partitioning): a full rebuild is needed.
+    """
+    if source.push_batch_source:
+        output_exists = os.path.isfile(source.file_name)
+    else:
+        output_exists = os.path.isdir(source.file_name)
+    if not os.path.isfile(source.manifest_file_name) or not output_exists:
+        return None
+    table = pq.read_table(source.manifest_file_name)
+    if (table.schema.metadata or {}).get(b'num_partitions') != str(num_partitions).encode():
+        return None
+    columns = table.to_pydict()
+    return {
+        sms_id: (content_hash, extractor_version)
+        for sms_id, content_hash, extractor_version in zip(columns['sms_id'], columns['content_hash'], columns['extractor_version'])
+    }
+
+
+def _write_manifest(source, manifest, num_partitions):
+    sms_ids = sorted(manifest.keys())
+    table = pa.table(
+        {
+            'sms_id': sms_ids,
+            'content_hash': [manifest[sms_id][0] for sms_id in sms_ids],
+            'extractor_version': [manifest[sms_id][1] for sms_id in sms_ids],
+        },
+        metadata={'num_partitions': str(num_partitions)},
+    )
+    pq.write_table(table, source.manifest_file_name + '.tmp')
+    os.replace(source.manifest_file_name + '.tmp', source.manifest_file_name)
+
+
+class _IncrementalOutput():
+    """
+    Bookkeeping for one source during an incremental build: new rows are
+    staged per partition, then merged into the affected partitions.
+    """
+
+    def __init__(self, source, extractor_version, num_partitions):
+        self.source = source
+        self.extractor_version = extractor_version if source.uses_features else ''
+        # (a push batch source is a single partition, the file itself)
+        self.num_partitions = 1 if source.push_batch_source else num_partitions
+        manifest = _read_manifest(source, self.num_partitions)
+        self.full_rebuild = manifest is None
+        self.manifest = manifest if manifest is not None else {}
+        self.seen_ids = set()
+        # partition -> sms_ids whose rows are to be replaced
+        self.changed_ids = {}
+        self.staging_dir = source.file_name + STAGING_SUFFIX
+        _remove_path(self.staging_dir)
+        self.staged = {}
+
+    def changed_rows(self, chunk_df):
+        """
+        Positions of the rows of the chunk that are new or changed
+        (the manifest is updated right away).
+        """
+        changed = []
+        for position, (sms_id, content_hash) in enumerate(zip(chunk_df['sms_id'], _content_hashes(chunk_df, self.source.input_columns))):
+            self.seen_ids.add(sms_id)
+            entry = (content_hash, self.extractor_version)
+            if self.manifest.get(sms_id) != entry:
+                self.manifest[sms_id] = entry
+                changed.append(position)
+        return np.array(changed, dtype=np.int64)
+
+    def stage(self, output):
+        table = _as_table(output)
+        sms_ids = table.column('sms_id').to_pylist()
+        partitions = _partitions_of(sms_ids, self.num_partitions)
+        for partition in np.unique(partitions).tolist():
+            in_partition = partitions == partition
+            self.changed_ids.setdefault(partition, set()).update(
+                sms_id
+                for sms_id, selected in zip(sms_ids, in_partition)
+                if selected
+            )
+            if partition not in self.staged:
+                os.makedirs(self.staging_dir, exist_ok=True)
+                self.staged[partition] = ParquetStreamWriter(os.path.join(self.staging_dir, f'part-{partition:03}.parquet'))
+            self.staged[partition].write(table.filter(pa.array(in_partition)))
+
+    def _merge_partitions(self):
+        if self.full_rebuild:
+            _remove_path(self.source.file_name)
+        os.makedirs(self.source.file_name, exist_ok=True)
+        for partition, replaced_ids in sorted(self.changed_ids.items()):
+            partition_file_name = _partition_file_name(self.source, partition)
+            # (in Arrow, which keeps column types such as fixed-size lists as they are)
+            parts = []
+            if partition in self.staged:
+                parts.append(pq.read_table(self.staged[partition].file_name))
+            if os.path.isfile(partition_file_name):
+                old_rows = _read_rows_except(partition_file_name, replaced_ids, parts[0].schema if parts else None)
+                if old_rows is not None:
+                    parts.append(old_rows)
+            if sum(part.num_rows for part in parts) == 0:
+                _remove_path(partition_file_name)
+                continue
+            merged_table = pa.concat_tables(parts).sort_by('sms_id')
+            # hidden while being written (readers of the directory skip dot-files)
+            temp_file_name = os.path.join(self.source.file_name, '.' + os.path.basename(partition_file_name) + '.tmp')
+            pq.write_table(merged_table, temp_file_name)
+            os.replace(temp_file_name, partition_file_name)
+
+    def _merge_single_file(self):
+        # all rows not replaced or removed stay, including the pushed ones
+        # (the previous output may also be a directory of partitions)
+        if not self.changed_ids and os.path.isfile(self.source.file_name):
+            return
+        replaced_ids = set().union(*self.changed_ids.values())
+        parts = []
+        if 0 in self.staged:
+            parts.append(pq.read_table(self.staged[0].file_name))
+        old_rows = _read_rows_except(self.source.file_name, replaced_ids, parts[0].schema if parts else None)
+        if old_rows is not None:
+            parts.append(old_rows)
+        if not parts:
+            _remove_path(self.source.file_name)
+            return
+        temp_file_name = self.source.file_name + '.tmp'
+        pq.write_table(pa.concat_tables(parts).sort_by('sms_id'), temp_file_name)
+        if os.path.isdir(self.source.file_name):
+            shutil.rmtree(self.source.file_name)
+        os.replace(temp_file_name, self.source.file_name)
+
+    def finish(self):
+        """
+        Merge the staged rows into the partitions, drop the rows no longer
+        in the raw dataset, write the manifest. Return (new or changed, removed).
+        """
+        removed_ids = sorted(set(self.manifest.keys()) - self.seen_ids)
+        for sms_id in removed_ids:
+            del self.manifest[sms_id]
+        for sms_id, partition in zip(removed_ids, _partitions_of(removed_ids, self.num_partitions)):
+            self.changed_ids.setdefault(int(partition), set()).add(sms_id)
+        for writer in self.staged.values():
+            writer.close()
+        #
+        if self.source.push_batch_source:
+            self._merge_single_file()
+        else:
+            self._merge_partitions()
+        _remove_path(self.staging_dir)
+        _write_manifest(self.source, self.manifest, self.num_partitions)
+        num_changed = sum(len(ids) for ids in self.changed_ids.values()) - len(removed_ids)
+        return num_changed, len(removed_ids)
+
+
+def _build_incremental(raw_input_file, extractor_class, sources, num_workers, chunk_size, num_partitions, log_prefix):
+    extractor_version = extractor_class().get_extractor_version()
+    outputs = [_IncrementalOutput(source, extractor_version, num_partitions) for source in sources]
+    for output in outputs:
+        if output.full_rebuild:
+            print(f'{log_prefix} No usable manifest for {output.source.file_name}: rebuilding it')
+
+    def _select_rows(chunk_df):
+        # positions of the new or changed rows, by output
+        changed_rows = [output.changed_rows(chunk_df) for output in outputs]
+        feature_rows = [
+            rows
+            for output, rows in zip(outputs, changed_rows)
+            if output.source.uses_features
+        ]
+        feature_rows = np.unique(np.concatenate(feature_rows)) if feature_rows else np.array([], dtype=np.int64)
+        return feature_rows, changed_rows
+
+    progress = _ProgressReport(log_prefix)
+    for chunk_df, changed_rows, feature_rows, feature_matrix in _stream_features(raw_input_file, extractor_class, _select_rows, num_workers, chunk_size):
+        for output, rows in zip(outputs, changed_rows):
+            if len(rows) == 0:
+                continue
+            # the feature matrix only has the rows in feature_rows
+            sub_matrix = feature_matrix[np.searchsorted(feature_rows, rows)] if output.source.uses_features else None
+            output.stage(output.source.build_columns(chunk_df.iloc[rows].reset_index(drop=True), sub_matrix))
+        progress.add(len(chunk_df))
+    for output in outputs:
+        num_changed, num_removed = output.finish()
+        print(f'{log_prefix} {output.source.file_name}: {num_changed} new or changed rows, {num_removed} removed')
+    elapsed = progress.elapsed()
+    print(f'{log_prefix} {progress.num_rows} rows checked in {elapsed:.2f} s ({progress.num_rows / elapsed:.0f} rows/s, {num_workers} workers)')
+    return progress.num_rows
@@ -1,3 +1,5 @@
+import os
+
 USER_DATA_API_URL = 'http://localhost:8111'
 
 MODEL_SERVING_API_URL = 'http://localhost:8000'
@@ -6,3 +8,26 @@ FEATURE_MODEL_VERSION = 'v3'
 FEATURE_SERVER_URL = 'http://localhost:6566'
 TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
 PUSH_SOURCE_NAME = 'smss2_push'
+
+# outgoing HTTP: keep-alive connection pools, one per downstream service
+HTTP_MAX_CONNECTIONS_PER_HOST = 50
+HTTP_MAX_KEEPALIVE_CONNECTIONS_PER_HOST = 20
+HTTP_KEEPALIVE_EXPIRY = 30.0
+HTTP_CONNECT_TIMEOUT = 2.0
+
+# total time allowed to each stage of the SMS pipeline (seconds)
+USER_DATA_API_TIMEOUT = 5.0
+MODEL_SERVING_API_TIMEOUT = 10.0
+FEATURE_SERVER_TIMEOUT = 10.0
+
+# durable queue for the feature stage (see api/inbox/storage/push_queue.py)
+PUSH_QUEUE_FILE_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'inbox_push_queue.sqlite')
+PUSH_QUEUE_BATCH_SIZE = 100
+PUSH_QUEUE_MAX_WAIT_MS = 500
+PUSH_QUEUE_MAX_PENDING = 100000
+PUSH_QUEUE_RETRY_INITIAL_DELAY_MS = 500
+PUSH_QUEUE_RETRY_MAX_DELAY_MS = 30000
+# a batch failing this many times in a row is moved to the dead letters (0: retry forever)
+PUSH_QUEUE_MAX_ATTEMPTS = 20
+# 'NORMAL' survives a crash of the API process, 'FULL' also a power loss (one fsync per enqueue)
+PUSH_QUEUE_SYNCHRONOUS = 'NORMAL'
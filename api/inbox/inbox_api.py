@@ -1,5 +1,6 @@
-import requests
 import uuid
+import httpx
+import asyncio
 from datetime import datetime
 from time_uuid import TimeUUID
 from fastapi import FastAPI, Response, status
@@ -11,13 +12,30 @@ from api.inbox.config import (
     FEATURE_SERVER_URL,
     TIMESTAMP_FORMAT,
     PUSH_SOURCE_NAME,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS_PER_HOST,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_CONNECT_TIMEOUT,
+    USER_DATA_API_TIMEOUT,
+    MODEL_SERVING_API_TIMEOUT,
+    FEATURE_SERVER_TIMEOUT,
+    PUSH_QUEUE_FILE_NAME,
+    PUSH_QUEUE_BATCH_SIZE,
+    PUSH_QUEUE_MAX_WAIT_MS,
+    PUSH_QUEUE_MAX_PENDING,
+    PUSH_QUEUE_RETRY_INITIAL_DELAY_MS,
+    PUSH_QUEUE_RETRY_MAX_DELAY_MS,
+    PUSH_QUEUE_MAX_ATTEMPTS,
+    PUSH_QUEUE_SYNCHRONOUS,
 )
 
 from api.tools.localCORS import permitReactLocalhostClient
 
-from api.inbox.utils.preprocessing import _adjust_feature_map_for_store
-from api.inbox.models.response import SuccessStatus
-from api.inbox.models.payload import IncomingSMS
+from api.inbox.utils.preprocessing import _adjust_feature_map_for_store, _merge_feature_maps_for_store
+from api.inbox.utils.http_clients import DownstreamClients
+from api.inbox.storage.push_queue import FeaturePushQueue, PermanentPushError
+from api.inbox.models.response import SuccessStatus, SMSStatus, BatchStatus, PushQueueStats
+from api.inbox.models.payload import IncomingSMS, IncomingSMSBatch
 
 apiDescription="""
 Inbox API
@@ -34,70 +52,236 @@ app = FastAPI(
 # this is really a 'demo mode' thing which should be refined!
 permitReactLocalhostClient(app)
 
+downstream = DownstreamClients(
+    {
+        'user_data': USER_DATA_API_URL,
+        'model_serving': MODEL_SERVING_API_URL,
+        'feature_server': FEATURE_SERVER_URL,
+    },
+    max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+    max_keepalive_connections_per_host=HTTP_MAX_KEEPALIVE_CONNECTIONS_PER_HOST,
+    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+)
+
+
+def _sms_timestamp_str(sms_id_str):
+    sms_timestamp = datetime.fromtimestamp(TimeUUID(bytes=uuid.UUID(sms_id_str).bytes).get_timestamp())
+    return sms_timestamp.strftime(TIMESTAMP_FORMAT)
+
+
+# request timeout, too many requests
+RETRIABLE_CLIENT_ERRORS = {408, 429}
+
+
+async def _push_features(items):
+    """
+    The feature stage, for a batch of stored (sms_id, sms_text) from the queue:
+    1. get the "v2" features for all of them from the model-serving API
+    2. push them to the feature server as a single multi-row push
+    Any failure is raised (for the queue to retry the batch), as a
+    PermanentPushError if the batch was rejected (a 4xx response other than
+    408/429: retrying it would not help). Messages without features are
+    given up, and their number returned.
+    """
+    _stage = 'features from model API'
+    try:
+        sms_features_req = await downstream.post(
+            'model_serving',
+            f'/model/{FEATURE_MODEL_VERSION}/text_to_features_batch',
+            {'texts': [sms_text for _, sms_text in items]},
+            timeout=MODEL_SERVING_API_TIMEOUT,
+        )
+        sms_features_req.raise_for_status()
+        sms_features_maps = {}
+        for (sms_id_str, _), sms_features_map0 in zip(items, sms_features_req.json()['results']):
+            sms_features_map = _adjust_feature_map_for_store(sms_features_map0, FEATURE_MODEL_VERSION)
+            if sms_features_map:
+                sms_features_maps[sms_id_str] = sms_features_map
+        #
+        if sms_features_maps:
+            _stage = 'insertion to feature server'
+            store_insertion = await downstream.post(
+                'feature_server',
+                '/push',
+                {
+                    'push_source_name': PUSH_SOURCE_NAME,
+                    'df': {
+                        **{
+                            'sms_id': list(sms_features_maps.keys()),
+                            'event_timestamp': [_sms_timestamp_str(sms_id_str) for sms_id_str in sms_features_maps],
+                        },
+                        **_merge_feature_maps_for_store(list(sms_features_maps.values())),
+                    },
+                    'to': 'online_and_offline',
+                },
+                timeout=FEATURE_SERVER_TIMEOUT,
+            )
+            store_insertion.raise_for_status()
+    except asyncio.TimeoutError:
+        raise RuntimeError(f'Timeout at stage "{_stage}"')
+    except httpx.HTTPStatusError as e:
+        if 400 <= e.response.status_code < 500 and e.response.status_code not in RETRIABLE_CLIENT_ERRORS:
+            raise PermanentPushError(f'Rejected with "{str(e)}" at stage "{_stage}"')
+        raise RuntimeError(f'Error "{str(e)}" at stage "{_stage}"')
+    except Exception as e:
+        raise RuntimeError(f'Error "{str(e)}" at stage "{_stage}"')
+    return len(items) - len(sms_features_maps)
+
+
+push_queue = FeaturePushQueue(
+    PUSH_QUEUE_FILE_NAME,
+    push_batch=_push_features,
+    batch_size=PUSH_QUEUE_BATCH_SIZE,
+    max_wait_ms=PUSH_QUEUE_MAX_WAIT_MS,
+    max_pending=PUSH_QUEUE_MAX_PENDING,
+    retry_initial_delay_ms=PUSH_QUEUE_RETRY_INITIAL_DELAY_MS,
+    retry_max_delay_ms=PUSH_QUEUE_RETRY_MAX_DELAY_MS,
+    max_attempts=PUSH_QUEUE_MAX_ATTEMPTS,
+    synchronous=PUSH_QUEUE_SYNCHRONOUS,
+)
+
+
+# the queue worker uses the HTTP clients: started after them, stopped before them
+@app.on_event('startup')
+async def start_http_clients_and_push_queue():
+    downstream.start()
+    await push_queue.start()
+
+
+@app.on_event('shutdown')
+async def close_push_queue_and_http_clients():
+    await push_queue.close()
+    await downstream.close()
+
+
+QUEUE_FULL_REASON = 'Too many messages waiting for the feature store, retry later'
+
+
 @app.post('/sms', response_model=SuccessStatus)
-async def post_sms(incomingSMS: IncomingSMS):
+async def post_sms(incomingSMS: IncomingSMS, response: Response):
     """
     1. store the message in the DB
-    2. get the "v2" features from the model-serving API
-    3. store the message and the features to the feature server
+    2. queue it for the feature stage (see `_push_features`)
+    The message is acknowledged once stored and queued; if the queue is
+    full, it is refused (with a 503) before being stored.
     """
+    if not push_queue.try_reserve():
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return SuccessStatus(
+            success=False,
+            reason=QUEUE_FULL_REASON,
+        )
+    num_reserved = 1
     _stage = 'user-data API'
     recipient_id = incomingSMS.recipient_id
     sender_id = incomingSMS.sender_id
     sms_text = incomingSMS.sms_text
-    #
-    sms_insertion = requests.post(
-        f'{USER_DATA_API_URL}/sms/{recipient_id}',
-        json={'sender_id': sender_id, 'sms_text': sms_text},
-    )
-    sms_insertion_json = sms_insertion.json()
     try:
+        sms_insertion = await downstream.post(
+            'user_data',
+            f'/sms/{recipient_id}',
+            {'sender_id': sender_id, 'sms_text': sms_text},
+            timeout=USER_DATA_API_TIMEOUT,
+        )
+        sms_insertion_json = sms_insertion.json()
         if sms_insertion_json['successful']:
             sms_id_str = sms_insertion_json['sms_id']
             #
-            _stage = 'features from model API'
-            sms_features_req = requests.post(
-                f'{MODEL_SERVING_API_URL}/model/{FEATURE_MODEL_VERSION}/text_to_features',
-                json={'text': sms_text},
+            _stage = 'feature push queue'
+            await push_queue.enqueue([(sms_id_str, sms_text)])
+            num_reserved = 0
+            return SuccessStatus(
+                success=True,
+                reason='SMS received correctly',
             )
-            sms_features_req_json = sms_features_req.json()
-            sms_features_map0 = sms_features_req_json
-            sms_features_map = _adjust_feature_map_for_store(sms_features_map0, FEATURE_MODEL_VERSION)
-            #
-            sms_timestamp = datetime.fromtimestamp(TimeUUID(bytes=uuid.UUID(sms_id_str).bytes).get_timestamp())
-            #
-            if sms_features_map:
-                _stage = 'insertion to feature server'
-                store_insertion = requests.post(
-                    f'{FEATURE_SERVER_URL}/push',
-                    json={
-                        'push_source_name': PUSH_SOURCE_NAME,
-                        'df': {
-                            **{
-                                'sms_id': [sms_id_str],
-                                'event_timestamp': [sms_timestamp.strftime(TIMESTAMP_FORMAT)],                            
-                            },
-                            **sms_features_map,
-                        },
-                        'to': 'online_and_offline',
-                    },
-                )
-                return SuccessStatus(
-                    success=True,
-                    reason='SMS received correctly',
-                )
-            else:
-                return SuccessStatus(
-                    success=False,
-                    reason='Feature computation failed',
-                )
         else:
             return SuccessStatus(
                 success=False,
                 reason='DB insertion failed',
             )
+    except asyncio.TimeoutError:
+        return SuccessStatus(
+            success=False,
+            reason=f'Timeout at stage "{_stage}"',
+        )
     except Exception as e:
         return SuccessStatus(
             success=False,
             reason=f'Error "{str(e)}" at stage "{_stage}"',
         )
+    finally:
+        push_queue.release(num_reserved)
+
+
+@app.post('/sms/batch', response_model=BatchStatus)
+async def post_sms_batch(incomingSMSBatch: IncomingSMSBatch, response: Response):
+    """
+    As for `/sms`, but for many messages at once:
+    1. store all messages in the DB with a single call
+    2. queue the stored ones for the feature stage
+    Each message gets its own status; if the queue cannot take the whole
+    batch, all messages are refused (with a 503) before being stored.
+    """
+    smss = incomingSMSBatch.smss
+    if not push_queue.try_reserve(len(smss)):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return BatchStatus(results=[
+            SMSStatus(success=False, reason=QUEUE_FULL_REASON)
+            for _ in smss
+        ])
+    # for each message: the SMS ID once stored, the status once settled
+    sms_ids = [None] * len(smss)
+    statuses = [None] * len(smss)
+    failure_reason = None
+    num_reserved = len(smss)
+    _stage = 'user-data API'
+    try:
+        if smss:
+            sms_insertion = await downstream.post(
+                'user_data',
+                '/sms_batch',
+                {
+                    'smss': [
+                        {'user_id': sms.recipient_id, 'sender_id': sms.sender_id, 'sms_text': sms.sms_text}
+                        for sms in smss
+                    ],
+                },
+                timeout=USER_DATA_API_TIMEOUT,
+            )
+            sms_insertion.raise_for_status()
+            insertion_results = sms_insertion.json()['results']
+            if len(insertion_results) != len(smss):
+                raise ValueError(f'{len(insertion_results)} results for {len(smss)} messages')
+            for sms_i, insertion_json in enumerate(insertion_results):
+                if insertion_json['successful']:
+                    sms_ids[sms_i] = insertion_json['sms_id']
+                else:
+                    statuses[sms_i] = SMSStatus(success=False, reason='DB insertion failed')
+        #
+        stored_is = [sms_i for sms_i in range(len(smss)) if statuses[sms_i] is None]
+        _stage = 'feature push queue'
+        await push_queue.enqueue([(sms_ids[sms_i], smss[sms_i].sms_text) for sms_i in stored_is])
+        num_reserved -= len(stored_is)
+        for sms_i in stored_is:
+            statuses[sms_i] = SMSStatus(success=True, reason='SMS received correctly', sms_id=sms_ids[sms_i])
+    except asyncio.TimeoutError:
+        failure_reason = f'Timeout at stage "{_stage}"'
+    except Exception as e:
+        failure_reason = f'Error "{str(e)}" at stage "{_stage}"'
+    finally:
+        push_queue.release(num_reserved)
+    #
+    return BatchStatus(results=[
+        status if status is not None else SMSStatus(success=False, reason=failure_reason, sms_id=sms_id)
+        for status, sms_id in zip(statuses, sms_ids)
+    ])
+
+
+@app.get('/push_queue_stats', response_model=PushQueueStats)
+async def push_queue_stats():
+    """
+    Size and lag (age of the oldest pending message) of the feature push
+    queue, with push/retry/dead-letter counters since startup.
+    """
+    return push_queue.get_stats()
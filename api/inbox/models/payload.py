@@ -1,3 +1,4 @@
+from typing import List
 from pydantic import BaseModel
 
 # request models
@@ -6,3 +7,6 @@ class IncomingSMS(BaseModel):
     recipient_id: str
     sender_id: str
     sms_text: str
+
+class IncomingSMSBatch(BaseModel):
+    smss: List[IncomingSMS]
@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic import BaseModel
 
 # response models
@@ -5,3 +6,24 @@ from pydantic import BaseModel
 class SuccessStatus(BaseModel):
     success: bool
     reason: str
+
+class SMSStatus(SuccessStatus):
+    # set as soon as the SMS is stored, even if a later stage fails
+    sms_id: str = None
+
+class BatchStatus(BaseModel):
+    results: List[SMSStatus]
+
+class PushQueueStats(BaseModel):
+    pending: int
+    lag_seconds: float
+    replayed: int
+    enqueued: int
+    pushed: int
+    dropped: int
+    batches: int
+    failed_batches: int
+    dead_lettered: int
+    worker_errors: int
+    consecutive_failures: int
+    last_error: Optional[str]
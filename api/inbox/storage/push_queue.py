@@ -0,0 +1,306 @@
+"""
+Durable (write-ahead) queue for the feature stage of the inbox.
+
+Once a SMS is stored, the endpoints just append it (ID and text) to a local
+SQLite file and respond. A background task drains the file in batches,
+whenever `batch_size` items are pending or the oldest of them has waited
+`max_wait_ms`, handing each batch to `push_batch` (which computes the
+features and pushes them to the feature server). Items leave the file only
+once their batch has gone through: if `push_batch` fails, the same batch is
+retried after a delay, doubling at each consecutive failure (up to
+`retry_max_delay_ms`). A batch that cannot go through, i.e. rejected with a
+`PermanentPushError` or failing `max_attempts` times in a row, is moved to
+the `dead_letters` table of the same file (with the error), not to block
+the queue. Whatever is still pending at startup (after a crash, or a
+shutdown during a feature-server outage) is simply replayed.
+
+Backpressure: callers reserve room with `try_reserve` before taking new
+SMS in (and refuse them if it fails), so that pending plus reserved items
+never exceed `max_pending`, however many requests are in flight.
+
+All SQLite operations run on a dedicated thread, off the event loop. The
+file is meant for a single process: it must not be shared by several
+workers, which would push the same items.
+"""
+
+import time
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+SYNCHRONOUS_MODES = {'NORMAL', 'FULL'}
+
+
+class PermanentPushError(Exception):
+    """
+    Raised by `push_batch` for a batch that retrying will not help
+    (e.g. rejected as invalid by a downstream service).
+    """
+    pass
+
+
+class FeaturePushQueue():
+
+    def __init__(self, file_name, push_batch, batch_size, max_wait_ms, max_pending,
+                 retry_initial_delay_ms, retry_max_delay_ms, max_attempts, synchronous='NORMAL'):
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f'Unknown SQLite synchronous mode "{synchronous}"')
+        self.file_name = file_name
+        # push_batch: async function of a list of (sms_id, sms_text),
+        # returning the number of items it gave up on (e.g. no features)
+        self.push_batch = push_batch
+        self.batch_size = batch_size
+        self.max_wait_s = max_wait_ms / 1000
+        self.max_pending = max_pending
+        self.retry_initial_delay_s = retry_initial_delay_ms / 1000
+        self.retry_max_delay_s = retry_max_delay_ms / 1000
+        # 0 means no limit
+        self.max_attempts = max_attempts
+        self.synchronous = synchronous
+        #
+        self.db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='push-queue-db')
+        self.connection = None
+        self.num_pending = 0
+        # room taken by items about to be enqueued (see `try_reserve`)
+        self.num_reserved = 0
+        # attempts made so far at the batch at the head of the queue
+        self.head_attempts = 0
+        # enqueue time of the oldest pending item (None if there are none)
+        self.oldest_enqueued_at = None
+        self.items_available = None
+        self.close_requested = None
+        self.worker = None
+        self.closing = False
+        # statistics
+        self.num_replayed = 0
+        self.num_enqueued = 0
+        self.num_pushed = 0
+        self.num_dropped = 0
+        self.num_batches = 0
+        self.num_failed_batches = 0
+        self.num_dead_lettered = 0
+        self.num_worker_errors = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+
+    async def _db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.db_executor, function, *args)
+
+    # these run on the database thread
+
+    def _open(self):
+        self.connection = sqlite3.connect(self.file_name)
+        self.connection.execute('PRAGMA journal_mode=WAL;')
+        self.connection.execute(f'PRAGMA synchronous={self.synchronous};')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS pending_pushes ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'sms_id TEXT NOT NULL, '
+            'sms_text TEXT NOT NULL, '
+            'enqueued_at REAL NOT NULL);'
+        )
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS dead_letters ('
+            'seq INTEGER PRIMARY KEY, '
+            'sms_id TEXT NOT NULL, '
+            'sms_text TEXT NOT NULL, '
+            'enqueued_at REAL NOT NULL, '
+            'error TEXT, '
+            'failed_at REAL NOT NULL);'
+        )
+        self.connection.commit()
+        return self.connection.execute('SELECT COUNT(*) FROM pending_pushes;').fetchone()[0]
+
+    def _close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _insert(self, rows):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO pending_pushes (sms_id, sms_text, enqueued_at) VALUES (?, ?, ?);',
+                rows,
+            )
+
+    def _read_oldest(self, limit):
+        return self.connection.execute(
+            'SELECT seq, sms_id, sms_text, enqueued_at FROM pending_pushes ORDER BY seq LIMIT ?;',
+            (limit, ),
+        ).fetchall()
+
+    def _delete_through(self, seq):
+        # batches are always read from the head of the queue
+        with self.connection:
+            self.connection.execute('DELETE FROM pending_pushes WHERE seq <= ?;', (seq, ))
+
+    def _dead_letter_through(self, seq, error):
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO dead_letters (seq, sms_id, sms_text, enqueued_at, error, failed_at) '
+                'SELECT seq, sms_id, sms_text, enqueued_at, ?, ? FROM pending_pushes WHERE seq <= ?;',
+                (error, time.time(), seq),
+            )
+            self.connection.execute('DELETE FROM pending_pushes WHERE seq <= ?;', (seq, ))
+
+    #
+
+    async def start(self):
+        """
+        Open (or create) the queue file and start the background worker,
+        which first replays any items left over from a previous run.
+        """
+        self.items_available = asyncio.Event()
+        self.close_requested = asyncio.Event()
+        self.num_pending = await self._db(self._open)
+        self.num_replayed = self.num_pending
+        if self.num_pending > 0:
+            print(f'[FeaturePushQueue] Replaying {self.num_pending} pending items from "{self.file_name}"')
+            self.oldest_enqueued_at = (await self._db(self._read_oldest, 1))[0][3]
+        self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    def try_reserve(self, num_items=1):
+        """
+        Reserve room for items about to be enqueued: False (and nothing
+        reserved) if the queue cannot take them. The reservation is used up
+        by `enqueue`; what is not enqueued must be given back with `release`.
+        """
+        if self.num_pending + self.num_reserved + num_items > self.max_pending:
+            return False
+        self.num_reserved += num_items
+        return True
+
+    def release(self, num_items):
+        self.num_reserved -= num_items
+
+    async def enqueue(self, items):
+        """
+        Durably append (sms_id, sms_text) items, with room reserved for them
+        (see `try_reserve`), to the queue.
+        Returns once they are written to the file.
+        """
+        if len(items) == 0:
+            return
+        enqueued_at = time.time()
+        await self._db(self._insert, [(sms_id, sms_text, enqueued_at) for sms_id, sms_text in items])
+        if self.num_pending == 0:
+            self.oldest_enqueued_at = enqueued_at
+        self.num_reserved -= len(items)
+        self.num_pending += len(items)
+        self.num_enqueued += len(items)
+        self.items_available.set()
+
+    async def _wait(self, event, timeout_s):
+        try:
+            await asyncio.wait_for(event.wait(), timeout_s)
+        except asyncio.TimeoutError:
+            pass
+
+    def _retry_delay(self):
+        return min(
+            self.retry_initial_delay_s * 2 ** (self.consecutive_failures - 1),
+            self.retry_max_delay_s,
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                if not await self._step():
+                    return
+            except Exception as e:
+                # the queue file itself failed (e.g. SQLite busy or I/O error): keep going
+                self.num_worker_errors += 1
+                self.consecutive_failures += 1
+                self.last_error = str(e)
+                if self.closing:
+                    return
+                delay_s = self._retry_delay()
+                print(f'[FeaturePushQueue] Queue error ({str(e)}), retrying in {delay_s:.1f} s')
+                await self._wait(self.close_requested, delay_s)
+
+    async def _step(self):
+        """
+        One round of the worker: wait for a batch, or push one.
+        Returns False once the worker is to stop.
+        """
+        if self.num_pending == 0:
+            if self.closing:
+                return False
+            await self._wait(self.items_available, None)
+            self.items_available.clear()
+            return True
+        if self.num_pending < self.batch_size and not self.closing:
+            wait_s = self.oldest_enqueued_at + self.max_wait_s - time.time()
+            if wait_s > 0:
+                await self._wait(self.items_available, wait_s)
+                self.items_available.clear()
+                return True
+        #
+        batch = await self._db(self._read_oldest, self.batch_size)
+        self.head_attempts += 1
+        try:
+            num_dropped = await self.push_batch([(sms_id, sms_text) for _, sms_id, sms_text, _ in batch])
+        except Exception as e:
+            self.num_failed_batches += 1
+            self.consecutive_failures += 1
+            self.last_error = str(e)
+            if isinstance(e, PermanentPushError) or (self.max_attempts > 0 and self.head_attempts >= self.max_attempts):
+                print(f'[FeaturePushQueue] Push of {len(batch)} items failed ({str(e)}) after {self.head_attempts} attempt(s), moving them to the dead letters')
+                await self._db(self._dead_letter_through, batch[-1][0], str(e))
+                self.num_pending -= len(batch)
+                self.num_dead_lettered += len(batch)
+                self.head_attempts = 0
+                # the next batch starts afresh
+                self.consecutive_failures = 0
+                await self._update_oldest()
+            elif not self.closing:
+                delay_s = self._retry_delay()
+                print(f'[FeaturePushQueue] Push of {len(batch)} items failed ({str(e)}), retrying in {delay_s:.1f} s')
+                await self._wait(self.close_requested, delay_s)
+        else:
+            await self._db(self._delete_through, batch[-1][0])
+            self.num_pending -= len(batch)
+            self.head_attempts = 0
+            self.num_batches += 1
+            self.num_pushed += len(batch) - num_dropped
+            self.num_dropped += num_dropped
+            self.consecutive_failures = 0
+            await self._update_oldest()
+        # at most one attempt once closing: what is left stays in the file, for the next start
+        return not self.closing
+
+    async def _update_oldest(self):
+        if self.num_pending > 0:
+            self.oldest_enqueued_at = (await self._db(self._read_oldest, 1))[0][3]
+        else:
+            self.oldest_enqueued_at = None
+
+    async def close(self):
+        """
+        Stop the worker after (at most) one last attempt at pushing the
+        oldest pending batch (whatever is left stays in the file, to be
+        replayed at the next start) and close the file.
+        """
+        self.closing = True
+        if self.worker is not None:
+            self.items_available.set()
+            self.close_requested.set()
+            await self.worker
+        await self._db(self._close)
+        self.db_executor.shutdown(wait=True)
+
+    def get_stats(self):
+        return {
+            'pending': self.num_pending,
+            'lag_seconds': time.time() - self.oldest_enqueued_at if self.oldest_enqueued_at is not None else 0.0,
+            'replayed': self.num_replayed,
+            'enqueued': self.num_enqueued,
+            'pushed': self.num_pushed,
+            'dropped': self.num_dropped,
+            'batches': self.num_batches,
+            'failed_batches': self.num_failed_batches,
+            'dead_lettered': self.num_dead_lettered,
+            'worker_errors': self.num_worker_errors,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+        }
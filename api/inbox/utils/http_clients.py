@@ -0,0 +1,49 @@
+"""
+Pooled async HTTP clients for the services called by the inbox.
+
+There is one `httpx.AsyncClient` per downstream service, hence a keep-alive
+connection pool (and a connection limit) per host: a slow service cannot
+take the connections needed by the others. The clients are created at app
+startup and closed at shutdown.
+
+Each call gets a total time budget (pool wait, connection, request and
+response body included), after which `asyncio.TimeoutError` is raised.
+"""
+
+import asyncio
+import httpx
+
+
+class DownstreamClients():
+
+    def __init__(self, base_urls, max_connections_per_host, max_keepalive_connections_per_host,
+                 keepalive_expiry, connect_timeout):
+        # base_urls: {service name: base URL}
+        self.base_urls = base_urls
+        self.limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_keepalive_connections_per_host,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # the overall deadline is per call (see `post`)
+        self.timeout = httpx.Timeout(None, connect=connect_timeout)
+        self.clients = {}
+
+    def start(self):
+        self.clients = {
+            service: httpx.AsyncClient(base_url=base_url, limits=self.limits, timeout=self.timeout)
+            for service, base_url in self.base_urls.items()
+        }
+
+    async def close(self):
+        clients, self.clients = self.clients, {}
+        await asyncio.gather(*(client.aclose() for client in clients.values()))
+
+    async def post(self, service, path, payload, timeout):
+        """
+        POST a JSON payload to a service, within `timeout` seconds.
+        """
+        client = self.clients.get(service)
+        if client is None:
+            raise RuntimeError(f'No HTTP client for "{service}" (app not started?)')
+        return await asyncio.wait_for(client.post(path, json=payload), timeout)
@@ -12,3 +12,15 @@ def _adjust_feature_map_for_store(f_map0, f_model_version):
             return None
     else:
         raise NotImplementedError
+
+
+def _merge_feature_maps_for_store(f_maps):
+    # several (adjusted, single-row) feature maps into one, multi-row, map
+    return {
+        f_name: [
+            f_value
+            for f_map in f_maps
+            for f_value in f_map[f_name]
+        ]
+        for f_name in f_maps[0].keys()
+    }
@@ -21,8 +21,18 @@ class KerasLSTMModel(TextClassifierModel):
         ]
 
 
+    def parameters_nbytes(self):
+        return sum(
+            weights.nbytes
+            for weights in self.model.get_weights()
+        )
+
     def text_to_features(self, text):
         return self.feature_extractor.get_features_list(text)
 
     def features_to_prediction_vector(self, features):
         return self.model.predict(np.array([features]))[0].tolist()
+
+    def features_to_prediction_vectors(self, features_list):
+        # a single forward pass for the whole batch
+        return self.model.predict(np.array(features_list)).tolist()
@@ -0,0 +1,145 @@
+import json
+from operator import itemgetter
+import h5py
+import numpy as np
+from api.model_serving.aimodels.TextClassifierModel import TextClassifierModel
+from api.model_serving.utils.shared_memory import to_shared_array
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def _read_layer_weights(h5_file):
+    """
+    Read a Keras (.h5) Sequential model into a list of
+    (class_name, layer_config, [weight arrays]), one per layer, in order.
+    """
+    model_config = json.loads(h5_file.attrs['model_config'])
+    model_weights = h5_file['model_weights']
+    layers = []
+    for layer in model_config['config']['layers']:
+        if layer['class_name'] == 'InputLayer':
+            continue
+        layer_group = model_weights[layer['config']['name']]
+        weights = [
+            np.array(layer_group[weight_name])
+            for weight_name in (
+                wn.decode() if isinstance(wn, bytes) else wn
+                for wn in layer_group.attrs['weight_names']
+            )
+        ]
+        layers.append((layer['class_name'], layer['config'], weights))
+    return layers
+
+
+DROPOUT_LAYERS = {'Dropout', 'SpatialDropout1D'}
+
+
+def _check_layers(layers):
+    """
+    Make sure the network is exactly Embedding => LSTM => Dense(softmax)
+    (with optional dropout layers in between), with the configuration the
+    forward pass below implements, and return the weights of those three.
+    Anything else raises ValueError (rather than computing something wrong).
+    """
+    main_layers = [
+        (class_name, config, weights)
+        for class_name, config, weights in layers
+        if class_name not in DROPOUT_LAYERS
+    ]
+    if [class_name for class_name, _, _ in main_layers] != ['Embedding', 'LSTM', 'Dense']:
+        raise ValueError('Only Embedding => LSTM => Dense networks are supported, found %s' % (
+            ' => '.join(class_name for class_name, _, _ in layers),
+        ))
+    (_, embedding_config, embedding_weights), (_, lstm_config, lstm_weights), (_, dense_config, dense_weights) = main_layers
+    if embedding_config.get('mask_zero', False):
+        raise ValueError('Masking Embedding layers are not supported')
+    if lstm_config.get('activation', 'tanh') != 'tanh' or lstm_config.get('recurrent_activation', 'sigmoid') != 'sigmoid':
+        raise ValueError('Only tanh/sigmoid LSTM layers are supported')
+    if lstm_config.get('return_sequences', False) or lstm_config.get('go_backwards', False) or lstm_config.get('stateful', False):
+        raise ValueError('Only forward, stateless LSTM layers returning the last output are supported')
+    if not lstm_config.get('use_bias', True) or not dense_config.get('use_bias', True):
+        raise ValueError('Only LSTM and Dense layers with a bias are supported')
+    if dense_config.get('activation') != 'softmax':
+        raise ValueError('Only a softmax Dense output layer is supported')
+    if len(embedding_weights) != 1 or len(lstm_weights) != 3 or len(dense_weights) != 2:
+        raise ValueError('Unexpected number of weight arrays in the Embedding/LSTM/Dense layers')
+    return embedding_weights, lstm_weights, dense_weights
+
+
+class NumpyLSTMModel(TextClassifierModel):
+    """
+    A drop-in alternative to KerasLSTMModel, for the same Embedding + LSTM + Dense(softmax)
+    networks, running the forward pass in plain NumPy. Only the weights are read
+    from the .h5 file (with h5py), so Tensorflow is not needed at all.
+    Dropout layers are irrelevant at inference time and are skipped; any other
+    architecture is refused (see `_check_layers`).
+    """
+
+    def __init__(self, model_path, model_metadata_path, feature_extractor):
+        self.feature_extractor = feature_extractor
+        self.metadata = json.load(open(model_metadata_path))
+        #
+        self.output_labels = [
+            kpair[0]
+            for kpair in sorted(
+                self.metadata['label_legend'].items(),
+                key=itemgetter(1),
+            )
+        ]
+        #
+        with h5py.File(model_path, 'r') as h5_file:
+            layers = _read_layer_weights(h5_file)
+        [embeddings], (kernel, recurrent_kernel, bias), (dense_kernel, dense_bias) = _check_layers(layers)
+        #
+        self.vocabulary_size = embeddings.shape[0]
+        self.units = recurrent_kernel.shape[0]
+        # Inputs are token indices: the input projection of the LSTM can be
+        # precomputed for the whole vocabulary ((vocabulary_size, 4 * units) table).
+        self.input_projections = (embeddings @ kernel + bias).astype(np.float32)
+        self.recurrent_kernel = recurrent_kernel.astype(np.float32)
+        self.dense_kernel = dense_kernel.astype(np.float32)
+        self.dense_bias = dense_bias.astype(np.float32)
+
+    def parameters_nbytes(self):
+        return sum(
+            array.nbytes
+            for array in (self.input_projections, self.recurrent_kernel, self.dense_kernel, self.dense_bias)
+        )
+
+    def share_memory(self):
+        self.input_projections = to_shared_array(self.input_projections)
+        self.recurrent_kernel = to_shared_array(self.recurrent_kernel)
+        self.dense_kernel = to_shared_array(self.dense_kernel)
+        self.dense_bias = to_shared_array(self.dense_bias)
+
+    def _forward(self, token_matrix):
+        # token_matrix: (n, seq_length) integers => (n, num_labels) probabilities
+        if token_matrix.size > 0 and (token_matrix.min() < 0 or token_matrix.max() >= self.vocabulary_size):
+            raise ValueError(f'Feature values must be integers in [0, {self.vocabulary_size})')
+        units = self.units
+        projections = self.input_projections[token_matrix]
+        h = np.zeros((token_matrix.shape[0], units), dtype=np.float32)
+        c = np.zeros((token_matrix.shape[0], units), dtype=np.float32)
+        for t in range(token_matrix.shape[1]):
+            # Keras gate order: input, forget, cell candidate, output
+            z = projections[:, t, :] + h @ self.recurrent_kernel
+            i = _sigmoid(z[:, :units])
+            f = _sigmoid(z[:, units: 2 * units])
+            g = np.tanh(z[:, 2 * units: 3 * units])
+            o = _sigmoid(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * np.tanh(c)
+        logits = h @ self.dense_kernel + self.dense_bias
+        exps = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exps / exps.sum(axis=1, keepdims=True)
+
+    def text_to_features(self, text):
+        return self.feature_extractor.get_features_list(text)
+
+    def features_to_prediction_vector(self, features):
+        return self._forward(np.array([features], dtype=np.int64))[0].tolist()
+
+    def features_to_prediction_vectors(self, features_list):
+        return self._forward(np.array(features_list, dtype=np.int64).reshape(len(features_list), -1)).tolist()
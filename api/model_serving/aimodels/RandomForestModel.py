@@ -1,4 +1,6 @@
-import pandas
+import warnings
+import threading
+import numpy as np
 import joblib
 
 from api.model_serving.aimodels.TextClassifierModel import TextClassifierModel
@@ -11,20 +13,50 @@ class RandomForestModel(TextClassifierModel):
         self.model_path = model_path
         #
         self.model = joblib.load(self.model_path)
+        self.num_features = len(self.feature_extractor.FEATURE_ORDERED_LIST)
+        # The estimator is fed plain arrays, with columns in the order it was fitted with
+        # (given here as positions in FEATURE_ORDERED_LIST). Arrays carry no names, hence
+        # sklearn's warning about it (on each call) is silenced: the order is ensured here.
+        fitted_names = getattr(self.model, 'feature_names_in_', None)
+        if fitted_names is not None:
+            self.column_order = [
+                self.feature_extractor.FEATURE_ORDERED_LIST.index(name)
+                for name in fitted_names
+            ]
+            warnings.filterwarnings(
+                'ignore',
+                message='X does not have valid feature names',
+                category=UserWarning,
+                module=r'sklearn\.',
+            )
+        else:
+            self.column_order = list(range(self.num_features))
+        # position of each of the estimator's classes in the output vector
+        self.class_positions = [int(c) for c in self.model.classes_]
+        # preallocated single-row input, one per thread
+        self._row_buffers = threading.local()
+
+    def _get_row_buffer(self):
+        if not hasattr(self._row_buffers, 'row'):
+            self._row_buffers.row = np.zeros((1, self.num_features), dtype=np.float64)
+        return self._row_buffers.row
+
+    def _probabilities_to_vectors(self, probabilities):
+        # probabilities = a (n_rows, n_classes) array from predict_proba
+        vectors = np.zeros((probabilities.shape[0], len(self.output_labels)))
+        vectors[:, self.class_positions] = probabilities
+        return vectors.tolist()
 
     def text_to_features(self, text):
         return self.feature_extractor.get_features_list(text)
 
     def features_to_prediction_vector(self, features):
         # features = a list
-        predicted_idx = self.model.predict(pandas.DataFrame({
-            k: [v]
-            for k, v in zip(
-                self.feature_extractor.FEATURE_ORDERED_LIST,
-                features,
-            )
-        }))[0]
-        return [
-            1 if idx == predicted_idx else 0
-            for idx in range(len(self.output_labels))
-        ]
+        row = self._get_row_buffer()
+        row[0, :] = [features[idx] for idx in self.column_order]
+        return self._probabilities_to_vectors(self.model.predict_proba(row))[0]
+
+    def features_to_prediction_vectors(self, features_list):
+        # features_list = a list of lists (or a 2D array), one row each
+        matrix = np.asarray(features_list, dtype=np.float64)[:, self.column_order]
+        return self._probabilities_to_vectors(self.model.predict_proba(matrix))
@@ -11,25 +11,81 @@ class TextClassifierModel():
         # must return [prob1, prob2, ... probn]
         ...
 
+    def texts_to_features(self, texts):
+        # must return [[f1, f2, ... fn], ...], one per text.
+        # Vectorized extraction, if the model's feature extractor offers it
+        feature_extractor = getattr(self, 'feature_extractor', None)
+        if hasattr(feature_extractor, 'get_features_batch'):
+            return feature_extractor.get_features_batch(texts).tolist()
+        return [
+            self.text_to_features(text)
+            for text in texts
+        ]
+
+    def features_to_prediction_vectors(self, features_list):
+        # must return [[prob1, prob2, ... probn], ...], one per feature list.
+        # This fallback loops: subclasses should override it with a single
+        # vectorized call to the underlying model.
+        return [
+            self.features_to_prediction_vector(features)
+            for features in features_list
+        ]
+
     def text_to_prediction_vector(self, text):
         return self.features_to_prediction_vector(self.text_to_features(text))
 
-    def features_to_prediction(self, features):
+    def vector_to_prediction(self, pred_vector):
         '''
-        return {label: prob}
+        [prob1, prob2, ... probn] => {label: prob}
         '''
-        pred_vector = self.features_to_prediction_vector(features)
         return {
             lab: prob
             for lab, prob in zip(self.output_labels, pred_vector)
         }
 
+    def features_to_prediction(self, features):
+        '''
+        return {label: prob}
+        '''
+        pred_vector = self.features_to_prediction_vector(features)
+        return self.vector_to_prediction(pred_vector)
+
     def text_to_prediction(self, text):
         '''
         return {label: prob}
         '''
         pred_vector = self.text_to_prediction_vector(text)
-        return {
-            lab: prob
-            for lab, prob in zip(self.output_labels, pred_vector)
-        }
+        return self.vector_to_prediction(pred_vector)
+
+    def features_to_predictions(self, features_list):
+        '''
+        return [{label: prob}, ...], one per feature list
+        '''
+        if len(features_list) == 0:
+            return []
+        return [
+            self.vector_to_prediction(pred_vector)
+            for pred_vector in self.features_to_prediction_vectors(features_list)
+        ]
+
+    def texts_to_predictions(self, texts):
+        '''
+        return [{label: prob}, ...], one per text
+        '''
+        return self.features_to_predictions(self.texts_to_features(texts))
+
+    def share_memory(self):
+        '''
+        Move the (read-only) model weights to memory shared with the processes
+        forked afterwards. By default there is nothing to move: forked processes
+        still share the parent pages, as long as they are not written to.
+        '''
+        pass
+
+    def parameters_nbytes(self):
+        '''
+        Size of the model parameters held in memory, i.e. what dropping the
+        model frees (the feature extractor and the libraries are shared).
+        None if unknown.
+        '''
+        return None
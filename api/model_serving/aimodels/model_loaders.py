@@ -0,0 +1,108 @@
+"""
+Model loaders: one no-args function per model version, building the model
+wrapper (a TextClassifierModel) from its artifacts when called.
+
+They live in their own (light) module, and not in the API one, so that
+they can be passed to spawned inference workers (see
+api/model_serving/utils/executors.py): unpickling them there only imports
+this module, not the whole app.
+"""
+
+import os
+import threading
+
+from api.model_serving.config.config import getSettings
+
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+models_dir = os.path.join(base_dir, '..', '..', '..', 'models')
+
+settings = getSettings()
+lstm_backend_map = {
+    version: backend
+    for version, backend in (
+        spec.split(':')
+        for spec in settings.lstm_backends.split(',')
+        if spec.strip() != ''
+    )
+}
+
+
+def _get_lstm_model_class(version):
+    backend = lstm_backend_map.get(version, 'keras')
+    print(f'[model_loaders] Using "{backend}" backend for "{version}"')
+    if backend == 'keras':
+        from api.model_serving.aimodels.KerasLSTMModel import KerasLSTMModel
+        return KerasLSTMModel
+    elif backend == 'numpy':
+        from api.model_serving.aimodels.NumpyLSTMModel import NumpyLSTMModel
+        return NumpyLSTMModel
+    else:
+        raise ValueError(f'Unknown LSTM backend "{backend}"')
+
+
+# model artifacts (watched for changes, if enabled): model file first, then metadata
+model_artifacts = {
+    'v1': [
+        os.path.join(models_dir, 'model1_2019', 'model1.pkl'),
+    ],
+    'v2': [
+        os.path.join(models_dir, 'model2_2020', 'classifier', 'model2.h5'),
+        os.path.join(models_dir, 'model2_2020', 'classifier', 'model2_metadata.json'),
+    ],
+    'v3': [
+        os.path.join(models_dir, 'model3_2021', 'classifier', 'model3.h5'),
+        os.path.join(models_dir, 'model3_2021', 'classifier', 'model3_metadata.json'),
+    ],
+}
+
+
+# memoized feature extractors, by feature set (shared by the models using it, kept across reloads)
+feature_extractor_memos = {}
+feature_extractor_memos_lock = threading.Lock()
+
+
+def _get_feature_extractor(feature_set, build_extractor):
+    if settings.feature_memo_max_size <= 0:
+        return build_extractor()
+    from analysis.feature_extractor.feature_extractor import MemoizedFeatureExtractor
+    #
+    with feature_extractor_memos_lock:
+        if feature_set not in feature_extractor_memos:
+            feature_extractor_memos[feature_set] = MemoizedFeatureExtractor(
+                build_extractor(),
+                max_size=settings.feature_memo_max_size,
+            )
+        return feature_extractor_memos[feature_set]
+
+
+def load_model_v1():
+    from analysis.features1.feature1_extractor import Feature1Extractor
+    from api.model_serving.aimodels.RandomForestModel import RandomForestModel
+    #
+    return RandomForestModel(
+        model_path=model_artifacts['v1'][0],
+        feature_extractor=_get_feature_extractor('features1', Feature1Extractor),
+        output_labels=['ham', 'spam'],
+    )
+
+
+def load_model_v2():
+    from analysis.features2.feature2_extractor import get_feature2_extractor
+    #
+    return _get_lstm_model_class('v2')(
+        model_path=model_artifacts['v2'][0],
+        model_metadata_path=model_artifacts['v2'][1],
+        feature_extractor=_get_feature_extractor('features2', get_feature2_extractor),
+    )
+
+
+def load_model_v3():
+    from analysis.features2.feature2_extractor import get_feature2_extractor
+    #
+    return _get_lstm_model_class('v3')(
+        model_path=model_artifacts['v3'][0],
+        model_metadata_path=model_artifacts['v3'][1],
+        # the feature extractor is the same (shared instance, even) as "v2"
+        feature_extractor=_get_feature_extractor('features2', get_feature2_extractor),
+    )
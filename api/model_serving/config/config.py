@@ -4,6 +4,49 @@ from pydantic import BaseSettings, Field
 
 class Settings(BaseSettings):
     model_versions: str = Field('v1', env='SPAM_MODEL_VERSIONS')
+    # inference backend for the LSTM versions, 'keras' (default) or 'numpy', e.g. "v2:numpy,v3:keras"
+    lstm_backends: str = Field('', env='SPAM_LSTM_BACKENDS')
+    # model loading: 'eager', 'background' or 'lazy'; plus warm-up rounds after each load
+    model_loading: str = Field('background', env='SPAM_MODEL_LOADING')
+    model_warmup_rounds: int = Field(1, env='SPAM_MODEL_WARMUP_ROUNDS')
+    # memory budget for the models loaded in the API process (LRU eviction beyond it, 0 = no limit).
+    # Versions served by a process pool are loaded in the pool workers instead, outside of it
+    model_memory_budget_mb: int = Field(0, env='SPAM_MODEL_MEMORY_BUDGET_MB')
+    # polling interval of the model artifacts, for hot swap (0 = no watching)
+    model_watch_interval_seconds: float = Field(0.0, env='SPAM_MODEL_WATCH_INTERVAL_SECONDS')
+    # micro-batching of inference (opt-in, comma-separated list of versions)
+    micro_batching_versions: str = Field('', env='SPAM_MICRO_BATCHING_VERSIONS')
+    micro_batching_max_batch_size: int = Field(64, env='SPAM_MICRO_BATCHING_MAX_BATCH_SIZE')
+    micro_batching_max_wait_us: int = Field(2000, env='SPAM_MICRO_BATCHING_MAX_WAIT_US')
+    # pools running the blocking model code: type is 'thread', 'process' or 'none'.
+    # Per-version overrides are given as "v1:thread:2,v3:process:4"
+    inference_pool_type: str = Field('thread', env='SPAM_INFERENCE_POOL_TYPE')
+    inference_pool_size: int = Field(4, env='SPAM_INFERENCE_POOL_SIZE')
+    inference_pools: str = Field('', env='SPAM_INFERENCE_POOLS')
+    # in-process (L1) prediction cache, in front of the DB table. Size 0 disables it
+    l1_cache_max_size: int = Field(10000, env='SPAM_L1_CACHE_MAX_SIZE')
+    l1_cache_ttl_seconds: float = Field(300.0, env='SPAM_L1_CACHE_TTL_SECONDS')
+    # memoization of feature extraction, by canonical text (LRU, per process). Size 0 disables it
+    feature_memo_max_size: int = Field(10000, env='SPAM_FEATURE_MEMO_MAX_SIZE')
+    # layout of the DB cache table: 'json' (the original one) or 'digest' (hashed keys, binary
+    # values, in a table of its own: create and fill it before switching, see the README)
+    cache_layout: str = Field('json', env='SPAM_CACHE_LAYOUT')
+    cache_collision_check: bool = Field(True, env='SPAM_CACHE_COLLISION_CHECK')
+    # write-behind buffering of the call log. Drop policy is 'drop_oldest' or 'drop_newest'
+    call_log_write_behind: bool = Field(True, env='SPAM_CALL_LOG_WRITE_BEHIND')
+    call_log_buffer_max_size: int = Field(10000, env='SPAM_CALL_LOG_BUFFER_MAX_SIZE')
+    call_log_flush_size: int = Field(200, env='SPAM_CALL_LOG_FLUSH_SIZE')
+    call_log_flush_interval_ms: int = Field(1000, env='SPAM_CALL_LOG_FLUSH_INTERVAL_MS')
+    call_log_drop_policy: str = Field('drop_oldest', env='SPAM_CALL_LOG_DROP_POLICY')
+    # max number of inputs in a request to the _batch endpoints (larger ones get a 422)
+    batch_max_items: int = Field(256, env='SPAM_BATCH_MAX_ITEMS')
+    # max number of concurrent DB queries per process
+    db_max_concurrency: int = Field(128, env='SPAM_DB_MAX_CONCURRENCY')
+    # max (and default) number of call-log entries per page
+    call_log_max_page_size: int = Field(1000, env='SPAM_CALL_LOG_MAX_PAGE_SIZE')
+    call_log_default_page_size: int = Field(100, env='SPAM_CALL_LOG_DEFAULT_PAGE_SIZE')
+    # per-stage latency metrics, exposed in Prometheus format at /metrics
+    metrics_enabled: bool = Field(False, env='SPAM_METRICS_ENABLED')
 
 
 @lru_cache()
@@ -1,15 +1,18 @@
-import os
-from fastapi import FastAPI
+import threading
+from typing import Dict
+from fastapi import FastAPI, Response, status
+from fastapi.responses import PlainTextResponse
 
 from api.tools.localCORS import permitReactLocalhostClient
 
-from api.model_serving.routers.model_router import createModelRouter
-    
-from api.model_serving.config.config import getSettings
+from api.model_serving.routers.model_router import createModelRouter, inference_executor_cache, call_log_buffer, model_registry, serving_metrics
+from api.model_serving.utils.model_registry import READY, EVICTED, FAILED
 
+from api.model_serving.config.config import getSettings
+from api.model_serving.aimodels.model_loaders import model_artifacts, feature_extractor_memos, load_model_v1, load_model_v2, load_model_v3
+from api.model_serving.storage.db_io import get_cache_stats
+from api.model_serving.models.response import CacheStats, CallLogBufferStats, FeatureMemoStats, ReadinessStatus
 
-base_dir = os.path.abspath(os.path.dirname(__file__))
-models_dir = os.path.join(base_dir, '..', '..', 'models')
 
 settings = getSettings()
 exposed_model_version_set = set(settings.model_versions.split(','))
@@ -40,40 +43,110 @@ app = FastAPI(
 # this is really a 'demo mode' thing which should be refined!
 permitReactLocalhostClient(app)
 
+
 # include router(s)
 if 'v1' in exposed_model_version_set:  # expose model v1 2019
-    #
-    from analysis.features1.feature1_extractor import Feature1Extractor
-    from api.model_serving.aimodels.RandomForestModel import RandomForestModel
-    #
-    model_v1 = RandomForestModel(
-        model_path=os.path.join(models_dir, 'model1_2019', 'model1.pkl'),
-        feature_extractor=Feature1Extractor(),
-        output_labels=['ham', 'spam'],
-    )
-    app.include_router(createModelRouter('v1', model_v1))
+    app.include_router(createModelRouter('v1', load_model_v1, model_artifacts['v1']))
 
 if 'v2' in exposed_model_version_set:  # expose model v2 2020
-    #
-    from analysis.features2.feature2_extractor import Feature2Extractor
-    from api.model_serving.aimodels.KerasLSTMModel import KerasLSTMModel
-    #
-    model_v2 = KerasLSTMModel(
-        model_path=os.path.join(models_dir, 'model2_2020', 'classifier', 'model2.h5'),
-        model_metadata_path=os.path.join(models_dir, 'model2_2020', 'classifier', 'model2_metadata.json'),
-        feature_extractor=Feature2Extractor(),
-    )
-    app.include_router(createModelRouter('v2', model_v2))
+    app.include_router(createModelRouter('v2', load_model_v2, model_artifacts['v2']))
 
 if 'v3' in exposed_model_version_set:  # expose model v3 2021
-    #
-    from analysis.features2.feature2_extractor import Feature2Extractor
-    from api.model_serving.aimodels.KerasLSTMModel import KerasLSTMModel
-    #
-    model_v3 = KerasLSTMModel(
-        model_path=os.path.join(models_dir, 'model3_2021', 'classifier', 'model3.h5'),
-        model_metadata_path=os.path.join(models_dir, 'model3_2021', 'classifier', 'model3_metadata.json'),
-        # the feature extractor is the same as "v2"
-        feature_extractor=Feature2Extractor(),
+    app.include_router(createModelRouter('v3', load_model_v3, model_artifacts['v3']))
+
+# model loading: 'eager' (right here), 'background' (at startup) or 'lazy' (on first use)
+if settings.model_loading == 'eager':
+    model_registry.load_all()
+
+
+@app.on_event('startup')
+def start_background_model_loading():
+    if settings.model_loading == 'background':
+        threading.Thread(target=model_registry.load_all, daemon=True).start()
+    if settings.model_loading != 'lazy':
+        # process pools: spawn the workers (each loading its model) right away
+        for executor in inference_executor_cache.values():
+            executor.start()
+    model_registry.start_watching()
+
+
+@app.get('/ready', response_model=ReadinessStatus)
+async def ready(response: Response):
+    """
+    Readiness probe: 503 until all models are loaded (unless loading is lazy),
+    or if any of them failed loading. Models evicted to stay within the
+    memory budget count as ready (they are reloaded on demand).
+    Versions served by a process pool are ready once all its workers are.
+    """
+    versions_status = model_registry.get_status()
+    pools_status = {
+        version: executor.get_status()
+        for version, executor in sorted(inference_executor_cache.items())
+    }
+    states = {v_status['state'] for v_status in versions_status.values() if v_status['in_process']}
+    pools_failed = any(p_status['error'] is not None for p_status in pools_status.values())
+    if settings.model_loading == 'lazy':
+        is_ready = FAILED not in states and not pools_failed
+    else:
+        is_ready = states <= {READY, EVICTED} and all(p_status['ready'] for p_status in pools_status.values())
+    if not is_ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return ReadinessStatus(
+        ready=is_ready,
+        memory_budget_mb=model_registry.memory_budget_bytes / 2**20,
+        resident_mb=model_registry.resident_bytes() / 2**20,
+        versions=versions_status,
+        inference_pools=pools_status,
     )
-    app.include_router(createModelRouter('v3', model_v3))
+
+
+@app.get('/cache_stats', response_model=CacheStats)
+async def cache_stats():
+    return get_cache_stats()
+
+
+@app.get('/feature_memo_stats', response_model=Dict[str, FeatureMemoStats])
+async def feature_memo_stats():
+    """
+    Hit rate (and size) of the feature-extraction memo, by feature set.
+    With a 'process' inference pool extraction happens in the pool
+    processes, whose memos are not reported here.
+    """
+    return {
+        feature_set: memo.get_stats()
+        for feature_set, memo in sorted(feature_extractor_memos.items())
+    }
+
+
+@app.get('/call_log_stats', response_model=CallLogBufferStats)
+async def call_log_stats():
+    if call_log_buffer is not None:
+        return CallLogBufferStats(enabled=True, **call_log_buffer.get_stats())
+    else:
+        return CallLogBufferStats(enabled=False)
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """
+    Latency histograms (per request and per stage), cache-lookup, error and
+    in-flight counters, in Prometheus text format (if SPAM_METRICS_ENABLED).
+    """
+    return PlainTextResponse(serving_metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+@app.on_event('shutdown')
+async def drain_call_log_buffer():
+    if call_log_buffer is not None:
+        await call_log_buffer.close()
+
+
+@app.on_event('shutdown')
+def stop_model_watcher():
+    model_registry.stop_watching()
+
+
+@app.on_event('shutdown')
+def shutdown_inference_executors():
+    for executor in inference_executor_cache.values():
+        executor.shutdown()
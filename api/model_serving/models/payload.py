@@ -1,6 +1,16 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from typing import List
 
+from api.model_serving.config.config import getSettings
+
+
+def _check_batch_size(items):
+    # each batch is also logged as a single call-log entry
+    max_items = getSettings().batch_max_items
+    if len(items) > max_items:
+        raise ValueError(f'at most {max_items} items per batch')
+    return items
+
 # request models
 
 class TextInput(BaseModel):
@@ -12,3 +22,17 @@ class FeatureInput(BaseModel):
     features: List[float]
     echo_input: bool = False
     skip_cache: bool = False
+
+class TextBatchInput(BaseModel):
+    texts: List[str]
+    echo_input: bool = False
+    skip_cache: bool = False
+
+    _check_texts = validator('texts', allow_reuse=True)(_check_batch_size)
+
+class FeatureBatchInput(BaseModel):
+    features: List[List[float]]
+    echo_input: bool = False
+    skip_cache: bool = False
+
+    _check_features = validator('features', allow_reuse=True)(_check_batch_size)
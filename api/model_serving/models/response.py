@@ -17,6 +17,10 @@ class PredictionResultFromText(BaseModel):
     prediction: Dict[str, float]
     top: Optional[PredictionTopInfo]
     from_cache: bool = False
+    # which stage of the text=>features=>prediction pipeline produced the result
+    # ('text_to_prediction_cache', 'features_to_prediction_cache' or 'model')
+    produced_by: Optional[str]
+    features_from_cache: Optional[bool]
 
 
 class PredictionResultFromFeatures(BaseModel):
@@ -24,3 +28,91 @@ class PredictionResultFromFeatures(BaseModel):
     prediction: Dict[str, float]
     top: Optional[PredictionTopInfo]
     from_cache: bool = False
+
+
+# batch results: items are in the same order as the inputs
+
+class FeaturesBatchResult(BaseModel):
+    results: List[FeaturesResult]
+
+
+class PredictionBatchResultFromText(BaseModel):
+    results: List[PredictionResultFromText]
+
+
+class PredictionBatchResultFromFeatures(BaseModel):
+    results: List[PredictionResultFromFeatures]
+
+
+class MicroBatchingStats(BaseModel):
+    enabled: bool
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    num_requests: int = 0
+    num_batches: int = 0
+    mean_batch_size: float = 0.0
+    batch_size_counts: Dict[int, int] = {}
+    max_batch_size: Optional[int]
+    max_wait_us: Optional[int]
+
+
+class CacheTierStats(BaseModel):
+    hits: int
+    misses: int
+    evictions: Optional[int]
+    expirations: Optional[int]
+    size: Optional[int]
+    max_size: Optional[int]
+
+
+class CacheStats(BaseModel):
+    l1: CacheTierStats
+    l2: CacheTierStats
+
+
+class FeatureMemoStats(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+
+class CallLogBufferStats(BaseModel):
+    enabled: bool
+    buffered: int = 0
+    enqueued: int = 0
+    dropped: int = 0
+    written: int = 0
+    failed: int = 0
+    flushes: int = 0
+
+
+class ModelLoadStatus(BaseModel):
+    state: str
+    in_process: bool
+    load_seconds: Optional[float]
+    error: Optional[str]
+    footprint_mb: Optional[float]
+    leases: int
+    retired_instances: int
+    loads: int
+    evictions: int
+    swaps: int
+
+
+class InferencePoolStatus(BaseModel):
+    pool_type: str
+    pool_size: int
+    workers_ready: int
+    ready: bool
+    error: Optional[str]
+
+
+class ReadinessStatus(BaseModel):
+    ready: bool
+    memory_budget_mb: float
+    resident_mb: float
+    versions: Dict[str, ModelLoadStatus]
+    inference_pools: Dict[str, InferencePoolStatus]
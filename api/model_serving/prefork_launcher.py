@@ -0,0 +1,161 @@
+"""
+Pre-fork launcher for the model serving API.
+
+    python -m api.model_serving.prefork_launcher [num_workers] [port] [host] [--per-worker]
+
+Running uvicorn with N workers spawns N fresh interpreters, each loading its
+own copy of every model and feature extractor. Here instead the parent imports
+the app and loads all models (and extractors) once, moves the model weights to
+shared memory where the backend allows it (see `share_memory` in the models),
+freezes the garbage collector (so that collections in the workers do not
+touch, and hence copy, the parent's objects) and only then forks the workers,
+which serve on the same listening socket and share all those read-only pages.
+
+Tensorflow is not fork-safe: the LSTM versions default to the NumPy backend
+here (unless SPAM_LSTM_BACKENDS is set explicitly).
+
+A memory report (RSS/PSS per process) is printed once all workers are up,
+and again whenever the parent receives SIGUSR1. With `--per-worker` each
+worker loads its own models after the fork instead, i.e. what plain uvicorn
+workers do: run both ways to compare.
+Crashed workers are replaced; SIGINT/SIGTERM to the parent stops them all.
+"""
+
+import gc
+import os
+import sys
+import signal
+import socket
+
+from api.model_serving.utils.process_memory import format_memory_report
+
+DEFAULT_NUM_WORKERS = 4
+DEFAULT_PORT = 8000
+DEFAULT_HOST = '127.0.0.1'
+
+
+def _bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _prepare_environment(preload):
+    # must happen before the app (and its settings) is imported
+    os.environ['SPAM_MODEL_LOADING'] = 'eager' if preload else 'lazy'
+    if 'SPAM_LSTM_BACKENDS' not in os.environ:
+        print('[prefork_launcher] Using the (fork-safe) numpy backend for the LSTM models')
+        os.environ['SPAM_LSTM_BACKENDS'] = 'v2:numpy,v3:numpy'
+
+
+def _share_models(model_registry):
+    for version in model_registry.in_process_versions():
+        with model_registry.lease(version) as model:
+            model.share_memory()
+
+
+def _run_worker(app, model_registry, sock, preload, ready_fd):
+    import uvicorn
+    #
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if not preload:
+        model_registry.load_all()
+    os.write(ready_fd, b'.')
+    os.close(ready_fd)
+    server = uvicorn.Server(uvicorn.Config(app, lifespan='on'))
+    server.run(sockets=[sock])
+
+
+def _fork_worker(app, model_registry, sock, preload):
+    """
+    Return (pid, fd to read the one-byte 'ready' signal from).
+    """
+    ready_r, ready_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(ready_r)
+        exit_code = 0
+        try:
+            _run_worker(app, model_registry, sock, preload, ready_w)
+        except Exception as e:
+            print(f'[prefork_launcher] Worker {os.getpid()} failed: {str(e)}')
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    os.close(ready_w)
+    return pid, ready_r
+
+
+def _wait_ready(ready_fd):
+    os.read(ready_fd, 1)
+    os.close(ready_fd)
+
+
+def run(num_workers, host, port, preload):
+    _prepare_environment(preload)
+    parent_pid = os.getpid()
+    # importing the app registers (and, with 'eager' loading, loads) the models
+    from api.model_serving.model_serving_api import app, model_registry
+    if preload:
+        _share_models(model_registry)
+        print(format_memory_report('parent, models loaded', [('parent', parent_pid)]))
+    gc.collect()
+    gc.freeze()
+    #
+    sock = _bind_socket(host, port)
+    workers = {}
+    for index in range(num_workers):
+        pid, ready_fd = _fork_worker(app, model_registry, sock, preload)
+        workers[pid] = index
+        _wait_ready(ready_fd)
+    print(f'[prefork_launcher] {num_workers} workers serving on http://{host}:{port}')
+
+    def _report(title):
+        print(format_memory_report(title, [('parent', parent_pid)] + [
+            (f'worker-{index}', pid)
+            for pid, index in sorted(workers.items(), key=lambda pid_index: pid_index[1])
+        ]))
+
+    _report('%s, all workers ready' % ('preloaded' if preload else 'per-worker loading'))
+    #
+    stopping = []
+
+    def _stop(signum, frame):
+        stopping.append(signum)
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: _report('on request'))
+    #
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = workers.pop(pid, None)
+        if index is not None and not stopping:
+            print(f'[prefork_launcher] Worker-{index} ({pid}) exited with status {status}, replacing it')
+            new_pid, ready_fd = _fork_worker(app, model_registry, sock, preload)
+            workers[new_pid] = index
+            _wait_ready(ready_fd)
+    sock.close()
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    run(
+        num_workers=int(args[0]) if len(args) > 0 else DEFAULT_NUM_WORKERS,
+        port=int(args[1]) if len(args) > 1 else DEFAULT_PORT,
+        host=args[2] if len(args) > 2 else DEFAULT_HOST,
+        preload='--per-worker' not in sys.argv[1:],
+    )
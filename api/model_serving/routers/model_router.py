@@ -1,15 +1,73 @@
+import json
+import base64
+import binascii
+import asyncio
+from datetime import datetime
+from collections import Counter
 from operator import itemgetter
-from fastapi import APIRouter, Depends, Request
-from typing import List
+from fastapi import APIRouter, Depends, Request, Response, Query, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Optional
 
+from api.model_serving.config.config import getSettings
 from api.model_serving.utils.db_dependency import g_get_session
-from api.model_serving.storage.db_io import store_cached_prediction, retrieve_cached_prediction, store_call_log_item, retrieve_call_log
+from api.model_serving.storage.db_connect import get_async_session
+from api.model_serving.storage.call_log_buffer import CallLogBuffer
+from api.model_serving.utils.micro_batching import MicroBatcher
+from api.model_serving.utils.executors import InferenceExecutor, parse_pool_specs
+from api.model_serving.utils.model_registry import ModelRegistry
+from api.model_serving.utils.metrics import ServingMetrics
+from api.model_serving.storage.db_io import (
+    store_cached_prediction,
+    retrieve_cached_prediction,
+    store_cached_predictions,
+    retrieve_cached_predictions,
+    store_call_log_item,
+    retrieve_call_log_page,
+    iterate_call_log,
+)
 
-from api.model_serving.models.payload import TextInput, FeatureInput
-from api.model_serving.models.response import FeaturesResult, PredictionResultFromText, PredictionResultFromFeatures
+from api.model_serving.models.payload import TextInput, FeatureInput, TextBatchInput, FeatureBatchInput
+from api.model_serving.models.response import (
+    FeaturesResult,
+    PredictionResultFromText,
+    PredictionResultFromFeatures,
+    FeaturesBatchResult,
+    PredictionBatchResultFromText,
+    PredictionBatchResultFromFeatures,
+    MicroBatchingStats,
+)
 from api.model_serving.models.call_log import CallLogEntry
 
-model_wrapper_cache = {}
+micro_batcher_cache = {}
+inference_executor_cache = {}
+pipeline_stats_cache = {}
+
+_settings = getSettings()
+serving_metrics = ServingMetrics(enabled=_settings.metrics_enabled)
+model_registry = ModelRegistry(
+    warmup_rounds=_settings.model_warmup_rounds,
+    memory_budget_bytes=_settings.model_memory_budget_mb * 2**20,
+    watch_interval_seconds=_settings.model_watch_interval_seconds,
+)
+
+if _settings.call_log_write_behind:
+    call_log_buffer = CallLogBuffer(
+        session_getter=get_async_session,
+        max_size=_settings.call_log_buffer_max_size,
+        flush_size=_settings.call_log_flush_size,
+        flush_interval_ms=_settings.call_log_flush_interval_ms,
+        drop_policy=_settings.call_log_drop_policy,
+    )
+else:
+    call_log_buffer = None
+
+
+# stage (for the metrics) of each model method, 'inference' if not listed
+_MODEL_METHOD_STAGES = {
+    'text_to_features': 'features',
+    'texts_to_features': 'features',
+}
 
 
 def _get_top_prediction(pred_dict):
@@ -27,7 +85,7 @@ def _get_top_prediction(pred_dict):
         }
 
 
-def _format_prediction(pred_dict, input, echo_input, from_cache, model_class):
+def _format_prediction(pred_dict, input, echo_input, from_cache, model_class, **pipeline_info):
     result = {
         **{
             'prediction': pred_dict,
@@ -35,6 +93,7 @@ def _format_prediction(pred_dict, input, echo_input, from_cache, model_class):
             'from_cache': from_cache,
         },
         **({'input': input} if echo_input else {}),
+        **pipeline_info,
     }
     return model_class(**result)
 
@@ -49,29 +108,253 @@ def _format_features(features, input, echo_input, from_cache):
     })
 
 
-def createModelRouter(version, model_wrapper):
+def _start_call_log(session, caller_id, endpoint, version, input):
+    """
+    Start recording a call and return an awaitable for its completion, so that
+    the log write can proceed concurrently with the rest of the request.
+    """
+    if call_log_buffer is not None:
+        # write-behind: the item is written later, in bulk
+        call_log_buffer.enqueue(caller_id, endpoint, version, input)
+        return asyncio.sleep(0)
+    else:
+        return serving_metrics.timed(
+            'call_log',
+            asyncio.ensure_future(store_call_log_item(session, caller_id, endpoint, version=version, input=input)),
+        )
+
+
+def _encode_cursor(paging_state):
+    return base64.urlsafe_b64encode(paging_state).decode() if paging_state is not None else None
+
+
+def _decode_cursor(cursor):
+    if cursor is None:
+        return None
+    try:
+        return base64.urlsafe_b64decode(cursor.encode())
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
+def _call_log_row_to_json(row):
+    # skipping pydantic altogether when streaming
+    return json.dumps({
+        'called_at': row.called_at.isoformat(),
+        'endpoint': row.endpoint,
+        'version': row.version,
+        'input_json': row.input_json,
+    })
+
+
+async def _resolve_batch(session, endpoint, version, inputs, skip_cache, compute_batch):
+    """
+    Common logic of the batch endpoints: look up all inputs in the cache
+    at once, feed only the misses to `compute_batch` (a single vectorized
+    call, an async function receiving and returning lists) and store the new results.
+    Returns a list of (output, from_cache) pairs in the order of `inputs`.
+    """
+    if skip_cache:
+        cached_list = [None for _ in inputs]
+    else:
+        with serving_metrics.stage('cache_lookup'):
+            cached_list = await retrieve_cached_predictions(session, endpoint, version=version, inputs=inputs)
+    #
+    miss_indices = [
+        idx
+        for idx, cached in enumerate(cached_list)
+        if not cached
+    ]
+    if not skip_cache:
+        serving_metrics.count_cache_lookups(endpoint, hits=len(inputs) - len(miss_indices), misses=len(miss_indices))
+    # identical inputs within a batch are computed only once
+    unique_misses = {}
+    for idx in miss_indices:
+        unique_misses.setdefault(json.dumps(inputs[idx]), inputs[idx])
+    miss_inputs = list(unique_misses.values())
+    if len(miss_inputs) > 0:
+        computed_list = await compute_batch(miss_inputs)
+        with serving_metrics.stage('cache_store'):
+            await store_cached_predictions(session, endpoint, version=version, inputs=miss_inputs, outputs=computed_list)
+    else:
+        computed_list = []
+    computed_map = dict(zip(unique_misses.keys(), computed_list))
+    #
+    results = [
+        (cached, True)
+        for cached in cached_list
+    ]
+    for idx in miss_indices:
+        results[idx] = (computed_map[json.dumps(inputs[idx])], False)
+    return results
+
+
+async def _text_to_prediction_pipeline(session, version, texts, skip_cache, compute_features, compute_predictions):
+    """
+    Text-to-prediction as a composition of cached stages:
+        1. text => prediction (the whole pipeline, from cache only);
+        2. text => features (from cache, or computed);
+        3. features => prediction (from cache, or computed).
+    Later stages run only for the inputs that missed the earlier ones:
+    a new text whose features are known does not need tokenizing, and many
+    different texts share the same feature vector (hence the same prediction).
+    Returns a list of (prediction, produced_by, features_from_cache), in input order,
+    where `produced_by` is the stage the prediction comes from.
+    """
+    if skip_cache:
+        cached_list = [None for _ in texts]
+    else:
+        with serving_metrics.stage('cache_lookup'):
+            cached_list = await retrieve_cached_predictions(session, 'text_to_prediction', version=version, inputs=texts)
+    results = [
+        (cached, 'text_to_prediction_cache', None)
+        for cached in cached_list
+    ]
+    miss_indices = [
+        idx
+        for idx, cached in enumerate(cached_list)
+        if not cached
+    ]
+    if not skip_cache:
+        serving_metrics.count_cache_lookups('text_to_prediction', hits=len(texts) - len(miss_indices), misses=len(miss_indices))
+    if len(miss_indices) == 0:
+        return results
+    miss_texts = [texts[idx] for idx in miss_indices]
+    #
+    features_resolved = await _resolve_batch(
+        session,
+        'text_to_features',
+        version=version,
+        inputs=miss_texts,
+        skip_cache=skip_cache,
+        compute_batch=compute_features,
+    )
+    # features are normalized to floats, as they would come to the features_to_prediction endpoint
+    predictions_resolved = await _resolve_batch(
+        session,
+        'features_to_prediction',
+        version=version,
+        inputs=[
+            [float(f) for f in features]
+            for features, _ in features_resolved
+        ],
+        skip_cache=skip_cache,
+        compute_batch=compute_predictions,
+    )
+    #
+    for idx, (_, features_from_cache), (prediction, prediction_from_cache) in zip(miss_indices, features_resolved, predictions_resolved):
+        produced_by = 'features_to_prediction_cache' if prediction_from_cache else 'model'
+        results[idx] = (prediction, produced_by, features_from_cache)
+    with serving_metrics.stage('cache_store'):
+        await store_cached_predictions(
+            session,
+            'text_to_prediction',
+            version=version,
+            inputs=miss_texts,
+            outputs=[results[idx][0] for idx in miss_indices],
+        )
+    return results
+
+
+def createModelRouter(version, model_loader, artifact_paths=()):
+    """
+    `model_loader` is a function returning the model wrapper
+    (a TextClassifierModel): it is called when the model is first needed
+    (and again after eviction, or when any of `artifact_paths` changes).
+    """
+
+    settings = getSettings()
+    pool_type, pool_size = parse_pool_specs(
+        settings.inference_pool_type,
+        settings.inference_pool_size,
+        settings.inference_pools,
+    )(version)
+    # process-pool workers load their own copy of the model: none needed here
+    model_registry.register(version, model_loader, artifact_paths, in_process=pool_type != 'process')
+    inference_executor_cache[version] = InferenceExecutor(
+        version,
+        model_leaser=lambda: model_registry.lease(version),
+        model_loader=model_loader,
+        pool_type=pool_type,
+        pool_size=pool_size,
+        warmup_rounds=settings.model_warmup_rounds,
+    )
+
+    def _on_registry_event(event_version, event):
+        # process-pool workers hold their own copy: replace them when the artifacts
+        # change (see InferenceExecutor.recycle). An eviction only concerns this process
+        if event_version == version and event != 'evict':
+            inference_executor_cache[version].recycle()
+
+    model_registry.add_listener(_on_registry_event)
+
+    async def _call_model(method_name, *args):
+        # all model code runs through this version's executor
+        with serving_metrics.stage(_MODEL_METHOD_STAGES.get(method_name, 'inference')):
+            return await inference_executor_cache[version].call(method_name, *args)
+
+    pipeline_stats_cache[version] = Counter()
+
+    if version in set(settings.micro_batching_versions.split(',')):
+        print(f'[createModelRouter] Micro-batching enabled for "{version}"')
+        micro_batcher_cache[version] = MicroBatcher(
+            # the whole batch (incl. labeling) runs on the same model instance.
+            # Not timed here: the batch worker does not belong to any one request
+            batch_function=lambda features_list: inference_executor_cache[version].call('features_to_predictions', features_list),
+            max_batch_size=settings.micro_batching_max_batch_size,
+            max_wait_us=settings.micro_batching_max_wait_us,
+        )
+
+    async def _features_to_prediction(features):
+        # single-item predictions go through the micro-batcher, if any
+        if version in micro_batcher_cache:
+            with serving_metrics.stage('inference'):
+                return await micro_batcher_cache[version].submit(features)
+        else:
+            return await _call_model('features_to_prediction', features)
 
-    model_wrapper_cache[version] = model_wrapper
+    async def _features_to_predictions_single(features_list):
+        # compute function for the single-item text_to_prediction pipeline
+        return await asyncio.gather(*(
+            _features_to_prediction(features)
+            for features in features_list
+        ))
+
+    def _pipeline_info(produced_by, features_from_cache):
+        pipeline_stats_cache[version][produced_by] += 1
+        if features_from_cache is not None:
+            pipeline_stats_cache[version]['features_from_cache' if features_from_cache else 'features_computed'] += 1
+        return {
+            'produced_by': produced_by,
+            'features_from_cache': features_from_cache,
+        }
 
     modelRouter = APIRouter(
         prefix='/model/%s' % version,
+        route_class=serving_metrics.route_class(version),
     )
 
     @modelRouter.post('/text_to_features', response_model=FeaturesResult, tags=[version])
     async def serve_text_to_features(params: TextInput, request: Request, session=Depends(g_get_session)):
+        caller_id = request.client[0]
+        call_logged = _start_call_log(session, caller_id, 'text_to_features', version=version, input=params.text)
         # try cache:
-        cached = None if params.skip_cache else retrieve_cached_prediction(session, 'text_to_features', version=version, input=params.text)
+        if params.skip_cache:
+            cached = None
+        else:
+            with serving_metrics.stage('cache_lookup'):
+                cached = await retrieve_cached_prediction(session, 'text_to_features', version=version, input=params.text)
+            serving_metrics.count_cache_lookups('text_to_features', hits=int(bool(cached)), misses=int(not cached))
         # act accordingly
         if cached:
             features = cached
             from_cache = True
         else:
-            features = model_wrapper_cache[version].text_to_features(params.text)
+            features = await _call_model('text_to_features', params.text)
             from_cache = False
-            store_cached_prediction(session, 'text_to_features', version=version, input=params.text, output=features)
-        #
-        caller_id = request.client[0]
-        store_call_log_item(session, caller_id, 'text_to_features', version=version, input=params.text)
+            with serving_metrics.stage('cache_store'):
+                await store_cached_prediction(session, 'text_to_features', version=version, input=params.text, output=features)
+        await call_logged
         return _format_features(
             features=features,
             input=params.text,
@@ -81,19 +364,25 @@ def createModelRouter(version, model_wrapper):
 
     @modelRouter.post('/features_to_prediction', response_model=PredictionResultFromFeatures, tags=[version])
     async def serve_features_to_prediction(params: FeatureInput, request: Request, session=Depends(g_get_session)):
+        caller_id = request.client[0]
+        call_logged = _start_call_log(session, caller_id, 'features_to_prediction', version=version, input=params.features)
         # try cache:
-        cached = None if params.skip_cache else retrieve_cached_prediction(session, 'features_to_prediction', version=version, input=params.features)
+        if params.skip_cache:
+            cached = None
+        else:
+            with serving_metrics.stage('cache_lookup'):
+                cached = await retrieve_cached_prediction(session, 'features_to_prediction', version=version, input=params.features)
+            serving_metrics.count_cache_lookups('features_to_prediction', hits=int(bool(cached)), misses=int(not cached))
         # act accordingly
         if cached:
             prediction_dict = cached
             from_cache = True
         else:
-            prediction_dict = model_wrapper_cache[version].features_to_prediction(params.features)
+            prediction_dict = await _features_to_prediction(params.features)
             from_cache = False
-            store_cached_prediction(session, 'features_to_prediction', version=version, input=params.features, output=prediction_dict)
-        #
-        caller_id = request.client[0]
-        store_call_log_item(session, caller_id, 'features_to_prediction', version=version, input=params.features)
+            with serving_metrics.stage('cache_store'):
+                await store_cached_prediction(session, 'features_to_prediction', version=version, input=params.features, output=prediction_dict)
+        await call_logged
         return _format_prediction(
             prediction_dict,
             params.features,
@@ -104,29 +393,141 @@ def createModelRouter(version, model_wrapper):
 
     @modelRouter.post('/text_to_prediction', response_model=PredictionResultFromText, tags=[version])
     async def serve_text_to_prediction(params: TextInput, request: Request, session=Depends(g_get_session)):
-        # try cache:
-        cached = None if params.skip_cache else retrieve_cached_prediction(session, 'text_to_prediction', version=version, input=params.text)
-        # act accordingly
-        if cached:
-            prediction_dict = cached
-            from_cache = True
-        else:
-            prediction_dict = model_wrapper_cache[version].text_to_prediction(params.text)
-            from_cache = False
-            store_cached_prediction(session, 'text_to_prediction', version=version, input=params.text, output=prediction_dict)
         caller_id = request.client[0]
-        store_call_log_item(session, caller_id, 'text_to_features', version=version, input=params.text)
+        call_logged = _start_call_log(session, caller_id, 'text_to_prediction', version=version, input=params.text)
+        [(prediction_dict, produced_by, features_from_cache)] = await _text_to_prediction_pipeline(
+            session,
+            version,
+            texts=[params.text],
+            skip_cache=params.skip_cache,
+            compute_features=lambda texts: _call_model('texts_to_features', texts),
+            compute_predictions=_features_to_predictions_single,
+        )
+        await call_logged
         return _format_prediction(
             prediction_dict,
             params.text,
             params.echo_input,
-            from_cache=from_cache,
+            from_cache=produced_by != 'model',
             model_class=PredictionResultFromText,
+            **_pipeline_info(produced_by, features_from_cache),
         )
 
+    @modelRouter.post('/text_to_features_batch', response_model=FeaturesBatchResult, tags=[version])
+    async def serve_text_to_features_batch(params: TextBatchInput, request: Request, session=Depends(g_get_session)):
+        caller_id = request.client[0]
+        call_logged = _start_call_log(session, caller_id, 'text_to_features_batch', version=version, input=params.texts)
+        resolved = await _resolve_batch(
+            session,
+            'text_to_features',
+            version=version,
+            inputs=params.texts,
+            skip_cache=params.skip_cache,
+            compute_batch=lambda texts: _call_model('texts_to_features', texts),
+        )
+        await call_logged
+        return FeaturesBatchResult(results=[
+            _format_features(
+                features=features,
+                input=text,
+                echo_input=params.echo_input,
+                from_cache=from_cache,
+            )
+            for text, (features, from_cache) in zip(params.texts, resolved)
+        ])
+
+    @modelRouter.post('/features_to_prediction_batch', response_model=PredictionBatchResultFromFeatures, tags=[version])
+    async def serve_features_to_prediction_batch(params: FeatureBatchInput, request: Request, session=Depends(g_get_session)):
+        caller_id = request.client[0]
+        call_logged = _start_call_log(session, caller_id, 'features_to_prediction_batch', version=version, input=params.features)
+        resolved = await _resolve_batch(
+            session,
+            'features_to_prediction',
+            version=version,
+            inputs=params.features,
+            skip_cache=params.skip_cache,
+            compute_batch=lambda features_list: _call_model('features_to_predictions', features_list),
+        )
+        await call_logged
+        return PredictionBatchResultFromFeatures(results=[
+            _format_prediction(
+                prediction_dict,
+                features,
+                params.echo_input,
+                from_cache=from_cache,
+                model_class=PredictionResultFromFeatures,
+            )
+            for features, (prediction_dict, from_cache) in zip(params.features, resolved)
+        ])
+
+    @modelRouter.post('/text_to_prediction_batch', response_model=PredictionBatchResultFromText, tags=[version])
+    async def serve_text_to_prediction_batch(params: TextBatchInput, request: Request, session=Depends(g_get_session)):
+        caller_id = request.client[0]
+        call_logged = _start_call_log(session, caller_id, 'text_to_prediction_batch', version=version, input=params.texts)
+        resolved = await _text_to_prediction_pipeline(
+            session,
+            version,
+            texts=params.texts,
+            skip_cache=params.skip_cache,
+            compute_features=lambda texts: _call_model('texts_to_features', texts),
+            compute_predictions=lambda features_list: _call_model('features_to_predictions', features_list),
+        )
+        await call_logged
+        return PredictionBatchResultFromText(results=[
+            _format_prediction(
+                prediction_dict,
+                text,
+                params.echo_input,
+                from_cache=produced_by != 'model',
+                model_class=PredictionResultFromText,
+                **_pipeline_info(produced_by, features_from_cache),
+            )
+            for text, (prediction_dict, produced_by, features_from_cache) in zip(params.texts, resolved)
+        ])
+
     @modelRouter.get('/recent_call_log', response_model=List[CallLogEntry], tags=[version])
-    async def get_call_log(request: Request, session=Depends(g_get_session)):
+    async def get_call_log(
+        request: Request,
+        response: Response,
+        limit: int = Query(settings.call_log_default_page_size, ge=1, le=settings.call_log_max_page_size),
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        stream: bool = False,
+        session=Depends(g_get_session),
+    ):
+        """
+        Return (at most) `limit` call-log entries with `since <= called_at <= until`.
+        If there are more, the `X-Next-Cursor` response header holds a cursor
+        to pass to the next call (with the same other parameters) to get the next page.
+        With `stream=true`, all entries (from the cursor on, if given) are sent instead,
+        as newline-delimited JSON, reading them from the DB `limit` at a time.
+        """
         caller_id = request.client[0]
-        return retrieve_call_log(session, caller_id, version)
+        paging_state = _decode_cursor(cursor)
+        if stream:
+            async def _ndjson_lines():
+                async for row in iterate_call_log(session, caller_id, version, since, until, limit, paging_state):
+                    yield _call_log_row_to_json(row) + '\n'
+            return StreamingResponse(_ndjson_lines(), media_type='application/x-ndjson')
+        else:
+            rows, next_paging_state = await retrieve_call_log_page(session, caller_id, version, since, until, limit, paging_state)
+            if next_paging_state is not None:
+                response.headers['X-Next-Cursor'] = _encode_cursor(next_paging_state)
+            return [
+                CallLogEntry(**row._asdict())
+                for row in rows
+            ]
+
+    @modelRouter.get('/pipeline_stats', response_model=Dict[str, int], tags=[version])
+    async def get_pipeline_stats():
+        return pipeline_stats_cache[version]
+
+    @modelRouter.get('/micro_batching_stats', response_model=MicroBatchingStats, tags=[version])
+    async def get_micro_batching_stats():
+        if version in micro_batcher_cache:
+            return MicroBatchingStats(enabled=True, **micro_batcher_cache[version].get_stats())
+        else:
+            return MicroBatchingStats(enabled=False)
 
     return modelRouter
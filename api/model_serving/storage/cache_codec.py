@@ -0,0 +1,142 @@
+"""
+Encoding of the prediction-cache entries in the database.
+
+Two table layouts are supported:
+
+- "json" (legacy), table `model_serving_api_cache`: the partition key
+  contains the full `json.dumps(input)` string, and outputs are stored as JSON text;
+- "digest", table `model_serving_api_cache_by_digest`: the partition key
+  contains a fixed-size (16-byte) digest of a canonical binary encoding
+  of the input, and outputs are stored as packed binary blobs.
+  The canonical input itself can be stored alongside, to detect
+  (astronomically unlikely) digest collisions on read.
+
+Canonical/packed encodings (all little-endian):
+
+- text:            b'T' + utf-8 bytes;
+- numeric vector:  b'h' + int16 values (if all integral and in range),
+                   or b'd' + float64 values otherwise;
+- prediction dict: b'P' + uint8 label count + (uint8 length + utf-8 label) per
+                   label + float64 values in the same order.
+"""
+
+import json
+import struct
+import hashlib
+
+
+DIGEST_SIZE = 16
+_INT16_MIN, _INT16_MAX = -2 ** 15, 2 ** 15 - 1
+
+
+def _is_int16(value):
+    return float(value).is_integer() and _INT16_MIN <= value <= _INT16_MAX
+
+
+def encode_value(value):
+    if isinstance(value, str):
+        return b'T' + value.encode('utf-8')
+    elif isinstance(value, dict):
+        labels = list(value.keys())
+        header = b'P' + struct.pack('<B', len(labels)) + b''.join(
+            struct.pack('<B', len(enc_label)) + enc_label
+            for enc_label in (label.encode('utf-8') for label in labels)
+        )
+        return header + struct.pack(f'<{len(labels)}d', *(float(value[label]) for label in labels))
+    else:
+        # a vector of numbers
+        if all(_is_int16(v) for v in value):
+            return b'h' + struct.pack(f'<{len(value)}h', *(int(v) for v in value))
+        else:
+            return b'd' + struct.pack(f'<{len(value)}d', *(float(v) for v in value))
+
+
+def decode_value(blob):
+    tag, body = blob[:1], blob[1:]
+    if tag == b'T':
+        return body.decode('utf-8')
+    elif tag == b'h':
+        return list(struct.unpack(f'<{len(body) // 2}h', body))
+    elif tag == b'd':
+        return list(struct.unpack(f'<{len(body) // 8}d', body))
+    elif tag == b'P':
+        num_labels = body[0]
+        offset = 1
+        labels = []
+        for _ in range(num_labels):
+            label_len = body[offset]
+            labels.append(body[offset + 1: offset + 1 + label_len].decode('utf-8'))
+            offset += 1 + label_len
+        values = struct.unpack(f'<{num_labels}d', body[offset:])
+        return dict(zip(labels, values))
+    else:
+        raise ValueError(f'Unknown cache value tag {tag}')
+
+
+def input_digest(canonical_input):
+    return hashlib.blake2b(canonical_input, digest_size=DIGEST_SIZE).digest()
+
+
+class JsonCacheLayout():
+
+    table = 'model_serving_api_cache'
+    select_cql = 'SELECT output_json FROM model_serving_api_cache WHERE endpoint=? AND version=? AND input_json=?;'
+    insert_cql = 'INSERT INTO model_serving_api_cache (endpoint, version, input_json, output_json) VALUES (?, ?, ?, ?);'
+
+    def input_key(self, input):
+        return json.dumps(input)
+
+    def select_params(self, endpoint, version, input_key):
+        return (endpoint, version, input_key)
+
+    def insert_params(self, endpoint, version, input_key, output):
+        return (endpoint, version, input_key, json.dumps(output))
+
+    def decode_row(self, row, input_key):
+        return json.loads(row.output_json)
+
+
+class DigestCacheLayout():
+
+    table = 'model_serving_api_cache_by_digest'
+
+    def __init__(self, collision_check):
+        self.collision_check = collision_check
+        if collision_check:
+            self.select_cql = 'SELECT input_blob, output_blob FROM model_serving_api_cache_by_digest WHERE endpoint=? AND version=? AND input_digest=?;'
+        else:
+            self.select_cql = 'SELECT output_blob FROM model_serving_api_cache_by_digest WHERE endpoint=? AND version=? AND input_digest=?;'
+        self.insert_cql = 'INSERT INTO model_serving_api_cache_by_digest (endpoint, version, input_digest, input_blob, output_blob) VALUES (?, ?, ?, ?, ?);'
+
+    def input_key(self, input):
+        # the key is a (digest, canonical_input) pair: only the former goes to the partition key
+        canonical_input = encode_value(input)
+        return (input_digest(canonical_input), canonical_input)
+
+    def select_params(self, endpoint, version, input_key):
+        return (endpoint, version, input_key[0])
+
+    def insert_params(self, endpoint, version, input_key, output):
+        return (
+            endpoint,
+            version,
+            input_key[0],
+            input_key[1] if self.collision_check else None,
+            encode_value(output),
+        )
+
+    def decode_row(self, row, input_key):
+        # None signals a digest collision, i.e. a cache miss
+        if self.collision_check and row.input_blob is not None and bytes(row.input_blob) != input_key[1]:
+            print('[DigestCacheLayout] Digest collision detected, treating as a miss.')
+            return None
+        return decode_value(bytes(row.output_blob))
+
+
+def get_cache_layout(layout_name, collision_check):
+    if layout_name == 'json':
+        return JsonCacheLayout()
+    elif layout_name == 'digest':
+        return DigestCacheLayout(collision_check=collision_check)
+    else:
+        raise ValueError(f'Unknown cache layout "{layout_name}"')
@@ -0,0 +1,112 @@
+"""
+Write-behind buffer for the call log.
+
+Instead of writing each call-log item to the database before responding,
+the endpoints just append it to an in-memory buffer. A background task
+flushes the buffer whenever it reaches a given size or a given time has
+passed since the last flush, writing all pending items at once
+(grouped by partition, see `store_call_log_items`).
+
+If the buffer is full (e.g. the database is slow or unreachable), the
+drop policy decides which items are lost: 'drop_newest' refuses the new
+item, 'drop_oldest' makes room by discarding the oldest pending one.
+On shutdown, `close` drains whatever is still in the buffer.
+"""
+
+import asyncio
+from collections import deque
+from datetime import datetime
+
+from api.model_serving.storage.db_io import store_call_log_items
+
+DROP_POLICIES = {'drop_newest', 'drop_oldest'}
+
+
+class CallLogBuffer():
+
+    def __init__(self, session_getter, max_size, flush_size, flush_interval_ms, drop_policy):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f'Unknown call-log drop policy "{drop_policy}"')
+        self.session_getter = session_getter
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval_s = flush_interval_ms / 1000
+        self.drop_policy = drop_policy
+        #
+        self.items = deque()
+        self.flush_requested = None
+        self.worker = None
+        self.closing = False
+        # statistics
+        self.num_enqueued = 0
+        self.num_dropped = 0
+        self.num_written = 0
+        self.num_failed = 0
+        self.num_flushes = 0
+
+    def _ensure_worker(self):
+        if self.worker is None or self.worker.done():
+            self.flush_requested = asyncio.Event()
+            self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    def enqueue(self, caller_id, endpoint, version, input):
+        """
+        Record a call (timestamped now) for later writing. Never blocks.
+        """
+        if self.closing:
+            self.num_dropped += 1
+            return
+        self._ensure_worker()
+        if len(self.items) >= self.max_size:
+            self.num_dropped += 1
+            if self.drop_policy == 'drop_newest':
+                return
+            else:
+                self.items.popleft()
+        self.items.append((caller_id, datetime.now(), endpoint, version, input))
+        self.num_enqueued += 1
+        if len(self.items) >= self.flush_size:
+            self.flush_requested.set()
+
+    async def flush(self):
+        if len(self.items) == 0:
+            return
+        batch = list(self.items)
+        self.items.clear()
+        self.num_flushes += 1
+        num_failed = await store_call_log_items(self.session_getter(), batch)
+        self.num_written += len(batch) - num_failed
+        self.num_failed += num_failed
+
+    async def _run(self):
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.flush_requested.wait(), self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f'[CallLogBuffer] Flush failed: {str(e)}')
+
+    async def close(self):
+        """
+        Stop the background flushing and drain the buffer.
+        """
+        self.closing = True
+        if self.worker is not None and not self.worker.done():
+            # wake the worker up: it completes a last flush and exits
+            self.flush_requested.set()
+            await self.worker
+        await self.flush()
+
+    def get_stats(self):
+        return {
+            'buffered': len(self.items),
+            'enqueued': self.num_enqueued,
+            'dropped': self.num_dropped,
+            'written': self.num_written,
+            'failed': self.num_failed,
+            'flushes': self.num_flushes,
+        }
@@ -1,16 +1,66 @@
 """
 These functions wrap CQL queries to store and retrieve specific
 kind of items from database tables. These are for direct use by the API code.
+They are coroutines, to be awaited, and expect an `AsyncSession`
+(see api/tools/async_cassandra.py) in place of the driver's Session.
 
 This module, crucially, holds a process-wide (lazy) cache of CQL
 prepared statements, which are used over and over to optimize the API
 performance.
+
+The cached predictions are stored in two tiers: a bounded in-memory
+cache (L1, one per process) in front of the database table (L2). L2 hits
+populate L1, and writes go to both. The layout of the L2 table (keys and
+value encoding) is chosen in the settings, see `cache_codec.py`.
 """
 
 import json
+import asyncio
+from collections import Counter
 from datetime import datetime
+from cassandra.query import BatchStatement, BatchType
 
+from api.model_serving.config.config import getSettings
 from api.model_serving.models.call_log import CallLogEntry
+from api.model_serving.storage.memory_cache import MemoryCache
+from api.model_serving.storage.cache_codec import get_cache_layout
+
+
+_settings = getSettings()
+l1_cache = MemoryCache(
+    max_size=_settings.l1_cache_max_size,
+    ttl_seconds=_settings.l1_cache_ttl_seconds,
+)
+l2_cache_stats = Counter()
+# failed writes (swallowed, see below), by kind: 'cache', 'call_log'
+write_failure_stats = Counter()
+cache_layout = get_cache_layout(
+    _settings.cache_layout,
+    collision_check=_settings.cache_collision_check,
+)
+
+# revision of the outputs of a model version, bumped whenever they change
+# (2 for "v1": class probabilities instead of a one-hot vector), so that
+# entries cached before are never served again: they are simply not found
+CACHE_OUTPUT_REVISIONS = {
+    'v1': 2,
+}
+
+
+def _cache_version(version):
+    # the value of the 'version' key column in the cache
+    revision = CACHE_OUTPUT_REVISIONS.get(version)
+    return version if revision is None else f'{version}@r{revision}'
+
+
+def get_cache_stats():
+    return {
+        'l1': l1_cache.get_stats(),
+        'l2': {
+            'hits': l2_cache_stats['hits'],
+            'misses': l2_cache_stats['misses'],
+        },
+    }
 
 
 prepared_cache = {}
@@ -28,57 +78,168 @@ def get_prepared_statement(session, stmt):
     return prepared_cache[stmt]
 
 
-def retrieve_cached_prediction(session, endpoint, version, input):
+async def retrieve_cached_prediction(session, endpoint, version, input):
     try:
-        input_json = json.dumps(input)
-        get_one_cql = 'SELECT output_json FROM model_serving_api_cache WHERE endpoint=? AND version=? AND input_json=?;'
-        prepared_get_one = get_prepared_statement(session, get_one_cql)
-        row = session.execute(prepared_get_one, (endpoint, version, input_json)).one()
-        if row:
-            return json.loads(row.output_json)
+        cache_version = _cache_version(version)
+        input_key = cache_layout.input_key(input)
+        l1_cached = l1_cache.get((endpoint, cache_version, input_key))
+        if l1_cached is not None:
+            return l1_cached
+        prepared_get_one = get_prepared_statement(session, cache_layout.select_cql)
+        row = await session.execute_one(prepared_get_one, cache_layout.select_params(endpoint, cache_version, input_key))
+        output = cache_layout.decode_row(row, input_key) if row else None
+        if output is not None:
+            l2_cache_stats['hits'] += 1
+            l1_cache.put((endpoint, cache_version, input_key), output)
         else:
-            return row
+            l2_cache_stats['misses'] += 1
+        return output
     except Exception as e:
         print('[retrieve_cached_prediction] Cache-read operation failed. Make sure cache table exists.')
         return None
 
 
-def store_cached_prediction(session, endpoint, version, input, output):
+async def store_cached_prediction(session, endpoint, version, input, output):
     """
     Here the input and output are serialized before insertion
+    (how, depends on the cache layout)
     """
     try:
-        input_json = json.dumps(input)
-        output_json = json.dumps(output)
-        insert_cql = 'INSERT INTO model_serving_api_cache (endpoint, version, input_json, output_json) VALUES (?, ?, ?, ?);'
-        prepared_insert_cql = get_prepared_statement(session, insert_cql)
-        session.execute(prepared_insert_cql, (endpoint, version, input_json, output_json))
+        cache_version = _cache_version(version)
+        input_key = cache_layout.input_key(input)
+        l1_cache.put((endpoint, cache_version, input_key), output)
+        prepared_insert_cql = get_prepared_statement(session, cache_layout.insert_cql)
+        await session.execute(prepared_insert_cql, cache_layout.insert_params(endpoint, cache_version, input_key, output))
         return
     except Exception as e:
+        write_failure_stats['cache'] += 1
         print('[store_cached_prediction] Cache-write operation failed. Make sure cache table exists.')
 
 
-def store_call_log_item(session, caller_id, endpoint, version, input):
+async def retrieve_cached_predictions(session, endpoint, version, inputs):
+    """
+    Batch version of `retrieve_cached_prediction`: one lookup per input is
+    issued concurrently (each input is a separate partition) and the results
+    are collected afterwards.
+    Returns a list aligned with `inputs`, with None for each cache miss.
+    """
+    return await asyncio.gather(*(
+        retrieve_cached_prediction(session, endpoint, version, input)
+        for input in inputs
+    ))
+
+
+async def store_cached_predictions(session, endpoint, version, inputs, outputs):
+    """
+    Batch version of `store_cached_prediction`: the writes are issued
+    concurrently and then awaited all together.
+    """
+    await asyncio.gather(*(
+        store_cached_prediction(session, endpoint, version, input, output)
+        for input, output in zip(inputs, outputs)
+    ))
+
+
+async def store_call_log_item(session, caller_id, endpoint, version, input):
     try:
         input_json = json.dumps(input)
         called_at = datetime.now()
         insert_cql = 'INSERT INTO spam_calls_log (caller_id, called_at, endpoint, version, input_json) VALUES (?, ?, ?, ?, ?);'
         prepared_insert_cql = get_prepared_statement(session, insert_cql)
-        session.execute(prepared_insert_cql, (caller_id, called_at, endpoint, version, input_json))
+        await session.execute(prepared_insert_cql, (caller_id, called_at, endpoint, version, input_json))
         return
     except Exception as e:
+        write_failure_stats['call_log'] += 1
         print('[store_call_log_item] Call-log-write operation failed. Make sure call-log table exists.')
 
 
-def retrieve_call_log(session, caller_id, version):
+async def store_call_log_items(session, items, max_batch_size=50):
+    """
+    Bulk write of call-log items, given as
+    (caller_id, called_at, endpoint, version, input) tuples.
+    The items are grouped by partition, i.e. (caller_id, version): each
+    group is written as (one or more) single-partition unlogged batches,
+    and all batches are issued concurrently.
+    Returns the number of items that could not be written.
+    """
     try:
-        get_many_cql = 'SELECT called_at, endpoint, version, input_json FROM spam_calls_log WHERE caller_id=? AND version=?;'
+        insert_cql = 'INSERT INTO spam_calls_log (caller_id, called_at, endpoint, version, input_json) VALUES (?, ?, ?, ?, ?);'
+        prepared_insert_cql = get_prepared_statement(session, insert_cql)
+        partitions = {}
+        for caller_id, called_at, endpoint, version, input in items:
+            partitions.setdefault((caller_id, version), []).append(
+                (caller_id, called_at, endpoint, version, json.dumps(input))
+            )
+        #
+        batches = []
+        for partition_items in partitions.values():
+            for offset in range(0, len(partition_items), max_batch_size):
+                batch_items = partition_items[offset: offset + max_batch_size]
+                batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+                for params in batch_items:
+                    batch.add(prepared_insert_cql, params)
+                batches.append((len(batch_items), batch))
+    except Exception as e:
+        write_failure_stats['call_log'] += len(items)
+        print('[store_call_log_items] Call-log-write operation failed. Make sure call-log table exists.')
+        return len(items)
+    #
+    outcomes = await asyncio.gather(
+        *(
+            session.execute(batch)
+            for _, batch in batches
+        ),
+        return_exceptions=True,
+    )
+    num_failed = sum(
+        batch_size
+        for (batch_size, _), outcome in zip(batches, outcomes)
+        if isinstance(outcome, Exception)
+    )
+    if num_failed > 0:
+        write_failure_stats['call_log'] += num_failed
+        print(f'[store_call_log_items] {num_failed} call-log items could not be written.')
+    return num_failed
+
+
+# open-ended time bounds for the call-log queries
+CALL_LOG_MIN_TIME = datetime(1970, 1, 1)
+CALL_LOG_MAX_TIME = datetime(9999, 12, 31)
+
+
+async def retrieve_call_log_page(session, caller_id, version, since, until, page_size, paging_state=None):
+    """
+    Read one page of the call log, restricted to `since <= called_at <= until`
+    (None meaning no bound). Returns a (rows, next_paging_state) pair, the latter being
+    None when there are no more pages. Rows are returned as they come from the driver.
+    """
+    try:
+        get_many_cql = 'SELECT called_at, endpoint, version, input_json FROM spam_calls_log WHERE caller_id=? AND version=? AND called_at>=? AND called_at<=?;'
         prepared_get_many_cql = get_prepared_statement(session, get_many_cql)
-        log_entries = session.execute(prepared_get_many_cql, (caller_id, version))
-        return (
-            CallLogEntry(**row._asdict())
-            for row in log_entries
+        return await session.execute_page(
+            prepared_get_many_cql,
+            (
+                caller_id,
+                version,
+                since if since is not None else CALL_LOG_MIN_TIME,
+                until if until is not None else CALL_LOG_MAX_TIME,
+            ),
+            fetch_size=page_size,
+            paging_state=paging_state,
         )
     except Exception as e:
-        print('[retrieve_call_log] Call-log-read operation failed. Make sure call-log table exists.')
-        return []
+        print('[retrieve_call_log_page] Call-log-read operation failed. Make sure call-log table exists.')
+        return [], None
+
+
+async def iterate_call_log(session, caller_id, version, since, until, page_size, paging_state=None):
+    """
+    Asynchronously yield all call-log rows in the time range, fetching
+    one page at a time (hence holding at most a page in memory).
+    """
+    while True:
+        rows, paging_state = await retrieve_call_log_page(session, caller_id, version, since, until, page_size, paging_state)
+        for row in rows:
+            yield row
+        if paging_state is None:
+            return
@@ -0,0 +1,227 @@
+"""
+Execution layer for the (blocking) model code.
+
+Feature extraction and inference are CPU-bound, synchronous calls: running
+them directly in the `async` endpoint handlers would stall the event loop,
+and with it every other request on the same worker. Here each model version
+gets its own pool (of threads or of processes) and the handlers `await`
+the model methods through it.
+
+Process pools are created with the "spawn" start method: forking the API
+process (already running the event loop, the registry watcher, the driver
+and TensorFlow threads) could leave the workers with locks held forever.
+Each worker loads and warms up its own copy of the model, once, with the
+version's (importable, hence picklable) loader, and never touches the model
+registry; only the method name and the arguments/results cross the process
+boundary. Such versions are not loaded in the API process at all.
+`start` spawns all the workers of a pool at once, so that no request pays
+for a model load, and `get_status` tells how many of them are ready.
+When the artifacts of the model change, the process pool is recycled (see
+`recycle`), and the new workers load the current artifacts.
+"""
+
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from api.model_serving.utils.model_registry import warm_up_model
+
+
+POOL_TYPES = {'none', 'thread', 'process'}
+
+# in a process-pool worker: its model and the pool's ready-worker counter, set by `_init_worker`
+_worker_model = None
+_workers_ready = None
+
+
+def _init_worker(model_loader, warmup_rounds, workers_ready):
+    global _worker_model, _workers_ready
+    _worker_model = model_loader()
+    warm_up_model(_worker_model, warmup_rounds)
+    _workers_ready = workers_ready
+    with workers_ready.get_lock():
+        workers_ready.value += 1
+
+
+def _wait_for_workers(pool_size):
+    # one such call per worker of a new pool: each keeps its worker busy until
+    # all are ready, so that the calls land on distinct workers
+    while _workers_ready.value < pool_size:
+        time.sleep(0.01)
+
+
+def _call_model_in_worker(method_name, args):
+    return getattr(_worker_model, method_name)(*args)
+
+
+def _call_leased_model(model_leaser, method_name, args):
+    with model_leaser() as model:
+        return getattr(model, method_name)(*args)
+
+
+def parse_pool_specs(default_type, default_size, overrides):
+    """
+    Build a {version: (pool_type, pool_size)} map from the overrides string,
+    in the form "v1:thread:2,v3:process:4". Versions not listed there
+    get (default_type, default_size) through the `get` method of the result.
+    """
+    specs = {}
+    for spec in overrides.split(','):
+        if spec.strip() == '':
+            continue
+        version, pool_type, pool_size = spec.strip().split(':')
+        specs[version] = (pool_type, int(pool_size))
+    for pool_type, _ in list(specs.values()) + [(default_type, default_size)]:
+        if pool_type not in POOL_TYPES:
+            raise ValueError(f'Unknown inference pool type "{pool_type}"')
+    return lambda version: specs.get(version, (default_type, default_size))
+
+
+class InferenceExecutor():
+
+    def __init__(self, version, model_leaser, model_loader, pool_type, pool_size, warmup_rounds=0):
+        """
+        `model_leaser` (a no-args function returning a context manager
+        yielding the model) serves the calls run in this process,
+        `model_loader` builds (and `warmup_rounds` warm up) the worker
+        models of a process pool.
+        """
+        self.version = version
+        self.model_leaser = model_leaser
+        self.model_loader = model_loader
+        self.pool_type = pool_type
+        self.pool_size = pool_size
+        self.warmup_rounds = warmup_rounds
+        self.started = False
+        # process pools: start-up error of the current pool (see `get_status`)
+        self.error = None
+        self.pool, self.workers_ready = self._create_pool()
+
+    def _create_pool(self):
+        if self.pool_type == 'thread':
+            return ThreadPoolExecutor(
+                max_workers=self.pool_size,
+                thread_name_prefix=f'inference-{self.version}',
+            ), None
+        elif self.pool_type == 'process':
+            mp_context = multiprocessing.get_context('spawn')
+            workers_ready = mp_context.Value('i', 0)
+            return ProcessPoolExecutor(
+                max_workers=self.pool_size,
+                mp_context=mp_context,
+                initializer=_init_worker,
+                initargs=(self.model_loader, self.warmup_rounds, workers_ready),
+            ), workers_ready
+        else:
+            # 'none': run inline, in the event loop (no pool at all)
+            return None, None
+
+    def _spawn_workers(self, pool, on_done):
+        """
+        Have all the workers of a (new) process pool started, and call
+        `on_done(error)` once they are all ready (error None) or failed.
+        """
+        futures = [
+            pool.submit(_wait_for_workers, self.pool_size)
+            for _ in range(self.pool_size)
+        ]
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def _on_future_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            errors = [str(future.exception()) for future in futures if future.exception() is not None]
+            on_done(errors[0] if errors else None)
+
+        for future in futures:
+            future.add_done_callback(_on_future_done)
+
+    def start(self):
+        """
+        Spawn all the workers of a process pool now (each loading and warming
+        up its model), instead of on the first calls. No-op for other pools.
+        """
+        if self.pool_type == 'process' and not self.started:
+            self.started = True
+            pool = self.pool
+            print(f'[InferenceExecutor] Starting {self.pool_size} worker processes for "{self.version}"')
+            self._spawn_workers(pool, lambda error: self._on_started(pool, error))
+
+    def _on_started(self, pool, error):
+        if pool is self.pool:
+            self.error = error
+        if error is not None:
+            print(f'[InferenceExecutor] Worker processes for "{self.version}" failed to start: {error}')
+
+    def recycle(self):
+        """
+        Replace a process pool with a fresh one, whose workers load the
+        current artifacts. Once started, the current pool keeps serving
+        until all the new workers are ready (and is kept if they fail).
+        Calls already submitted complete on the old workers.
+        Thread (and inline) execution shares the parent models: no-op.
+        """
+        if self.pool_type != 'process':
+            return
+        pool, workers_ready = self._create_pool()
+        if self.started:
+            self._spawn_workers(pool, lambda error: self._on_recycled(pool, workers_ready, error))
+        else:
+            self._replace_pool(pool, workers_ready)
+
+    def _on_recycled(self, pool, workers_ready, error):
+        if error is not None:
+            print(f'[InferenceExecutor] New worker processes for "{self.version}" failed to start, keeping the current ones: {error}')
+            pool.shutdown(wait=False)
+        else:
+            print(f'[InferenceExecutor] Swapped in new worker processes for "{self.version}"')
+            self._replace_pool(pool, workers_ready)
+
+    def _replace_pool(self, pool, workers_ready):
+        old_pool = self.pool
+        self.pool, self.workers_ready = pool, workers_ready
+        self.error = None
+        old_pool.shutdown(wait=False)
+
+    def get_status(self):
+        workers_ready = self.workers_ready.value if self.workers_ready is not None else 0
+        return {
+            'pool_type': self.pool_type,
+            'pool_size': self.pool_size,
+            'workers_ready': workers_ready,
+            'ready': self.pool_type != 'process' or (workers_ready >= self.pool_size and self.error is None),
+            'error': self.error,
+        }
+
+    async def call(self, method_name, *args):
+        """
+        Await `model.<method_name>(*args)`, run in this version's pool.
+        """
+        if self.pool is None:
+            return _call_leased_model(self.model_leaser, method_name, args)
+        elif self.pool_type == 'process':
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.pool,
+                _call_model_in_worker,
+                method_name,
+                args,
+            )
+        else:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.pool,
+                _call_leased_model,
+                self.model_leaser,
+                method_name,
+                args,
+            )
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
@@ -0,0 +1,269 @@
+"""
+Serving metrics (latency histograms, counters, gauges), in Prometheus text format.
+
+Requests are timed as a whole by a custom route class, which also makes the
+(version, endpoint) labels of the current request available, through a
+context variable, to the stage timers placed along the pipeline
+(cache lookups and stores, feature extraction, inference, call log).
+The time spent outside of the endpoint function (request parsing and
+validation, response validation and serialization) is recorded as the
+'serialization' stage.
+
+All observations happen in the event loop thread, hence no locking.
+When metrics are disabled, timers are a shared no-op object and the routes
+are not wrapped at all, so the overhead is a single attribute check.
+"""
+
+import time
+import bisect
+import functools
+from contextlib import nullcontext
+from contextvars import ContextVar
+from fastapi.routing import APIRoute
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException
+
+# seconds
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# (version, endpoint) of the request being served
+_request_labels = ContextVar('request_labels', default=('', ''))
+# duration of the endpoint function of the current request
+_endpoint_seconds = ContextVar('endpoint_seconds', default=None)
+
+_null_timer = nullcontext()
+
+
+def _format_labels(label_names, label_values, extra=''):
+    pairs = [
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(label_names, label_values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter():
+
+    metric_type = 'counter'
+
+    def __init__(self, name, description, label_names):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values = {}
+
+    def inc(self, label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render_samples(self):
+        return [
+            f'{self.name}{_format_labels(self.label_names, label_values)} {_format_number(value)}'
+            for label_values, value in sorted(self.values.items())
+        ]
+
+
+class Gauge(Counter):
+
+    metric_type = 'gauge'
+
+    def dec(self, label_values, amount=1):
+        self.inc(label_values, -amount)
+
+
+class Histogram():
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, description, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = list(buckets)
+        # label_values -> [per-bucket counts (last is +Inf), sum]
+        self.series = {}
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            series = [[0] * (len(self.buckets) + 1), 0.0]
+            self.series[label_values] = series
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render_samples(self):
+        lines = []
+        for label_values, (bucket_counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + ['+Inf'], bucket_counts):
+                cumulative += count
+                le = 'le="%s"' % upper_bound
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, label_values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, label_values)} {repr(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, label_values)} {cumulative}')
+        return lines
+
+
+class _StageTimer():
+
+    def __init__(self, histogram, stage):
+        self.histogram = histogram
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        version, endpoint = _request_labels.get()
+        self.histogram.observe((version, endpoint, self.stage), time.perf_counter() - self.t0)
+        return False
+
+
+class ServingMetrics():
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.request_latency = Histogram(
+            'spam_request_duration_seconds',
+            'Total request latency',
+            ('version', 'endpoint'),
+        )
+        self.stage_latency = Histogram(
+            'spam_stage_duration_seconds',
+            'Latency of each stage of the request pipeline',
+            ('version', 'endpoint', 'stage'),
+        )
+        self.cache_lookups = Counter(
+            'spam_cache_lookups_total',
+            'Cache lookups, by cache (i.e. endpoint table) and result',
+            ('version', 'endpoint', 'cache', 'result'),
+        )
+        self.errors = Counter(
+            'spam_request_errors_total',
+            'Requests ending in an error, by status code',
+            ('version', 'endpoint', 'status'),
+        )
+        self.in_flight = Gauge(
+            'spam_requests_in_flight',
+            'Requests currently being served',
+            ('version', 'endpoint'),
+        )
+        self.metrics = [self.request_latency, self.stage_latency, self.cache_lookups, self.errors, self.in_flight]
+
+    def stage(self, stage):
+        """
+        Context manager timing a stage of the current request.
+        """
+        if not self.enabled:
+            return _null_timer
+        return _StageTimer(self.stage_latency, stage)
+
+    def timed(self, stage, awaitable):
+        """
+        Wrap an awaitable so that waiting for it is timed as a stage.
+        """
+        if not self.enabled:
+            return awaitable
+
+        async def _timed_awaitable():
+            with self.stage(stage):
+                return await awaitable
+        return _timed_awaitable()
+
+    def count_cache_lookups(self, cache, hits, misses):
+        if self.enabled:
+            version, endpoint = _request_labels.get()
+            if hits:
+                self.cache_lookups.inc((version, endpoint, cache, 'hit'), hits)
+            if misses:
+                self.cache_lookups.inc((version, endpoint, cache, 'miss'), misses)
+
+    def route_class(self, version):
+        """
+        An APIRoute class timing requests and setting the labels for the stage timers.
+        The endpoint label is the last segment of the route path.
+        """
+        if not self.enabled:
+            return APIRoute
+        serving_metrics = self
+
+        class TimedRoute(APIRoute):
+
+            def __init__(self, path, endpoint, **kwargs):
+                endpoint_name = path.rstrip('/').split('/')[-1]
+                labels = (version, endpoint_name)
+
+                # the endpoint function alone, to tell framework time apart
+                @functools.wraps(endpoint)
+                async def _timed_endpoint(*endpoint_args, **endpoint_kwargs):
+                    t0 = time.perf_counter()
+                    try:
+                        return await endpoint(*endpoint_args, **endpoint_kwargs)
+                    finally:
+                        _endpoint_seconds.set(time.perf_counter() - t0)
+
+                self.metric_labels = labels
+                super().__init__(path, _timed_endpoint, **kwargs)
+
+            def get_route_handler(self):
+                route_handler = super().get_route_handler()
+                labels = self.metric_labels
+
+                async def _timed_route_handler(request):
+                    _request_labels.set(labels)
+                    _endpoint_seconds.set(None)
+                    serving_metrics.in_flight.inc(labels)
+                    t0 = time.perf_counter()
+                    status = None
+                    try:
+                        response = await route_handler(request)
+                        status = response.status_code
+                        return response
+                    except HTTPException as e:
+                        status = e.status_code
+                        raise
+                    except RequestValidationError:
+                        # a bad payload (turned into a 422 by the app's exception handler)
+                        status = 422
+                        raise
+                    except Exception:
+                        status = 500
+                        raise
+                    finally:
+                        elapsed = time.perf_counter() - t0
+                        serving_metrics.in_flight.dec(labels)
+                        serving_metrics.request_latency.observe(labels, elapsed)
+                        endpoint_seconds = _endpoint_seconds.get()
+                        if endpoint_seconds is not None:
+                            serving_metrics.stage_latency.observe(labels + ('serialization', ), elapsed - endpoint_seconds)
+                        if status is not None and status >= 400:
+                            serving_metrics.errors.inc(labels + (str(status), ))
+                return _timed_route_handler
+
+        return TimedRoute
+
+    def reset(self):
+        for metric in self.metrics:
+            if isinstance(metric, Histogram):
+                metric.series.clear()
+            else:
+                metric.values.clear()
+
+    def render(self):
+        if not self.enabled:
+            return '# metrics are disabled (SPAM_METRICS_ENABLED)\n'
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.metric_type}')
+            lines.extend(metric.render_samples())
+        return '\n'.join(lines) + '\n'
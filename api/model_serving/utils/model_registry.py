@@ -0,0 +1,367 @@
+"""
+Registry of the model versions served by the API.
+
+Each version is registered with a loader, i.e. a function building the
+model wrapper (and importing whatever heavy library it needs). Models are
+loaded on first use, or ahead of time in a background task: either way,
+loading runs outside of the event loop (in the inference pool or in a
+separate thread), and is followed by a few synthetic predictions to
+"warm up" the model, so that the first real request does not pay for any
+one-off initialization (e.g. graph tracing in Tensorflow). Versions served
+by a process pool are registered with `in_process=False`: their artifacts
+are watched, but they are not loaded here ahead of time (their pool
+workers load their own copy, see api/model_serving/utils/executors.py).
+
+Model code uses a model through a "lease" (a context manager), which pins
+the instance being used for the duration of the call. This makes two
+things safe while requests are in flight:
+    - memory budget: the footprint of each loaded model is the size of its
+      parameters (falling back to the size of its artifacts), i.e. what
+      evicting it frees: the libraries and the feature extractors, shared
+      by all versions and kept across evictions, are not counted, and so
+      are not part of the budget, and neither are the copies held by the
+      workers of a process pool (the budget is for this process only).
+      When the total exceeds the budget, the least-recently-used versions
+      are evicted, to be reloaded on demand;
+    - hot swap: a watcher thread polls the model artifacts and, when they
+      change (and stay unchanged for one more poll, i.e. are fully written),
+      loads and warms up a new instance while the old one keeps serving,
+      then swaps it in atomically. In-flight calls finish on the old one.
+Evicted or replaced instances are dropped as soon as their last lease ends.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+NOT_LOADED = 'not_loaded'
+LOADING = 'loading'
+READY = 'ready'
+EVICTED = 'evicted'
+FAILED = 'failed'
+
+WARMUP_TEXTS = [
+    'Hello, how are you?',
+    'You are A WINNER OF FREE CASH!!! Call now to claim your prize',
+    'ok',
+]
+
+
+def warm_up_model(model, rounds):
+    for _ in range(rounds):
+        model.text_to_prediction(WARMUP_TEXTS[0])
+        model.texts_to_predictions(WARMUP_TEXTS)
+
+
+def _artifacts_signature(artifact_paths):
+    signature = []
+    for path in artifact_paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+def _artifacts_size(artifact_paths):
+    return sum(
+        os.path.getsize(path)
+        for path in artifact_paths
+        if os.path.isfile(path)
+    )
+
+
+class ModelInstance():
+
+    def __init__(self, model, footprint_bytes, signature):
+        self.model = model
+        self.footprint_bytes = footprint_bytes
+        self.signature = signature
+        self.leases = 0
+        self.retired = False
+
+
+class ModelEntry():
+
+    def __init__(self, version, loader, artifact_paths, in_process):
+        self.version = version
+        self.loader = loader
+        self.artifact_paths = list(artifact_paths)
+        self.in_process = in_process
+        self.instance = None
+        # replaced/evicted instances still leased by in-flight calls
+        self.retired_instances = []
+        self.state = NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self.last_used = 0.0
+        self.num_loads = 0
+        self.num_evictions = 0
+        self.num_swaps = 0
+        # signature of the artifacts as last seen by the watcher
+        self.seen_signature = None
+        # changed signature waiting to be confirmed by the next poll
+        self.pending_signature = None
+        # serializes loads/reloads of this version
+        self.lock = threading.Lock()
+
+
+class ModelRegistry():
+
+    def __init__(self, warmup_rounds=0, memory_budget_bytes=0, watch_interval_seconds=0):
+        self.warmup_rounds = warmup_rounds
+        # 0 means no budget (and no eviction)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.watch_interval_seconds = watch_interval_seconds
+        self.entries = {}
+        # callbacks (version, event), event being 'swap', 'evict' or 'artifacts_changed'
+        self.listeners = []
+        # guards instances, leases and usage bookkeeping (never held while loading)
+        self.lock = threading.RLock()
+        self.watcher = None
+        self.watcher_stop = threading.Event()
+
+    def register(self, version, loader, artifact_paths=(), in_process=True):
+        entry = ModelEntry(version, loader, artifact_paths, in_process)
+        entry.seen_signature = _artifacts_signature(entry.artifact_paths)
+        self.entries[version] = entry
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def versions(self):
+        return sorted(self.entries.keys())
+
+    def in_process_versions(self):
+        return [version for version in self.versions() if self.entries[version].in_process]
+
+    @contextmanager
+    def lease(self, version):
+        """
+        Context manager yielding the model for a version (loading it first if
+        needed, blocking). The instance stays alive until the block exits,
+        even if it gets evicted or swapped out in the meantime.
+        """
+        instance = self._acquire(version)
+        try:
+            yield instance.model
+        finally:
+            self._release(self.entries[version], instance)
+
+    def get(self, version):
+        """
+        Return the model for a version, loading it first if needed (blocking).
+        Concurrent callers wait for the same, single load.
+        No lease is held on the returned model: prefer `lease` for model calls.
+        """
+        with self.lease(version) as model:
+            return model
+
+    def _acquire(self, version):
+        entry = self.entries[version]
+        with self.lock:
+            if entry.instance is not None:
+                return self._pin(entry)
+        with entry.lock:
+            if entry.instance is None:
+                instance = self._load(entry)
+                with self.lock:
+                    entry.instance = instance
+                    entry.state = READY
+                    acquired = self._pin(entry)
+                self._enforce_budget()
+                return acquired
+        # someone else loaded it while we were waiting for the lock
+        with self.lock:
+            if entry.instance is not None:
+                return self._pin(entry)
+        return self._acquire(version)
+
+    def _pin(self, entry):
+        # to be called with self.lock held
+        entry.instance.leases += 1
+        entry.last_used = time.monotonic()
+        return entry.instance
+
+    def _release(self, entry, instance):
+        with self.lock:
+            instance.leases -= 1
+            if instance.retired and instance.leases == 0 and instance in entry.retired_instances:
+                entry.retired_instances.remove(instance)
+
+    def _retire(self, entry):
+        # to be called with self.lock held
+        instance = entry.instance
+        entry.instance = None
+        instance.retired = True
+        if instance.leases > 0:
+            entry.retired_instances.append(instance)
+
+    def _load(self, entry):
+        # to be called with the entry lock held. Returns a new, warmed-up instance
+        previous_state = entry.state
+        if entry.instance is None:
+            entry.state = LOADING
+        print(f'[ModelRegistry] Loading model "{entry.version}"')
+        signature = _artifacts_signature(entry.artifact_paths)
+        t0 = time.perf_counter()
+        try:
+            model = entry.loader()
+            warm_up_model(model, self.warmup_rounds)
+        except Exception as e:
+            entry.state = previous_state if entry.instance is not None else FAILED
+            entry.error = str(e)
+            print(f'[ModelRegistry] Loading model "{entry.version}" failed: {entry.error}')
+            raise
+        entry.load_seconds = time.perf_counter() - t0
+        # not a process memory delta: other threads allocate meanwhile, and the
+        # first model loaded would be charged for the (shared) libraries
+        footprint_bytes = model.parameters_nbytes()
+        if footprint_bytes is None:
+            footprint_bytes = _artifacts_size(entry.artifact_paths)
+        entry.error = None
+        entry.num_loads += 1
+        entry.seen_signature = signature
+        print(f'[ModelRegistry] Model "{entry.version}" ready ({entry.load_seconds:.2f} s, ~{footprint_bytes / 2**20:.1f} MiB)')
+        return ModelInstance(model, footprint_bytes, signature)
+
+    def resident_bytes(self):
+        with self.lock:
+            return sum(
+                instance.footprint_bytes
+                for entry in self.entries.values()
+                for instance in ([entry.instance] if entry.instance is not None else []) + entry.retired_instances
+            )
+
+    def _enforce_budget(self):
+        """
+        Evict least-recently-used versions until within budget.
+        The most recently used version is never evicted.
+        """
+        if self.memory_budget_bytes <= 0:
+            return
+        evicted = []
+        with self.lock:
+            while self.resident_bytes() > self.memory_budget_bytes:
+                loaded = sorted(
+                    (entry for entry in self.entries.values() if entry.instance is not None),
+                    key=lambda entry: entry.last_used,
+                )
+                if len(loaded) < 2:
+                    break
+                victim = loaded[0]
+                self._retire(victim)
+                victim.state = EVICTED
+                victim.num_evictions += 1
+                evicted.append(victim.version)
+        for version in evicted:
+            print(f'[ModelRegistry] Evicted model "{version}" (memory budget)')
+            self._notify(version, 'evict')
+
+    def reload(self, version):
+        """
+        Load a new instance of a version and swap it in, atomically.
+        On failure the current instance (if any) keeps serving.
+        """
+        entry = self.entries[version]
+        with entry.lock:
+            try:
+                instance = self._load(entry)
+            except Exception:
+                return False
+            with self.lock:
+                if entry.instance is not None:
+                    self._retire(entry)
+                entry.instance = instance
+                entry.state = READY
+                entry.last_used = time.monotonic()
+                entry.num_swaps += 1
+        print(f'[ModelRegistry] Swapped in new model "{version}"')
+        self._notify(version, 'swap')
+        self._enforce_budget()
+        return True
+
+    def _notify(self, version, event):
+        for callback in self.listeners:
+            try:
+                callback(version, event)
+            except Exception as e:
+                print(f'[ModelRegistry] Listener error on "{event}" for "{version}": {str(e)}')
+
+    def check_artifacts(self):
+        """
+        One watcher round: reload (or signal, if not loaded here) the versions
+        whose artifacts changed and have been stable since the previous round.
+        """
+        for version in self.versions():
+            entry = self.entries[version]
+            signature = _artifacts_signature(entry.artifact_paths)
+            if signature == entry.seen_signature:
+                continue
+            if entry.pending_signature != signature:
+                # changed (or still changing): wait for one more round
+                entry.pending_signature = signature
+                continue
+            entry.pending_signature = None
+            if any(mtime is None for _, mtime, _ in signature):
+                # some artifact is missing: keep serving what we have
+                continue
+            print(f'[ModelRegistry] Artifacts changed for model "{version}"')
+            if entry.instance is not None:
+                self.reload(version)
+            else:
+                entry.seen_signature = signature
+                self._notify(version, 'artifacts_changed')
+
+    def _watch(self):
+        while not self.watcher_stop.wait(self.watch_interval_seconds):
+            try:
+                self.check_artifacts()
+            except Exception as e:
+                print(f'[ModelRegistry] Watcher error: {str(e)}')
+
+    def start_watching(self):
+        if self.watch_interval_seconds > 0 and self.watcher is None:
+            self.watcher_stop.clear()
+            self.watcher = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+            self.watcher.start()
+
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.watcher_stop.set()
+            self.watcher.join()
+            self.watcher = None
+
+    def load_all(self):
+        """
+        Load all versions served in this process, one after the other
+        (failures are only recorded), stopping once the memory budget is used up.
+        """
+        for version in self.in_process_versions():
+            if self.memory_budget_bytes > 0 and self.resident_bytes() >= self.memory_budget_bytes:
+                print(f'[ModelRegistry] Memory budget reached, not preloading "{version}"')
+                continue
+            try:
+                self.get(version)
+            except Exception:
+                pass
+
+    def get_status(self):
+        with self.lock:
+            return {
+                version: {
+                    'state': entry.state,
+                    'in_process': entry.in_process,
+                    'load_seconds': entry.load_seconds,
+                    'error': entry.error,
+                    'footprint_mb': (entry.instance.footprint_bytes / 2**20) if entry.instance is not None else None,
+                    'leases': entry.instance.leases if entry.instance is not None else 0,
+                    'retired_instances': len(entry.retired_instances),
+                    'loads': entry.num_loads,
+                    'evictions': entry.num_evictions,
+                    'swaps': entry.num_swaps,
+                }
+                for version, entry in sorted(self.entries.items())
+            }
@@ -0,0 +1,61 @@
+"""
+Memory usage of processes, as seen by the (Linux) kernel.
+
+RSS counts every resident page mapped by a process, shared or not, so the
+RSS of N forked workers adds up to much more than the memory actually used.
+PSS (proportional set size) splits each shared page evenly among the
+processes mapping it: summing PSS over the workers gives the real total.
+"""
+
+# smaps_rollup field => report key (values in kB)
+_SMAPS_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared_clean',
+    'Shared_Dirty': 'shared_dirty',
+    'Private_Clean': 'private_clean',
+    'Private_Dirty': 'private_dirty',
+}
+
+
+def get_process_memory(pid):
+    """
+    Return {rss, pss, shared, private} in MiB for a process, None if unavailable.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as smaps:
+            lines = smaps.readlines()
+    except OSError:
+        return None
+    kbs = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].rstrip(':') in _SMAPS_FIELDS:
+            kbs[_SMAPS_FIELDS[parts[0].rstrip(':')]] = int(parts[1])
+    return {
+        'rss': kbs.get('rss', 0) / 1024,
+        'pss': kbs.get('pss', 0) / 1024,
+        'shared': (kbs.get('shared_clean', 0) + kbs.get('shared_dirty', 0)) / 1024,
+        'private': (kbs.get('private_clean', 0) + kbs.get('private_dirty', 0)) / 1024,
+    }
+
+
+def format_memory_report(title, labeled_pids):
+    """
+    A text table with the memory of each (label, pid) and the totals.
+    """
+    lines = [
+        f'== {title}',
+        f'{"process":<16}{"pid":>8}{"RSS MiB":>12}{"PSS MiB":>12}{"shared MiB":>12}{"private MiB":>12}',
+    ]
+    totals = {'rss': 0.0, 'pss': 0.0, 'shared': 0.0, 'private': 0.0}
+    for label, pid in labeled_pids:
+        memory = get_process_memory(pid)
+        if memory is None:
+            lines.append(f'{label:<16}{pid:>8}  (unavailable)')
+            continue
+        for key in totals:
+            totals[key] += memory[key]
+        lines.append(f'{label:<16}{pid:>8}{memory["rss"]:>12.1f}{memory["pss"]:>12.1f}{memory["shared"]:>12.1f}{memory["private"]:>12.1f}')
+    lines.append(f'{"TOTAL":<16}{"":>8}{totals["rss"]:>12.1f}{totals["pss"]:>12.1f}{totals["shared"]:>12.1f}{totals["private"]:>12.1f}')
+    return '\n'.join(lines)
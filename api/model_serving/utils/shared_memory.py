@@ -0,0 +1,25 @@
+"""
+Read-only NumPy arrays living in shared memory.
+
+An anonymous, shared memory map is inherited as-is by forked processes:
+unlike ordinary heap pages, which are copy-on-write and get duplicated as
+soon as anything in them is written to (by the allocator, say), these are
+never copied, and the kernel accounts for them once (see PSS) however many
+workers map them.
+"""
+
+import mmap
+import numpy as np
+
+
+def to_shared_array(array):
+    """
+    Return a read-only copy of `array` backed by an anonymous shared mmap.
+    """
+    array = np.ascontiguousarray(array)
+    # mmap refuses zero-length maps
+    buffer = mmap.mmap(-1, max(array.nbytes, 1))
+    shared = np.frombuffer(buffer, dtype=array.dtype, count=array.size).reshape(array.shape)
+    shared[...] = array
+    shared.flags.writeable = False
+    return shared
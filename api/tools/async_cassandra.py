@@ -0,0 +1,96 @@
+"""
+An asyncio-friendly wrapper around a `cassandra.cluster.Session`.
+
+The driver's `execute_async` returns a `ResponseFuture`, whose completion
+is signaled through callbacks running in the driver's own I/O thread.
+Here these callbacks are bridged to the event loop, so that queries can be
+simply `await`ed by the (async) API handlers without ever blocking the loop.
+
+A semaphore caps the number of queries in flight at any time through
+the wrapper, to avoid flooding the cluster (and the driver's connection
+pool) when many requests arrive at once.
+"""
+
+import asyncio
+from cassandra.cluster import ResultSet
+
+
+def _page_queue(loop, response_future):
+    # each page of results (or error) lands, in order, in an asyncio queue.
+    # Callbacks fire again for each page after `start_fetching_next_page`.
+    queue = asyncio.Queue()
+    response_future.add_callbacks(
+        callback=lambda rows: loop.call_soon_threadsafe(queue.put_nowait, (rows, None)),
+        errback=lambda exc: loop.call_soon_threadsafe(queue.put_nowait, (None, exc)),
+    )
+    return queue
+
+
+class AsyncSession():
+
+    def __init__(self, session, max_concurrency):
+        self.session = session
+        self.max_concurrency = max_concurrency
+        # created lazily, within the running event loop
+        self._semaphore = None
+
+    def _get_semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def prepare(self, statement):
+        # preparing is a one-off operation (see the prepared statement caches)
+        return self.session.prepare(statement)
+
+    async def execute(self, statement, parameters=None):
+        """
+        Run a statement and return all resulting rows as a list
+        (following all pages, if the result is paged).
+        """
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            response_future = self.session.execute_async(statement, parameters)
+            queue = _page_queue(loop, response_future)
+            rows = []
+            while True:
+                page, exc = await queue.get()
+                if exc is not None:
+                    raise exc
+                # statements without a result (e.g. INSERTs) complete with None
+                rows.extend(page or [])
+                if response_future.has_more_pages:
+                    response_future.start_fetching_next_page()
+                else:
+                    return rows
+
+    async def execute_one(self, statement, parameters=None):
+        """
+        Run a statement and return its first row (or None).
+        """
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            response_future = self.session.execute_async(statement, parameters)
+            page, exc = await _page_queue(loop, response_future).get()
+            if exc is not None:
+                raise exc
+            return page[0] if page else None
+
+    async def execute_page(self, statement, parameters=None, fetch_size=None, paging_state=None):
+        """
+        Run a statement and return a single page of rows, along with the
+        paging state to resume from (None if there are no more pages).
+        """
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            if fetch_size is not None:
+                statement = statement.bind(parameters)
+                statement.fetch_size = fetch_size
+                parameters = None
+            response_future = self.session.execute_async(statement, parameters, paging_state=paging_state)
+            page, exc = await _page_queue(loop, response_future).get()
+            if exc is not None:
+                raise exc
+            # the paging state is exposed (publicly) by the ResultSet only
+            next_paging_state = ResultSet(response_future, page).paging_state if response_future.has_more_pages else None
+            return page or [], next_paging_state
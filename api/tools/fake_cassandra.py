@@ -0,0 +1,306 @@
+"""
+An in-memory stand-in for a `cassandra.cluster.Session`, to run the APIs
+(e.g. in benchmarks) without a database.
+
+It supports the small subset of CQL used by the APIs:
+    - INSERT INTO t (c1, c2, ...) VALUES (?, ?, ...);
+    - SELECT c1, ... (or *) FROM t WHERE c1=? AND c2>=? ...;
+    - batches of prepared inserts (`cassandra.query.BatchStatement`);
+through `prepare`, `execute` and `execute_async`, including paging
+(`fetch_size` on bound statements, `paging_state`).
+Inserts are upserts on the table primary key (see DEFAULT_PRIMARY_KEYS);
+rows are returned in primary-key order.
+
+Futures complete, as with the real driver, on a separate thread, after a
+simulated latency (a fixed part plus a random jitter), or immediately
+if no latency is configured. Also as with the real driver, statements
+without a result (inserts, batches) complete with None instead of rows.
+"""
+
+import re
+import time
+import heapq
+import random
+import threading
+from collections import namedtuple
+from cassandra.query import PreparedStatement, BatchStatement, SimpleStatement
+
+# table -> primary key columns (tables not listed use all inserted columns)
+DEFAULT_PRIMARY_KEYS = {
+    'model_serving_api_cache': ('endpoint', 'version', 'input_json'),
+    'model_serving_api_cache_by_digest': ('endpoint', 'version', 'input_digest'),
+    'spam_calls_log': ('caller_id', 'version', 'called_at'),
+}
+
+DEFAULT_FETCH_SIZE = 5000
+
+_INSERT_RE = re.compile(r'^\s*INSERT\s+INTO\s+(\w+)\s*\(([^)]*)\)\s*VALUES\s*\(([^)]*)\)\s*;?\s*$', re.IGNORECASE)
+_SELECT_RE = re.compile(r'^\s*SELECT\s+(.+?)\s+FROM\s+(\w+)(?:\s+WHERE\s+(.+?))?\s*;?\s*$', re.IGNORECASE)
+_CONDITION_RE = re.compile(r'^\s*(\w+)\s*(=|>=|<=|>|<)\s*\?\s*$')
+
+_COMPARATORS = {
+    '=': lambda a, b: a == b,
+    '>=': lambda a, b: a >= b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '<': lambda a, b: a < b,
+}
+
+
+def _parse_cql(cql):
+    """
+    Return ('insert', table, columns) or ('select', table, columns, conditions),
+    conditions being a list of (column, operator).
+    """
+    insert_match = _INSERT_RE.match(cql)
+    if insert_match:
+        table, columns, _ = insert_match.groups()
+        return ('insert', table, [c.strip() for c in columns.split(',')])
+    select_match = _SELECT_RE.match(cql)
+    if select_match:
+        columns, table, where = select_match.groups()
+        conditions = []
+        if where:
+            for condition in re.split(r'\s+AND\s+', where, flags=re.IGNORECASE):
+                condition_match = _CONDITION_RE.match(condition)
+                if condition_match is None:
+                    raise ValueError(f'Unsupported condition "{condition}"')
+                conditions.append(condition_match.groups())
+        column_list = None if columns.strip() == '*' else [c.strip() for c in columns.split(',')]
+        return ('select', table, column_list, conditions)
+    raise ValueError(f'Unsupported statement "{cql}"')
+
+
+class FakePreparedStatement(PreparedStatement):
+
+    def __init__(self, query_string):
+        # the driver's own initializer needs actual cluster metadata
+        self.query_string = query_string
+        self.query_id = query_string.encode('utf-8')
+        self.parsed = _parse_cql(query_string)
+        self.keyspace = None
+        self.routing_key = None
+        self.custom_payload = None
+        self.fetch_size = None
+
+    def bind(self, values):
+        return FakeBoundStatement(self, values)
+
+
+class FakeBoundStatement():
+
+    def __init__(self, prepared_statement, values):
+        self.prepared_statement = prepared_statement
+        self.values = tuple(values) if values is not None else ()
+        self.keyspace = None
+        self.routing_key = None
+        self.custom_payload = None
+        self.fetch_size = None
+
+
+class FakeResultSet(list):
+
+    def one(self):
+        return self[0] if self else None
+
+    @property
+    def current_rows(self):
+        return self
+
+
+class FakeResponseFuture():
+
+    def __init__(self, session, rows, fetch_size, start):
+        self.session = session
+        self.rows = rows
+        self.fetch_size = fetch_size
+        self.start = start
+        self.callbacks = []
+        self.errbacks = []
+        self.error = None
+        self.page = None
+        # as read by `ResultSet`
+        self._col_names = None
+        self._col_types = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def has_more_pages(self):
+        return self.start + self.fetch_size < len(self.rows)
+
+    @property
+    def _paging_state(self):
+        return str(self.start + self.fetch_size).encode() if self.has_more_pages else None
+
+    def _complete(self, page=None, error=None):
+        with self.lock:
+            self.page = page
+            self.error = error
+            self.done.set()
+            callbacks = list(self.errbacks if error is not None else self.callbacks)
+        for callback in callbacks:
+            callback(error if error is not None else page)
+
+    def add_callbacks(self, callback, errback):
+        # callbacks stay registered, and fire again for each following page
+        with self.lock:
+            self.callbacks.append(callback)
+            self.errbacks.append(errback)
+            if not self.done.is_set():
+                return
+            page, error = self.page, self.error
+        if error is not None:
+            errback(error)
+        else:
+            callback(page)
+
+    def start_fetching_next_page(self):
+        with self.lock:
+            self.done.clear()
+            self.start += self.fetch_size
+        self.session._schedule(self, self.rows[self.start: self.start + self.fetch_size])
+
+    def result(self):
+        # all pages at once (the real ResultSet would fetch them on iteration)
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return FakeResultSet(self.rows[self.start:])
+
+
+class FakeCassandraSession():
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, primary_keys=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.primary_keys = dict(DEFAULT_PRIMARY_KEYS if primary_keys is None else primary_keys)
+        self.random = random.Random(seed)
+        # table -> {primary key tuple: row dict}
+        self.tables = {}
+        self.prepared_by_id = {}
+        self.num_queries = 0
+        self.lock = threading.Lock()
+        # delayed completions, run by a single timer thread
+        self._timer_heap = []
+        self._timer_counter = 0
+        self._timer_wakeup = threading.Condition()
+        self._timer_thread = None
+
+    # 'Session' interface
+
+    def prepare(self, query):
+        prepared = FakePreparedStatement(query)
+        self.prepared_by_id[prepared.query_id] = prepared
+        return prepared
+
+    def execute(self, query, parameters=None, paging_state=None, **kwargs):
+        return self.execute_async(query, parameters, paging_state=paging_state).result()
+
+    def execute_async(self, query, parameters=None, paging_state=None, **kwargs):
+        fetch_size = DEFAULT_FETCH_SIZE
+        try:
+            if isinstance(query, BatchStatement):
+                for _, query_id, values in query._statements_and_parameters:
+                    self._run(self.prepared_by_id[query_id].parsed, values)
+                rows = None
+            else:
+                if isinstance(query, FakeBoundStatement):
+                    fetch_size = query.fetch_size or fetch_size
+                    query, parameters = query.prepared_statement, query.values
+                elif isinstance(query, SimpleStatement):
+                    fetch_size = query.fetch_size or fetch_size
+                    query = self.prepare(query.query_string)
+                elif isinstance(query, str):
+                    query = self.prepare(query)
+                rows = self._run(query.parsed, parameters or ())
+            error = None
+        except Exception as e:
+            rows, error = [], e
+        start = int(paging_state.decode()) if paging_state else 0
+        future = FakeResponseFuture(self, rows if rows is not None else [], fetch_size, start)
+        if error is not None:
+            future._complete(error=error)
+        elif rows is None:
+            # void result
+            self._schedule(future, None)
+        else:
+            self._schedule(future, rows[start: start + fetch_size])
+        return future
+
+    def shutdown(self):
+        with self._timer_wakeup:
+            self._timer_thread = None
+            self._timer_wakeup.notify()
+
+    # in-memory engine
+
+    def _run(self, parsed, values):
+        with self.lock:
+            self.num_queries += 1
+            if parsed[0] == 'insert':
+                _, table, columns = parsed
+                row = dict(zip(columns, values))
+                key_columns = self.primary_keys.get(table, columns)
+                self.tables.setdefault(table, {})[tuple(row[c] for c in key_columns)] = row
+                return None
+            else:
+                _, table, columns, conditions = parsed
+                table_rows = self.tables.get(table, {})
+                key_columns = self.primary_keys.get(table)
+                condition_values = list(zip(conditions, values))
+                if key_columns and all(op == '=' for (_, op) in conditions) and {c for (c, _) in conditions} == set(key_columns):
+                    # direct primary-key lookup
+                    by_column = {c: v for (c, _), v in condition_values}
+                    row = table_rows.get(tuple(by_column[c] for c in key_columns))
+                    matching = [row] if row is not None else []
+                else:
+                    matching = [
+                        row
+                        for _, row in sorted(table_rows.items(), key=lambda kr: kr[0])
+                        if all(
+                            row.get(column) is not None and _COMPARATORS[op](row.get(column), value)
+                            for (column, op), value in condition_values
+                        )
+                    ]
+                if not matching:
+                    return []
+                column_list = columns if columns is not None else list(matching[0].keys())
+                row_class = namedtuple('Row', column_list)
+                return [
+                    row_class(*(row.get(c) for c in column_list))
+                    for row in matching
+                ]
+
+    def _delay(self):
+        if self.latency_ms <= 0 and self.jitter_ms <= 0:
+            return 0.0
+        return (self.latency_ms + self.random.uniform(0, self.jitter_ms)) / 1000
+
+    def _schedule(self, future, page):
+        delay = self._delay()
+        if delay <= 0:
+            future._complete(page=page)
+            return
+        with self._timer_wakeup:
+            if self._timer_thread is None:
+                self._timer_thread = threading.Thread(target=self._run_timers, name='fake-cassandra-io', daemon=True)
+                self._timer_thread.start()
+            self._timer_counter += 1
+            heapq.heappush(self._timer_heap, (time.monotonic() + delay, self._timer_counter, future, page))
+            self._timer_wakeup.notify()
+
+    def _run_timers(self):
+        this_thread = threading.current_thread()
+        while True:
+            with self._timer_wakeup:
+                while self._timer_thread is this_thread:
+                    now = time.monotonic()
+                    if self._timer_heap and self._timer_heap[0][0] <= now:
+                        _, _, future, page = heapq.heappop(self._timer_heap)
+                        break
+                    timeout = self._timer_heap[0][0] - now if self._timer_heap else None
+                    self._timer_wakeup.wait(timeout)
+                else:
+                    return
+            future._complete(page=page)
@@ -4,6 +4,8 @@ from pydantic import BaseSettings, Field
 
 class Settings(BaseSettings):
     arch_version: str = Field('I', env='ARCHITECTURE_VERSION')
+    # max number of concurrent DB queries per process
+    db_max_concurrency: int = Field(128, env='USER_DATA_DB_MAX_CONCURRENCY')
 
 
 @lru_cache()
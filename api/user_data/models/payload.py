@@ -1,3 +1,4 @@
+from typing import List
 from pydantic import BaseModel
 
 # request models
@@ -5,3 +6,9 @@ from pydantic import BaseModel
 class NewSMS(BaseModel):
     sender_id: str
     sms_text: str
+
+class AddressedSMS(NewSMS):
+    user_id: str
+
+class NewSMSBatch(BaseModel):
+    smss: List[AddressedSMS]
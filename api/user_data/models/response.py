@@ -2,6 +2,7 @@
 Pydantic models representing the content of the database tables.
 """
 
+from typing import List
 from time_uuid import TimeUUID
 from datetime import datetime
 from pydantic import BaseModel
@@ -34,3 +35,6 @@ class InsertionSuccess(BaseModel):
     successful: bool
     msg: str = ''
     sms_id: str = None
+
+class InsertionBatchSuccess(BaseModel):
+    results: List[InsertionSuccess]
@@ -3,6 +3,7 @@ Here the connection to the database is built
 (a `cassandra.cluster.Session` object).
 The session is a "costly" object, so the same instance
 is returned over and over once created, in a singleton pattern.
+The API code uses it through an asyncio-friendly wrapper, itself a singleton.
 """
 
 import os
@@ -12,6 +13,9 @@ from dotenv import load_dotenv, find_dotenv
 from cassandra.cluster import Cluster
 from cassandra.auth import PlainTextAuthProvider
 
+from api.tools.async_cassandra import AsyncSession
+from api.user_data.config.config import getSettings
+
 
 # read .env file for connection params
 dotenv_file = find_dotenv('.env')
@@ -24,6 +28,7 @@ ASTRA_DB_KEYSPACE = os.environ['ASTRA_DB_KEYSPACE']
 # global cache variables to re-use a single Session
 cluster = None
 session = None
+async_session = None
 
 
 def get_session():
@@ -52,6 +57,21 @@ def get_session():
     return session
 
 
+def get_async_session():
+    """
+    Return the asyncio wrapper around the database Session, always the same.
+    """
+    global async_session
+
+    if async_session is None:
+        async_session = AsyncSession(
+            get_session(),
+            max_concurrency=getSettings().db_max_concurrency,
+        )
+
+    return async_session
+
+
 @atexit.register
 def shutdown_driver():
     if session is not None:
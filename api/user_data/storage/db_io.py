@@ -1,6 +1,8 @@
 """
 These functions wrap CQL queries to store and retrieve specific
 kind of items from database tables. These are for direct use by the API code.
+They are coroutines, to be awaited, and expect an `AsyncSession`
+(see api/tools/async_cassandra.py) in place of the driver's Session.
 
 This module, crucially, holds a process-wide (lazy) cache of CQL
 prepared statements, which are used over and over to optimize the API
@@ -25,10 +27,10 @@ def get_prepared_statement(session, stmt):
     return prepared_cache[stmt]
 
 
-def retrieve_sms(session, user_id, sms_id):
+async def retrieve_sms(session, user_id, sms_id):
     get_one_cql = 'SELECT * FROM smss_by_users WHERE user_id=? AND sms_id=?;'
     prepared_get_one = get_prepared_statement(session, get_one_cql)
-    row = session.execute(prepared_get_one, (user_id, sms_id)).one()
+    row = await session.execute_one(prepared_get_one, (user_id, sms_id))
     if row:
         # see a note in 'models.py' about the enrich-with-date extra step
         return DateRichSMS.from_SMS(SMS(**row._asdict()))
@@ -36,19 +38,19 @@ def retrieve_sms(session, user_id, sms_id):
         return row
 
 
-def retrieve_smss_by_sms_id(session, user_id):
+async def retrieve_smss_by_sms_id(session, user_id):
     get_many_cql = 'SELECT * FROM smss_by_users WHERE user_id=?;'
     prepared_get_many = get_prepared_statement(session, get_many_cql)
-    rows = session.execute(prepared_get_many, (user_id,))
-    return (
+    rows = await session.execute(prepared_get_many, (user_id,))
+    return [
         # see a note in 'models.py' about the enrich-with-date extra step
         DateRichSMS.from_SMS(SMS(**row._asdict()))
         for row in rows
-    )
+    ]
 
 
-def store_sms(session, user_id, sms_id, sender_id, sms_text):
+async def store_sms(session, user_id, sms_id, sender_id, sms_text):
     insert_cql = 'INSERT INTO smss_by_users (user_id, sms_id, sender_id, sms_text) VALUES (?, ?, ?, ?);'
     prepared_insert_cql = get_prepared_statement(session, insert_cql)
-    session.execute(prepared_insert_cql, (user_id, sms_id, sender_id, sms_text))
+    await session.execute(prepared_insert_cql, (user_id, sms_id, sender_id, sms_text))
     return
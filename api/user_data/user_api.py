@@ -1,4 +1,5 @@
 import uuid
+import asyncio
 from typing import List
 from fastapi import FastAPI, Depends, Response, status
 
@@ -12,8 +13,8 @@ from api.user_data.storage.db_io import (
     store_sms,
 )
 from api.user_data.utils.db_dependency import g_get_session
-from api.user_data.models.response import DateRichSMS, InsertionSuccess
-from api.user_data.models.payload import NewSMS
+from api.user_data.models.response import DateRichSMS, InsertionSuccess, InsertionBatchSuccess
+from api.user_data.models.payload import NewSMS, NewSMSBatch
 
 
 settings = getSettings()
@@ -37,7 +38,7 @@ permitReactLocalhostClient(app)
 @app.get('/sms/{user_id}/{sms_id_str}', response_model=DateRichSMS)
 async def get_sms(user_id, sms_id_str, response: Response, session=Depends(g_get_session)):
     sms_id = uuid.UUID(sms_id_str)
-    sms = retrieve_sms(session, user_id, sms_id)
+    sms = await retrieve_sms(session, user_id, sms_id)
     if sms:
         return sms
     else:
@@ -47,7 +48,7 @@ async def get_sms(user_id, sms_id_str, response: Response, session=Depends(g_get
 
 @app.get('/sms/{user_id}', response_model=List[DateRichSMS])
 async def get_smss(user_id, session=Depends(g_get_session)):
-    smss = retrieve_smss_by_sms_id(session, user_id)
+    smss = await retrieve_smss_by_sms_id(session, user_id)
     return smss
 
 if architecture_version == 'II':
@@ -55,7 +56,7 @@ if architecture_version == 'II':
     async def post_sms(user_id, newSMS: NewSMS, session=Depends(g_get_session)):
         sms_id = uuid.uuid1()
         try:
-            store_sms(session, user_id, sms_id, newSMS.sender_id, newSMS.sms_text)
+            await store_sms(session, user_id, sms_id, newSMS.sender_id, newSMS.sms_text)
             return InsertionSuccess(
                 successful=True,
                 msg=f'SMS from {newSMS.sender_id} to {user_id} inserted.',
@@ -63,3 +64,28 @@ if architecture_version == 'II':
             )
         except Exception as e:
             return InsertionSuccess(successful=False, msg=str(e))
+
+    @app.post('/sms_batch', response_model=InsertionBatchSuccess)
+    async def post_sms_batch(newSMSBatch: NewSMSBatch, session=Depends(g_get_session)):
+        """
+        Insert several SMS (possibly to different users) at once: the
+        insertions run concurrently, each with its own outcome in the results.
+        """
+        sms_ids = [uuid.uuid1() for _ in newSMSBatch.smss]
+        outcomes = await asyncio.gather(
+            *(
+                store_sms(session, sms.user_id, sms_id, sms.sender_id, sms.sms_text)
+                for sms, sms_id in zip(newSMSBatch.smss, sms_ids)
+            ),
+            return_exceptions=True,
+        )
+        return InsertionBatchSuccess(results=[
+            InsertionSuccess(successful=False, msg=str(outcome))
+            if isinstance(outcome, Exception)
+            else InsertionSuccess(
+                successful=True,
+                msg=f'SMS from {sms.sender_id} to {sms.user_id} inserted.',
+                sms_id=str(sms_id),
+            )
+            for sms, sms_id, outcome in zip(newSMSBatch.smss, sms_ids, outcomes)
+        ])
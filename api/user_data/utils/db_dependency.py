@@ -1,11 +1,11 @@
-from api.user_data.storage.db_connect import get_session
+from api.user_data.storage.db_connect import get_async_session
 
 
 async def g_get_session():
     """
-    In itself, the `get_session` function returns the connection.
+    In itself, the `get_async_session` function returns the (asyncio-wrapped) connection.
     To make this interoperable with the FastAPI `Depends`-based dependency
-    paradigm, here `get_session` is simply wrapped as an async function
+    paradigm, here `get_async_session` is simply wrapped as an async function
     `yeld`ing the session.
     """
-    yield get_session()
+    yield get_async_session()
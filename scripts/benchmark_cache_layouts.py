@@ -0,0 +1,136 @@
+"""
+Compare the "json" and "digest" layouts of the prediction cache table
+(see api/model_serving/storage/cache_codec.py) on texts from the raw dataset:
+
+- size of partition keys and stored values;
+- time to build the key and to decode a stored value, in-process;
+- (with --db) lookup latency against the actual tables on Astra DB
+  (a sample of entries is written to both tables first).
+
+Usage: python scripts/benchmark_cache_layouts.py [num_samples] [--db]
+"""
+
+import os
+import sys
+import time
+import json
+import statistics
+import pandas as pd
+
+from analysis.features1.feature1_extractor import Feature1Extractor
+from api.model_serving.storage.cache_codec import JsonCacheLayout, DigestCacheLayout
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+raw_input_file = os.path.join(base_dir, '..', 'raw_data', 'raw_dataset.csv')
+
+DEFAULT_NUM_SAMPLES = 1000
+VERSION = 'benchmark'
+
+
+def _percentiles(values):
+    qs = statistics.quantiles(values, n=100)
+    return f'p50={qs[49] * 1000:.3f}ms p95={qs[94] * 1000:.3f}ms p99={qs[98] * 1000:.3f}ms'
+
+
+def _sample_entries(num_samples):
+    # (endpoint, input, output) triples, as they would be cached by the API
+    texts = pd.read_csv(raw_input_file)['text'].head(num_samples).tolist()
+    f1_extractor = Feature1Extractor()
+    entries = []
+    for text in texts:
+        features = f1_extractor.get_features_list(text)
+        prediction = {'ham': 1 - features[0], 'spam': features[0]}
+        entries += [
+            ('text_to_features', text, features),
+            ('features_to_prediction', features, prediction),
+            ('text_to_prediction', text, prediction),
+        ]
+    return entries
+
+
+def _storage_sizes(layout, entries):
+    key_bytes = 0
+    value_bytes = 0
+    for endpoint, input, output in entries:
+        params = layout.insert_params(endpoint, VERSION, layout.input_key(input), output)
+        key_bytes += len(params[2] if isinstance(params[2], bytes) else params[2].encode('utf-8'))
+        value_bytes += sum(
+            len(p if isinstance(p, bytes) else p.encode('utf-8'))
+            for p in params[3:]
+            if p is not None
+        )
+    return key_bytes, value_bytes
+
+
+def _codec_timings(layout, entries):
+    key_times = []
+    decode_times = []
+    for endpoint, input, output in entries:
+        t0 = time.perf_counter()
+        input_key = layout.input_key(input)
+        key_times.append(time.perf_counter() - t0)
+        params = layout.insert_params(endpoint, VERSION, input_key, output)
+        if isinstance(layout, JsonCacheLayout):
+            row = type('Row', (), {'output_json': params[3]})
+        else:
+            row = type('Row', (), {'input_blob': params[3], 'output_blob': params[4]})
+        t0 = time.perf_counter()
+        layout.decode_row(row, input_key)
+        decode_times.append(time.perf_counter() - t0)
+    return key_times, decode_times
+
+
+def _db_lookup_timings(session, layout, entries):
+    insert = session.prepare(layout.insert_cql)
+    select = session.prepare(layout.select_cql)
+    futures = [
+        session.execute_async(insert, layout.insert_params(endpoint, VERSION, layout.input_key(input), output))
+        for endpoint, input, output in entries
+    ]
+    for future in futures:
+        future.result()
+    #
+    lookup_times = []
+    for endpoint, input, _ in entries:
+        t0 = time.perf_counter()
+        input_key = layout.input_key(input)
+        row = session.execute(select, layout.select_params(endpoint, VERSION, input_key)).one()
+        layout.decode_row(row, input_key)
+        lookup_times.append(time.perf_counter() - t0)
+    return lookup_times
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    use_db = '--db' in sys.argv[1:]
+    num_samples = int(args[0]) if args else DEFAULT_NUM_SAMPLES
+    #
+    entries = _sample_entries(num_samples)
+    layouts = {
+        'json': JsonCacheLayout(),
+        'digest': DigestCacheLayout(collision_check=True),
+        'digest (no input)': DigestCacheLayout(collision_check=False),
+    }
+    if use_db:
+        from api.user_data.storage.db_connect import get_session
+        session = get_session()
+    #
+    print(f'** {len(entries)} cache entries from {num_samples} texts')
+    results = {}
+    for layout_name, layout in layouts.items():
+        key_bytes, value_bytes = _storage_sizes(layout, entries)
+        key_times, decode_times = _codec_timings(layout, entries)
+        print(f'  * {layout_name}')
+        print(f'      keys:   {key_bytes:>10} bytes ({key_bytes / len(entries):.1f}/entry)')
+        print(f'      values: {value_bytes:>10} bytes ({value_bytes / len(entries):.1f}/entry)')
+        print(f'      key build:    {_percentiles(key_times)}')
+        print(f'      value decode: {_percentiles(decode_times)}')
+        results[layout_name] = {
+            'key_bytes': key_bytes,
+            'value_bytes': value_bytes,
+        }
+        if use_db:
+            lookup_times = _db_lookup_timings(session, layout, entries)
+            print(f'      DB lookup:    {_percentiles(lookup_times)}')
+            results[layout_name]['lookup_mean_s'] = statistics.mean(lookup_times)
+    print(json.dumps(results, indent=2))
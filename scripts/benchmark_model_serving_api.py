@@ -0,0 +1,374 @@
+"""
+Load-test the model serving API in-process, with an in-memory stand-in
+for the database (see api/tools/fake_cassandra.py).
+
+The app is driven directly through its ASGI interface (no network, no
+HTTP client), by `concurrency` concurrent clients each sending requests
+back to back. Texts come from the raw dataset and, if present, from a
+JSON-lines file of recorded requests (a "text" or "texts" field per line).
+For each (version, endpoint) pair, a set of "warm" inputs is requested once
+beforehand: then each measured request (each item, for batch endpoints)
+reuses a warm input with probability `hit_ratio` and a never-seen one
+otherwise. (For the features_to_prediction endpoints distinct texts may
+share the same features, so the actual hit ratio can be somewhat higher.)
+
+Reported per run: throughput, client-side latency percentiles, errors
+(including failed cache and call-log writes, which the API only logs),
+cache lookups and the per-stage breakdown from the API's own metrics.
+Results can be saved as JSON and two such files compared.
+
+Usage:
+    python scripts/benchmark_model_serving_api.py [--versions=v1,v2,v3]
+        [--endpoints=text_to_prediction,...] [--concurrency=16] [--requests=1000]
+        [--hit-ratio=0.5] [--batch-size=16] [--db-latency-ms=1.0] [--db-jitter-ms=1.0]
+        [--requests-file=requests.jsonl] [--output=results.json]
+    python scripts/benchmark_model_serving_api.py --compare old.json new.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import statistics
+import subprocess
+from datetime import datetime
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+raw_input_file = os.path.join(base_dir, '..', 'raw_data', 'raw_dataset.csv')
+
+DEFAULT_OPTIONS = {
+    'versions': 'v1',
+    'endpoints': 'text_to_features,features_to_prediction,text_to_prediction,text_to_prediction_batch',
+    'concurrency': 16,
+    'requests': 1000,
+    'hit_ratio': 0.5,
+    'batch_size': 16,
+    'db_latency_ms': 1.0,
+    'db_jitter_ms': 1.0,
+    'requests_file': os.path.join(base_dir, '..', 'requests.jsonl'),
+    'output': '',
+    'seed': 123,
+}
+
+CLIENT_HOST = '10.0.0.1'
+MAX_WARM_INPUTS = 200
+
+
+def _parse_options(argv):
+    options = dict(DEFAULT_OPTIONS)
+    positional = []
+    for arg in argv:
+        if arg.startswith('--'):
+            key, _, value = arg[2:].partition('=')
+            key = key.replace('-', '_')
+            default = DEFAULT_OPTIONS.get(key)
+            options[key] = type(default)(value) if default is not None and value != '' else (value or True)
+        else:
+            positional.append(arg)
+    return options, positional
+
+
+def _load_texts(requests_file):
+    texts = pd.read_csv(raw_input_file)['text'].tolist()
+    if requests_file and os.path.isfile(requests_file):
+        with open(requests_file) as f:
+            for line in f:
+                if line.strip() == '':
+                    continue
+                request = json.loads(line)
+                if isinstance(request.get('text'), str):
+                    texts.append(request['text'])
+                texts.extend(t for t in request.get('texts', []) if isinstance(t, str))
+    # unique, in a stable order
+    return list(dict.fromkeys(texts))
+
+
+def _percentiles(values):
+    if len(values) < 2:
+        return {'p50': None, 'p95': None, 'p99': None}
+    qs = statistics.quantiles(values, n=100)
+    return {'p50': qs[49], 'p95': qs[94], 'p99': qs[98]}
+
+
+async def _asgi_post(app, path, payload):
+    """
+    Run a POST with a JSON body through the ASGI app, return (status, body bytes).
+    """
+    body = json.dumps(payload).encode('utf-8')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [
+            (b'host', b'benchmark'),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+        'client': (CLIENT_HOST, 50000),
+        'server': ('benchmark', 80),
+    }
+    request_messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = None
+    chunks = []
+
+    async def receive():
+        if request_messages:
+            return request_messages.pop(0)
+        # the client never disconnects: wait until cancelled
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return status, b''.join(chunks)
+
+
+class _InputPicker():
+    """
+    Hands out warm (already requested) or fresh (never seen) texts.
+    """
+
+    def __init__(self, texts, num_warm, hit_ratio, rng):
+        self.warm = texts[:num_warm]
+        self.fresh = iter(texts[num_warm:])
+        self.hit_ratio = hit_ratio
+        self.rng = rng
+        self.num_variants = 0
+
+    def _fresh_text(self):
+        text = next(self.fresh, None)
+        if text is None:
+            # out of texts: make up new, unique ones
+            self.num_variants += 1
+            text = f'{self.rng.choice(self.warm)} ({self.num_variants})'
+        return text
+
+    def pick(self):
+        if self.rng.random() < self.hit_ratio:
+            return self.rng.choice(self.warm)
+        else:
+            return self._fresh_text()
+
+
+def _build_workload(version, endpoint, texts, options, rng, model_registry):
+    """
+    Return (warm-up requests, measured requests), as (path, payload) lists.
+    """
+    is_batch = endpoint.endswith('_batch')
+    takes_features = endpoint.startswith('features_to_prediction')
+    batch_size = options['batch_size'] if is_batch else 1
+    shuffled = list(texts)
+    rng.shuffle(shuffled)
+    num_warm = max(1, min(MAX_WARM_INPUTS, len(shuffled) // 4))
+    picker = _InputPicker(shuffled, num_warm, options['hit_ratio'], rng)
+    #
+    warm_groups = [
+        picker.warm[offset: offset + batch_size]
+        for offset in range(0, len(picker.warm), batch_size)
+    ]
+    measured_groups = [
+        [picker.pick() for _ in range(batch_size)]
+        for _ in range(options['requests'])
+    ]
+    if takes_features:
+        all_texts = list(dict.fromkeys(t for group in warm_groups + measured_groups for t in group))
+        with model_registry.lease(version) as model:
+            features_map = {
+                text: [float(f) for f in features]
+                for text, features in zip(all_texts, model.texts_to_features(all_texts))
+            }
+    #
+    path = f'/model/{version}/{endpoint}'
+
+    def _payload(group):
+        if takes_features:
+            inputs = [features_map[text] for text in group]
+            return {'features': inputs} if is_batch else {'features': inputs[0]}
+        else:
+            return {'texts': group} if is_batch else {'text': group[0]}
+
+    return (
+        [(path, _payload(group)) for group in warm_groups],
+        [(path, _payload(group)) for group in measured_groups],
+    )
+
+
+async def _run_requests(app, requests, concurrency):
+    """
+    Closed-loop load: return (elapsed seconds, latencies, statuses).
+    """
+    latencies = [None] * len(requests)
+    statuses = [None] * len(requests)
+    indices = iter(range(len(requests)))
+
+    async def _client():
+        for idx in indices:
+            path, payload = requests[idx]
+            t0 = time.perf_counter()
+            statuses[idx], _ = await _asgi_post(app, path, payload)
+            latencies[idx] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_client() for _ in range(concurrency)))
+    return time.perf_counter() - t0, latencies, statuses
+
+
+def _stage_breakdown(serving_metrics, version, endpoint, num_requests):
+    stages = {}
+    for (s_version, s_endpoint, stage), (bucket_counts, total) in serving_metrics.stage_latency.series.items():
+        if (s_version, s_endpoint) == (version, endpoint):
+            stages[stage] = {
+                'mean_ms_per_request': 1000 * total / num_requests,
+                'count': sum(bucket_counts),
+            }
+    return stages
+
+
+def _cache_lookups(serving_metrics, version, endpoint):
+    lookups = {}
+    for (s_version, s_endpoint, cache, result), count in serving_metrics.cache_lookups.values.items():
+        if (s_version, s_endpoint) == (version, endpoint):
+            lookups.setdefault(cache, {'hit': 0, 'miss': 0})[result] = count
+    return lookups
+
+
+def _format_ms(seconds):
+    return f'{seconds * 1000:.2f}ms' if seconds is not None else 'n/a'
+
+
+async def _benchmark(options, texts):
+    from api.model_serving.model_serving_api import app
+    from api.model_serving.routers.model_router import serving_metrics, model_registry
+    from api.model_serving.storage.db_io import l1_cache, write_failure_stats
+    from api.model_serving.routers.model_router import call_log_buffer
+    #
+    rng = random.Random(options['seed'])
+    await app.router.startup()
+    runs = []
+    try:
+        for version in options['versions'].split(','):
+            for endpoint in options['endpoints'].split(','):
+                warm_requests, measured_requests = _build_workload(version, endpoint, texts, options, rng, model_registry)
+                print(f'** {version} {endpoint}: {len(warm_requests)} warm-up, {len(measured_requests)} measured requests')
+                await _run_requests(app, warm_requests, options['concurrency'])
+                serving_metrics.reset()
+                write_failure_stats.clear()
+                elapsed, latencies, statuses = await _run_requests(app, measured_requests, options['concurrency'])
+                if call_log_buffer is not None:
+                    # (buffered items of this run count, as long as they are written)
+                    await call_log_buffer.flush()
+                num_items = len(measured_requests) * (options['batch_size'] if endpoint.endswith('_batch') else 1)
+                run = {
+                    'version': version,
+                    'endpoint': endpoint,
+                    'requests': len(measured_requests),
+                    'items': num_items,
+                    'elapsed_s': elapsed,
+                    'requests_per_s': len(measured_requests) / elapsed,
+                    'items_per_s': num_items / elapsed,
+                    'errors': sum(1 for status in statuses if status != 200),
+                    'cache_write_failures': write_failure_stats['cache'],
+                    'call_log_write_failures': write_failure_stats['call_log'],
+                    'latency_s': {
+                        'mean': statistics.mean(latencies),
+                        'max': max(latencies),
+                        **_percentiles(latencies),
+                    },
+                    'stages': _stage_breakdown(serving_metrics, version, endpoint, len(measured_requests)),
+                    'cache_lookups': _cache_lookups(serving_metrics, version, endpoint),
+                }
+                runs.append(run)
+                print(f'    {run["requests_per_s"]:.1f} req/s ({run["items_per_s"]:.1f} items/s), {run["errors"]} errors')
+                if run['cache_write_failures'] > 0 or run['call_log_write_failures'] > 0:
+                    print(f'    WARNING: {run["cache_write_failures"]} cache and {run["call_log_write_failures"]} call-log writes failed')
+                print('    latency: ' + ' '.join(
+                    f'{name}={_format_ms(run["latency_s"][name])}'
+                    for name in ['p50', 'p95', 'p99', 'max']
+                ))
+                for stage, stage_info in sorted(run['stages'].items()):
+                    print(f'      {stage:<16} {stage_info["mean_ms_per_request"]:>9.3f} ms/request ({stage_info["count"]} timings)')
+                l1_cache.clear()
+    finally:
+        await app.router.shutdown()
+    return runs
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=base_dir, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(old_file, new_file):
+    old, new = (json.load(open(file_name)) for file_name in (old_file, new_file))
+    old_runs = {(run['version'], run['endpoint']): run for run in old['runs']}
+    print(f'** {old_file} ({old.get("git_commit")}) => {new_file} ({new.get("git_commit")})')
+    for run in new['runs']:
+        old_run = old_runs.get((run['version'], run['endpoint']))
+        if old_run is None:
+            continue
+        print(f'  * {run["version"]} {run["endpoint"]}')
+        metrics = [('req/s', old_run['requests_per_s'], run['requests_per_s'])] + [
+            (name, old_run['latency_s'][name], run['latency_s'][name])
+            for name in ['p50', 'p95', 'p99']
+        ]
+        for name, old_value, new_value in metrics:
+            if old_value and new_value is not None:
+                print(f'      {name:<6} {old_value:>12.5f} => {new_value:>12.5f} ({100 * (new_value - old_value) / old_value:+.1f}%)')
+
+
+if __name__ == '__main__':
+    options, positional = _parse_options(sys.argv[1:])
+    if options.get('compare'):
+        _compare(*positional[:2])
+        sys.exit(0)
+    #
+    os.environ['SPAM_MODEL_VERSIONS'] = options['versions']
+    os.environ['SPAM_MODEL_LOADING'] = 'eager'
+    os.environ.setdefault('SPAM_METRICS_ENABLED', '1')
+    # the connection parameters are required, but never used
+    for env_var in ['ASTRA_DB_CLIENT_ID', 'ASTRA_DB_CLIENT_SECRET', 'ASTRA_DB_SECURE_BUNDLE_PATH', 'ASTRA_DB_KEYSPACE']:
+        os.environ.setdefault(env_var, 'benchmark')
+    from api.tools.fake_cassandra import FakeCassandraSession
+    from api.model_serving.storage import db_connect
+    fake_session = FakeCassandraSession(
+        latency_ms=options['db_latency_ms'],
+        jitter_ms=options['db_jitter_ms'],
+        seed=options['seed'],
+    )
+    db_connect.session = fake_session
+    #
+    texts = _load_texts(options['requests_file'])
+    print(f'** {len(texts)} distinct texts')
+    runs = asyncio.run(_benchmark(options, texts))
+    print(f'** {fake_session.num_queries} DB queries')
+    fake_session.shutdown()
+    db_connect.session = None
+    #
+    if options['output']:
+        with open(options['output'], 'w') as f:
+            json.dump({
+                'timestamp': datetime.now().isoformat(),
+                'git_commit': _git_commit(),
+                'options': options,
+                'runs': runs,
+            }, f, indent=2)
+        print(f'** Results saved to {options["output"]}')
@@ -0,0 +1,73 @@
+"""
+Microbenchmark of the "v1" model prediction: the original path (one-row
+pandas DataFrame + `predict`, returning a one-hot vector) against the
+NumPy path of `RandomForestModel` (preallocated array + `predict_proba`),
+single-row and batched. Features are computed beforehand on texts from
+the raw dataset, so that only the model call is timed.
+
+Usage: python scripts/benchmark_random_forest_model.py [num_samples]
+"""
+
+import os
+import sys
+import time
+import joblib
+import pandas as pd
+
+from analysis.features1.feature1_extractor import Feature1Extractor
+from api.model_serving.aimodels.RandomForestModel import RandomForestModel
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+raw_input_file = os.path.join(base_dir, '..', 'raw_data', 'raw_dataset.csv')
+model_path = os.path.join(base_dir, '..', 'models', 'model1_2019', 'model1.pkl')
+
+DEFAULT_NUM_SAMPLES = 1000
+
+
+def _legacy_prediction_vector(model, feature_names, num_labels, features):
+    # the original implementation
+    predicted_idx = model.predict(pd.DataFrame({
+        k: [v]
+        for k, v in zip(feature_names, features)
+    }))[0]
+    return [
+        1 if idx == predicted_idx else 0
+        for idx in range(num_labels)
+    ]
+
+
+def _time_it(label, num_items, function):
+    t0 = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - t0
+    print(f'  {label:<28} {elapsed:8.3f} s  ({elapsed / num_items * 1000000:9.1f} us/item)')
+    return result
+
+
+if __name__ == '__main__':
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_SAMPLES
+    texts = pd.read_csv(raw_input_file)['text'].head(num_samples).tolist()
+    #
+    f1_extractor = Feature1Extractor()
+    features_list = [f1_extractor.get_features_list(text) for text in texts]
+    # the legacy path needs the estimator exactly as stored
+    legacy_model = joblib.load(model_path)
+    model = RandomForestModel(model_path, f1_extractor, ['ham', 'spam'])
+    #
+    print(f'** {len(features_list)} feature vectors')
+    legacy = _time_it('legacy (DataFrame, predict)', len(features_list), lambda: [
+        _legacy_prediction_vector(legacy_model, f1_extractor.FEATURE_ORDERED_LIST, 2, features)
+        for features in features_list
+    ])
+    single = _time_it('numpy, single row', len(features_list), lambda: [
+        model.features_to_prediction_vector(features)
+        for features in features_list
+    ])
+    batched = _time_it('numpy, one batch', len(features_list), lambda: model.features_to_prediction_vectors(features_list))
+    #
+    agreement = sum(
+        1 if max(range(2), key=lambda i: prob_v[i]) == max(range(2), key=lambda i: onehot_v[i]) else 0
+        for prob_v, onehot_v in zip(single, legacy)
+    )
+    print(f'  top-label agreement with legacy: {agreement}/{len(legacy)}')
+    print(f'  single vs. batched identical:    {single == batched}')
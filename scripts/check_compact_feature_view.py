@@ -0,0 +1,63 @@
+"""
+Check that the offline-only "sms_features2_compact" feature view is usable
+by Feast: its source stores the features as an Arrow fixed-size list of
+uint8, while the view declares them as Array(Int64) (Feast has no narrower
+or fixed-size list type). Historical retrieval on a sample of messages must
+give the same vectors as the "sms_features2" view and as the file itself
+read through `load_feature_matrix`.
+
+To be run after `feast apply` with a stage defining both views.
+
+Usage: FEAST_STORE_STAGE=2020 python scripts/check_compact_feature_view.py [num_samples]   (default: 500)
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+from feast import FeatureStore
+
+from analysis.offline_sources.compact_features import load_feature_matrix
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+store_dir = os.path.join(base_dir, '..', 'sms_feature_store')
+data_dir = os.path.join(base_dir, '..', 'offline_data')
+compact_file = os.path.join(data_dir, 'sms_features2_compact.parquet')
+
+
+def _retrieve(store, entity_df, view_name):
+    retrieved = store.get_historical_features(
+        entity_df=entity_df,
+        features=[f'{view_name}:features'],
+    ).to_df()
+    by_id = retrieved.set_index('sms_id')['features']
+    return np.array([
+        np.asarray(by_id[sms_id], dtype=np.int64)
+        for sms_id in entity_df['sms_id']
+    ])
+
+
+if __name__ == '__main__':
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    sms_ids, matrix = load_feature_matrix(compact_file)
+    timestamps = pd.read_parquet(compact_file, columns=['event_timestamp'])['event_timestamp']
+    #
+    sample = np.random.default_rng(0).choice(len(sms_ids), size=min(num_samples, len(sms_ids)), replace=False)
+    entity_df = pd.DataFrame({
+        'sms_id': sms_ids[sample],
+        'event_timestamp': timestamps.iloc[sample].to_numpy(),
+    })
+    expected = matrix[sample].astype(np.int64)
+    #
+    store = FeatureStore(repo_path=store_dir)
+    compact_out = _retrieve(store, entity_df, 'sms_features2_compact')
+    legacy_out = _retrieve(store, entity_df, 'sms_features2')
+    #
+    all_ok = True
+    for name, out in [('sms_features2_compact', compact_out), ('sms_features2', legacy_out)]:
+        ok = out.shape == expected.shape and bool((out == expected).all())
+        print(f'{name:<24} {len(entity_df)} samples, shape {out.shape}: {"OK" if ok else "MISMATCH"}')
+        all_ok = all_ok and ok
+    #
+    sys.exit(0 if all_ok else 1)
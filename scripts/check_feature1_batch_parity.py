@@ -0,0 +1,50 @@
+"""
+Check that `Feature1Extractor.get_features_batch` gives exactly the same
+features as the per-text `get_features_list`, on all texts of the raw
+dataset (plus a few tricky ones), and compare their timings.
+
+Usage: python scripts/check_feature1_batch_parity.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from analysis.features1.feature1_extractor import Feature1Extractor
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+raw_input_file = os.path.join(base_dir, '..', 'raw_data', 'raw_dataset.csv')
+
+EXTRA_TEXTS = [
+    '',
+    '   ',
+    'He said "WIN" and I won\'t',
+    "''quoted'' win's cash",
+    'f.r.e.e c-a-s-h!! WINNER.Call now',
+    '“free” «prize» money’s cannot',
+    'wın ſome caſh',
+]
+
+
+if __name__ == '__main__':
+    texts = pd.read_csv(raw_input_file)['text'].tolist() + EXTRA_TEXTS
+    f1_extractor = Feature1Extractor()
+    #
+    t0 = time.perf_counter()
+    per_text = np.array([f1_extractor.get_features_list(text) for text in texts], dtype=np.float64)
+    per_text_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    batch = f1_extractor.get_features_batch(texts)
+    batch_time = time.perf_counter() - t0
+    #
+    mismatches = np.nonzero((per_text != batch).any(axis=1))[0]
+    for idx in mismatches[:10]:
+        print(f'  MISMATCH on {repr(texts[idx])}:')
+        print(f'      per-text: {per_text[idx].tolist()}')
+        print(f'      batch:    {batch[idx].tolist()}')
+    print(f'** {"OK" if len(mismatches) == 0 else "MISMATCH"}: {len(texts) - len(mismatches)}/{len(texts)} identical')
+    print(f'    per-text {per_text_time:.3f} s, batch {batch_time:.3f} s ({per_text_time / batch_time:.1f}x)')
+    #
+    sys.exit(0 if len(mismatches) == 0 else 1)
@@ -0,0 +1,82 @@
+"""
+Check that the Tensorflow-free `SequenceTokenizer` (as used by
+Feature2Extractor) gives exactly the same padded sequences as the Keras
+tokenizer it was compiled from, on all texts of the raw dataset (plus a
+few tricky ones), and compare their timings.
+The compact vocabulary file, if present, is checked as well.
+Requires Tensorflow.
+
+Usage: python scripts/check_feature2_tokenizer_parity.py
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+from tensorflow.keras.preprocessing.text import tokenizer_from_json
+
+from analysis.features2.sequence_tokenizer import SequenceTokenizer
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+raw_input_file = os.path.join(base_dir, '..', 'raw_data', 'raw_dataset.csv')
+
+tokenizer_dir = os.path.join(base_dir, '..', 'models', 'model2_2020', 'tokenizer')
+input_metadata_file = os.path.join(tokenizer_dir, 'settings.json')
+input_tokenizer_file = os.path.join(tokenizer_dir, 'tokenizer.json')
+input_vocabulary_file = os.path.join(tokenizer_dir, 'vocabulary.json')
+
+EXTRA_TEXTS = [
+    '',
+    '   ',
+    'FREE free Free fReE',
+    'call\tnow\nto win,the;cash...',
+    'won\'t you call\r\nme\xa0now',
+    'İstanbul ÉTÉ straße',
+    ' '.join(['you'] * 100),
+]
+
+
+def compare(name, expected, actual, texts):
+    mismatches = np.nonzero((expected != actual).any(axis=1))[0]
+    for idx in mismatches[:10]:
+        print(f'  MISMATCH ({name}) on {repr(texts[idx])}:')
+        print(f'      keras: {expected[idx].tolist()}')
+        print(f'      {name}: {actual[idx].tolist()}')
+    print(f'** {"OK" if len(mismatches) == 0 else "MISMATCH"} ({name}): {len(texts) - len(mismatches)}/{len(texts)} identical')
+    return len(mismatches) == 0
+
+
+if __name__ == '__main__':
+    texts = pd.read_csv(raw_input_file)['text'].tolist() + EXTRA_TEXTS
+    max_seq_length = json.load(open(input_metadata_file))['MAX_SEQ_LENGTH']
+    tokenizer_json = open(input_tokenizer_file).read()
+    #
+    keras_tokenizer = tokenizer_from_json(tokenizer_json)
+    t0 = time.perf_counter()
+    expected = np.array([
+        pad_sequences(keras_tokenizer.texts_to_sequences([text]), maxlen=max_seq_length)[0]
+        for text in texts
+    ])
+    keras_time = time.perf_counter() - t0
+    #
+    sequence_tokenizer = SequenceTokenizer.from_keras_json(tokenizer_json, max_seq_length)
+    t0 = time.perf_counter()
+    single = np.array([sequence_tokenizer.text_to_padded(text) for text in texts])
+    single_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    batch = sequence_tokenizer.texts_to_padded(texts)
+    batch_time = time.perf_counter() - t0
+    #
+    ok = compare('single', expected, single, texts)
+    ok = compare('batch', expected, batch, texts) and ok
+    if os.path.isfile(input_vocabulary_file):
+        vocabulary_tokenizer = SequenceTokenizer.from_vocabulary_file(input_vocabulary_file)
+        ok = compare('vocabulary file', expected, vocabulary_tokenizer.texts_to_padded(texts), texts) and ok
+    else:
+        print(f'   (no {input_vocabulary_file}: run scripts/convert_tokenizer_2.py to check it too)')
+    print(f'    keras {keras_time:.3f} s, single {single_time:.3f} s ({keras_time / single_time:.1f}x), batch {batch_time:.3f} s ({keras_time / batch_time:.1f}x)')
+    #
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,72 @@
+"""
+Check that the NumPy inference backend for the LSTM models gives the same
+outputs as Keras, on all texts of the raw dataset, and compare their timings
+(one batch with all texts, and one text at a time on a sample).
+
+Usage: python scripts/check_numpy_lstm_parity.py [version ...]   (default: v2 v3)
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from analysis.features2.feature2_extractor import Feature2Extractor
+from api.model_serving.aimodels.KerasLSTMModel import KerasLSTMModel
+from api.model_serving.aimodels.NumpyLSTMModel import NumpyLSTMModel
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+models_dir = os.path.join(base_dir, '..', 'models')
+raw_input_file = os.path.join(base_dir, '..', 'raw_data', 'raw_dataset.csv')
+
+MODEL_FILES = {
+    'v2': ('model2_2020', 'model2'),
+    'v3': ('model3_2021', 'model3'),
+}
+TOLERANCE = 1e-5
+NUM_SINGLE_SAMPLES = 200
+
+
+def _timed(function):
+    t0 = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    versions = sys.argv[1:] or ['v2', 'v3']
+    texts = pd.read_csv(raw_input_file)['text'].tolist()
+    f2_extractor = Feature2Extractor()
+    features_list = [f2_extractor.get_features_list(text) for text in texts]
+    #
+    all_ok = True
+    for version in versions:
+        model_dir, model_name = MODEL_FILES[version]
+        model_args = dict(
+            model_path=os.path.join(models_dir, model_dir, 'classifier', f'{model_name}.h5'),
+            model_metadata_path=os.path.join(models_dir, model_dir, 'classifier', f'{model_name}_metadata.json'),
+            feature_extractor=f2_extractor,
+        )
+        keras_model = KerasLSTMModel(**model_args)
+        numpy_model = NumpyLSTMModel(**model_args)
+        #
+        keras_out, keras_time = _timed(lambda: np.array(keras_model.features_to_prediction_vectors(features_list)))
+        numpy_out, numpy_time = _timed(lambda: np.array(numpy_model.features_to_prediction_vectors(features_list)))
+        max_diff = np.abs(keras_out - numpy_out).max()
+        same_top = (keras_out.argmax(axis=1) == numpy_out.argmax(axis=1)).sum()
+        #
+        samples = features_list[:NUM_SINGLE_SAMPLES]
+        _, keras_single_time = _timed(lambda: [keras_model.features_to_prediction_vector(f) for f in samples])
+        numpy_single_out, numpy_single_time = _timed(lambda: [numpy_model.features_to_prediction_vector(f) for f in samples])
+        single_diff = np.abs(np.array(numpy_single_out) - numpy_out[:len(samples)]).max()
+        #
+        ok = max_diff <= TOLERANCE and single_diff <= TOLERANCE
+        all_ok = all_ok and ok
+        print(f'** {version}: {"OK" if ok else "MISMATCH"}')
+        print(f'    max |keras - numpy| = {max_diff:.2e} over {len(features_list)} texts (single-item mode: {single_diff:.2e})')
+        print(f'    same top label: {same_top}/{len(features_list)}')
+        print(f'    batch:  keras {keras_time:.3f} s, numpy {numpy_time:.3f} s')
+        print(f'    single: keras {keras_single_time / len(samples) * 1000:.3f} ms/item, numpy {numpy_single_time / len(samples) * 1000:.3f} ms/item')
+    #
+    sys.exit(0 if all_ok else 1)
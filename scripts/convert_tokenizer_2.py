@@ -0,0 +1,36 @@
+"""
+One-time conversion of the (full) Keras tokenizer of the "v2" features
+into the compact vocabulary file read by `SequenceTokenizer`:
+only the filtering/splitting rules and the words actually used
+(the first MAX_NUM_WORDS - 1) are kept.
+
+Usage: python scripts/convert_tokenizer_2.py
+"""
+
+import os
+import json
+
+from analysis.features2.sequence_tokenizer import SequenceTokenizer
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+
+tokenizer_dir = os.path.join(base_dir, '..', 'models', 'model2_2020', 'tokenizer')
+input_metadata_file = os.path.join(tokenizer_dir, 'settings.json')
+input_tokenizer_file = os.path.join(tokenizer_dir, 'tokenizer.json')
+output_vocabulary_file = os.path.join(tokenizer_dir, 'vocabulary.json')
+
+if __name__ == '__main__':
+    tokenizer_metadata = json.load(open(input_metadata_file))
+    sequence_tokenizer = SequenceTokenizer.from_keras_json(
+        open(input_tokenizer_file).read(),
+        max_seq_length=tokenizer_metadata['MAX_SEQ_LENGTH'],
+    )
+    sequence_tokenizer.save_vocabulary(output_vocabulary_file)
+
+    print('Done (%s, %i bytes ==> %s, %i bytes, %i words)' % (
+        input_tokenizer_file,
+        os.path.getsize(input_tokenizer_file),
+        output_vocabulary_file,
+        os.path.getsize(output_vocabulary_file),
+        len(sequence_tokenizer.word_index),
+    ))
@@ -1,8 +1,19 @@
+"""
+Build the "v1" offline sources (features and labels) from the raw dataset.
+
+Usage: python scripts/create_offline_sources_1.py [num_workers] [chunk_size] [--incremental]
+(num_workers defaults to one per CPU, 0 extracts in this process).
+With --incremental, only new or changed rows are computed, and the outputs
+are directories of partitions (see analysis/offline_sources/offline_source_builder.py).
+"""
+
 import os
+import sys
 import datetime
 import pandas as pd
 
 from analysis.features1.feature1_extractor import Feature1Extractor
+from analysis.offline_sources.offline_source_builder import OfflineSource, build_offline_sources, DEFAULT_CHUNK_SIZE
 
 base_dir = os.path.abspath(os.path.dirname(__file__))
 offline_data_dir = os.path.join(base_dir, '..', 'offline_data')
@@ -11,26 +22,45 @@ raw_input_file = os.path.join(base_dir, '..', 'raw_data', 'raw_dataset.csv')
 feature_output_file = os.path.join(offline_data_dir, 'sms_features1.parquet')
 label_output_file = os.path.join(offline_data_dir, 'sms_labels.parquet')
 
-if __name__ == '__main__':
-    #
-    raw_df = pd.read_csv(raw_input_file)
-    raw_df['event_timestamp'] = datetime.datetime(2019, 2, 3)
-
-    #
-    f1_extractor = Feature1Extractor()
-    feature_list = f1_extractor.FEATURE_ORDERED_LIST
-    #
-    raw_df['features'] = raw_df['text'].map(f1_extractor.get_features)
+event_timestamp = datetime.datetime(2019, 2, 3)
+
+
+def feature_columns(chunk_df, feature_matrix):
+    fea_df = pd.DataFrame({
+        'event_timestamp': event_timestamp,
+        'sms_id': chunk_df['sms_id'],
+    })
     # flatten the features for readability
-    for fea_k in feature_list:
-        raw_df[fea_k]=raw_df['features'].map(lambda f: f[fea_k])
+    for fea_i, fea_k in enumerate(Feature1Extractor.FEATURE_ORDERED_LIST):
+        fea_df[fea_k] = feature_matrix[:, fea_i]
+        if fea_k.startswith('cw_scores'):
+            # cue-word flags are integers
+            fea_df[fea_k] = fea_df[fea_k].astype('int64')
+    return fea_df
 
-    # select
-    fea_df = raw_df[['event_timestamp', 'sms_id'] + feature_list]
-    lab_df = raw_df[['event_timestamp', 'sms_id', 'label']]
 
-    fea_df.to_parquet(feature_output_file)
-    lab_df.to_parquet(label_output_file)
+def label_columns(chunk_df, feature_matrix):
+    return pd.DataFrame({
+        'event_timestamp': event_timestamp,
+        'sms_id': chunk_df['sms_id'],
+        'label': chunk_df['label'],
+    })
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    build_offline_sources(
+        raw_input_file,
+        Feature1Extractor,
+        [
+            OfflineSource(feature_output_file, feature_columns),
+            OfflineSource(label_output_file, label_columns, input_columns=['label'], uses_features=False),
+        ],
+        num_workers=int(args[0]) if len(args) > 0 else None,
+        chunk_size=int(args[1]) if len(args) > 1 else DEFAULT_CHUNK_SIZE,
+        incremental='--incremental' in sys.argv[1:],
+        log_prefix='[create_offline_sources_1]',
+    )
 
     print('Done (%s ==> %s, %s)' % (
         raw_input_file,
@@ -1,31 +1,79 @@
+"""
+Build the "v2" offline feature sources from the raw dataset: the one used
+by Feast (a variable-length list of int64 per row) and the same features in
+the compact fixed-width layout, for training (see
+analysis/offline_sources/compact_features.py).
+
+Usage: python scripts/create_offline_sources_2.py [num_workers] [chunk_size] [--incremental]
+(num_workers defaults to one per CPU, 0 extracts in this process).
+With --incremental, only new or changed rows are computed, and the compact
+output is a directory of partitions (see analysis/offline_sources/offline_source_builder.py).
+The Feast one, being the batch source of a push source, stays a single file,
+and the rows pushed to it are kept by every rebuild.
+"""
+
 import os
+import sys
+import json
 import datetime
 import pandas as pd
+import pyarrow as pa
 
-from analysis.features2.feature2_extractor import Feature2Extractor
+from analysis.features2.feature2_extractor import Feature2Extractor, input_metadata_file
+from analysis.offline_sources.compact_features import fixed_width_value_type, to_fixed_size_list_array
+from analysis.offline_sources.offline_source_builder import OfflineSource, build_offline_sources, DEFAULT_CHUNK_SIZE
 
 base_dir = os.path.abspath(os.path.dirname(__file__))
 offline_data_dir = os.path.join(base_dir, '..', 'offline_data')
 
 raw_input_file = os.path.join(base_dir, '..', 'raw_data', 'raw_dataset.csv')
 feature_output_file = os.path.join(offline_data_dir, 'sms_features2.parquet')
+compact_feature_output_file = os.path.join(offline_data_dir, 'sms_features2_compact.parquet')
+
+event_timestamp = datetime.datetime(2020, 4, 5)
+
+# token indices are below MAX_NUM_WORDS
+feature_value_type = fixed_width_value_type(json.load(open(input_metadata_file))['MAX_NUM_WORDS'] - 1)
 
-if __name__ == '__main__':
-    #
-    raw_df = pd.read_csv(raw_input_file)
-    raw_df['event_timestamp'] = datetime.datetime(2020, 4, 5)
 
-    #
-    f2_extractor = Feature2Extractor()
-    #
-    raw_df['features'] = raw_df['text'].map(f2_extractor.get_features_list)
+def feature_columns(chunk_df, feature_matrix):
+    return pd.DataFrame({
+        'event_timestamp': event_timestamp,
+        'sms_id': chunk_df['sms_id'],
+        # one list of token indices per row (Array(Int64) in the feature view)
+        'features': list(feature_matrix.astype('int64')),
+    })
 
-    # select
-    fea_df = raw_df[['event_timestamp', 'sms_id', 'features']]
 
-    fea_df.to_parquet(feature_output_file)
+def compact_feature_columns(chunk_df, feature_matrix):
+    table = pa.Table.from_pandas(
+        pd.DataFrame({
+            'event_timestamp': event_timestamp,
+            'sms_id': chunk_df['sms_id'],
+        }),
+        preserve_index=False,
+    )
+    return table.append_column('features', to_fixed_size_list_array(feature_matrix, feature_value_type))
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    build_offline_sources(
+        raw_input_file,
+        Feature2Extractor,
+        [
+            # (the batch source of the 'smss2_push' push source in the 2021 stage)
+            OfflineSource(feature_output_file, feature_columns, push_batch_source=True),
+            OfflineSource(compact_feature_output_file, compact_feature_columns),
+        ],
+        num_workers=int(args[0]) if len(args) > 0 else None,
+        chunk_size=int(args[1]) if len(args) > 1 else DEFAULT_CHUNK_SIZE,
+        incremental='--incremental' in sys.argv[1:],
+        log_prefix='[create_offline_sources_2]',
+    )
 
-    print('Done (%s ==> %s)' % (
+    print('Done (%s ==> %s, %s)' % (
         raw_input_file,
         feature_output_file,
+        compact_feature_output_file,
     ))
@@ -6,6 +6,8 @@ import pandas as pd
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 from tensorflow.keras.preprocessing.text import Tokenizer
 
+from analysis.features2.sequence_tokenizer import SequenceTokenizer
+
 # tokenizer settings. These will NOT be changed unless
 # moving to a new model version.
 MAX_NUM_WORDS = 180
@@ -18,6 +20,7 @@ raw_input_file = os.path.join(base_dir, '..', 'raw_data', 'raw_dataset.csv')
 output_dir = os.path.join(base_dir, '..', 'models', 'model2_2020', 'tokenizer')
 output_metadata_file = os.path.join(output_dir, 'settings.json')
 output_tokenizer_file = os.path.join(output_dir, 'tokenizer.json')
+output_vocabulary_file = os.path.join(output_dir, 'vocabulary.json')
 
 if __name__ == '__main__':
     # read input training texts
@@ -51,8 +54,14 @@ if __name__ == '__main__':
         json.dump(t_metadata, m_of, indent=2)
     with open(output_tokenizer_file, 'w') as t_of:
         t_of.write(tokenizer.to_json(indent=2))
+    # compact, Tensorflow-free version of the tokenizer, used by Feature2Extractor
+    SequenceTokenizer.from_keras_json(
+        tokenizer.to_json(),
+        max_seq_length=MAX_SEQ_LENGTH,
+    ).save_vocabulary(output_vocabulary_file)
 
     print('Tokenizer persisted to:')
     print('    - ' + output_metadata_file)
     print('    - ' + output_tokenizer_file)
+    print('    - ' + output_vocabulary_file)
     
\ No newline at end of file
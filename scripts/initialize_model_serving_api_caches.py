@@ -10,6 +10,17 @@ CREATE TABLE IF NOT EXISTS model_serving_api_cache (
 );
 '''
 
+CREATE_API_CACHE_BY_DIGEST_TABLE_CQL = '''
+CREATE TABLE IF NOT EXISTS model_serving_api_cache_by_digest (
+    endpoint      TEXT,
+    version       TEXT,
+    input_digest  BLOB,
+    input_blob    BLOB,
+    output_blob   BLOB,
+    PRIMARY KEY (( endpoint, version, input_digest ))
+);
+'''
+
 CREATE_API_CALL_LOG_CQL = '''
 CREATE TABLE IF NOT EXISTS spam_calls_log (
     caller_id   TEXT,
@@ -28,5 +39,6 @@ if __name__ == '__main__':
     # create table (Note: handling schema changes programmatically
     # is usually a bad idea in production ...)
     session.execute(CREATE_API_CACHE_TABLE_CQL)
+    session.execute(CREATE_API_CACHE_BY_DIGEST_TABLE_CQL)
     session.execute(CREATE_API_CALL_LOG_CQL)
     print('Tables created (if needed).')
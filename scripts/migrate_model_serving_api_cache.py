@@ -0,0 +1,52 @@
+"""
+Copy the entries of the legacy (JSON-keyed) prediction cache table
+into the new digest-keyed, binary-valued table.
+The source table is left untouched: once the API runs with
+`SPAM_CACHE_LAYOUT=digest`, it can be dropped at leisure.
+
+Usage: python scripts/migrate_model_serving_api_cache.py [concurrency]
+"""
+
+import sys
+import json
+
+from api.user_data.storage.db_connect import get_session
+from api.model_serving.storage.cache_codec import JsonCacheLayout, DigestCacheLayout
+
+READ_PAGE_SIZE = 500
+DEFAULT_CONCURRENCY = 64
+
+if __name__ == '__main__':
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CONCURRENCY
+    #
+    session = get_session()
+    source_layout = JsonCacheLayout()
+    target_layout = DigestCacheLayout(collision_check=True)
+    #
+    select_all = session.prepare(f'SELECT endpoint, version, input_json, output_json FROM {source_layout.table};')
+    select_all.fetch_size = READ_PAGE_SIZE
+    insert_one = session.prepare(target_layout.insert_cql)
+    #
+    print(f'** Migrating {source_layout.table} ==> {target_layout.table}')
+    num_rows = 0
+    source_bytes = 0
+    target_bytes = 0
+    pending = []
+    for row in session.execute(select_all):
+        input_key = target_layout.input_key(json.loads(row.input_json))
+        params = target_layout.insert_params(row.endpoint, row.version, input_key, json.loads(row.output_json))
+        pending.append(session.execute_async(insert_one, params))
+        #
+        num_rows += 1
+        source_bytes += len(row.input_json.encode('utf-8')) + len(row.output_json.encode('utf-8'))
+        target_bytes += len(params[2]) + len(params[3]) + len(params[4])
+        if len(pending) >= concurrency:
+            for future in pending:
+                future.result()
+            pending = []
+            print(f'    {num_rows} rows ...')
+    for future in pending:
+        future.result()
+    #
+    print(f'** Migrated {num_rows} rows.')
+    print(f'   Key+value payload: {source_bytes} bytes (json) ==> {target_bytes} bytes (digest)')
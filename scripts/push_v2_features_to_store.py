@@ -8,6 +8,7 @@ from feast import FeatureStore
 from feast.data_source import PushMode
 
 from api.user_data.storage.db_connect import get_session
+from analysis.feature_extractor.feature_extractor import MemoizedFeatureExtractor
 from analysis.features2.feature2_extractor import Feature2Extractor
 
 base_dir = os.path.abspath(os.path.dirname(__file__))
@@ -21,7 +22,8 @@ if __name__ == '__main__':
     store = FeatureStore(repo_path=store_dir)
     db_session = get_session()
     user_ids = sys.argv[1:]
-    feature2_extractor = Feature2Extractor()
+    # the same message is often found in many inboxes
+    feature2_extractor = MemoizedFeatureExtractor(Feature2Extractor())
     #
     print('** Backfilling v2-features (for model v3) to feature store')
     print(f'** Target user_id = {" ".join(user_ids)}')
@@ -58,4 +60,6 @@ if __name__ == '__main__':
         print('done.')
         #
         print(f'      sms_ids: {" ".join(sorted(str(row.sms_id) for row in rows))}')
+    memo_stats = feature2_extractor.get_stats()
+    print(f'** Feature memo: {memo_stats["hits"]} hits, {memo_stats["misses"]} misses (hit rate {memo_stats["hit_rate"]:.1%})')
     print('Backfill completed.')
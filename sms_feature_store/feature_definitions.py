@@ -58,6 +58,26 @@ if FEAST_STORE_STAGE in {'2020', '2021'}:
         path=os.path.join(data_dir, 'sms_features2.parquet'),
         timestamp_field='event_timestamp',
     )
+    # same features in a compact fixed-width layout (see
+    # analysis/offline_sources/compact_features.py): offline use only, as
+    # Feast can only write int32/int64 lists to the online store.
+    # The file stores a fixed-size list of uint8, which Feast has no type for:
+    # the closest is declared below, and scripts/check_compact_feature_view.py
+    # checks that historical retrieval does read it back as such
+    smss2_compact = FileSource(
+        path=os.path.join(data_dir, 'sms_features2_compact.parquet'),
+        timestamp_field='event_timestamp',
+    )
+    features2_compact_view = FeatureView(
+        name='sms_features2_compact',
+        entities=[sms],
+        schema=[
+            Field(name='features', dtype=Array(Int64)),
+        ],
+        online=False,
+        source=smss2_compact,
+        tags={},
+    )
 
 if FEAST_STORE_STAGE == '2020':
     # direct file-source to feature view